@@ -0,0 +1,62 @@
+"""
+Synthetic, seeded corpora for the benchmarks: plain texts with sentence and paragraph structure, and
+the same data written in the CISI file format.
+"""
+import os
+import random
+
+
+WORDS: list[str] = (
+    "information retrieval library catalog index query document abstract classification system "
+    "research science data analysis user search relevance evaluation method study report journal "
+    "citation author subject term vocabulary thesaurus automatic indexing cluster measure precision "
+    "recall ranking model probability vector space weighting frequency collection archive public"
+).split()
+
+
+def synthetic_text(rng: random.Random, words: int = 200) -> str:
+    """One document: sentences of 8-20 words, grouped into paragraphs of 3-6 sentences"""
+    paragraphs, sentences, count = [], [], 0
+    while count < words:
+        length = min(rng.randint(8, 20), words - count)
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        count += length
+        if len(sentences) >= rng.randint(3, 6):
+            paragraphs.append(" ".join(sentences))
+            sentences = []
+    if sentences:
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+def synthetic_texts(n: int, words: int = 200, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [synthetic_text(rng, words) for _ in range(n)]
+
+
+def write_cisi(out_dir: str, num_docs: int, num_queries: int = 100, relevant_per_query: int = 20, seed: int = 0) -> str:
+    """Write CISI.ALL, CISI.QRY and CISI.REL with synthetic content into out_dir. Returns out_dir"""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "CISI.ALL"), "w", encoding="utf-8") as file:
+        for i in range(1, num_docs + 1):
+            text = synthetic_text(rng, 150).replace("\n\n", " ")
+            # wrap the abstract at ~70 characters like the original file
+            lines, line = [], ""
+            for word in text.split():
+                if len(line) + len(word) > 70:
+                    lines.append(line)
+                    line = ""
+                line = f"{line} {word}" if line else word
+            lines.append(line)
+            references = "\n".join(f"{rng.randint(1, num_docs)}\t5\t{i}" for _ in range(3))
+            file.write(f".I {i}\n.T\n{synthetic_text(rng, 8)}\n.A\nAuthor, {i}.\n.W\n" + "\n".join(lines) + f"\n.X\n{references}\n")
+    with open(os.path.join(out_dir, "CISI.QRY"), "w", encoding="utf-8") as file:
+        for i in range(1, num_queries + 1):
+            file.write(f".I {i}\n.W\n{synthetic_text(rng, 25)}\n")
+    with open(os.path.join(out_dir, "CISI.REL"), "w", encoding="utf-8") as file:
+        for i in range(1, num_queries + 1):
+            for doc_id in sorted(rng.sample(range(1, num_docs + 1), min(relevant_per_query, num_docs))):
+                file.write(f"{i:6d}{doc_id:6d}\t0\t0.000000\n")
+    return out_dir
@@ -0,0 +1,389 @@
+"""
+Deterministic local stand-ins for the external services, so the pipeline can be exercised and
+measured without API keys.
+
+    FakeEmbeddingServer: OpenAI-compatible /v1/embeddings endpoint with configurable latency,
+                         injected 429s and rate limit headers
+    FakePinecone:        in-memory Pinecone-compatible client (indexes, upsert, query, delete,
+                         stats) with configurable per-request latency, backed by LocalNamespace
+"""
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.local_db import LocalNamespace
+from typing import Any, Optional
+
+
+def fake_embedding(text: str, dim: int) -> np.ndarray:
+    """Deterministic unit vector for a text: the same text always maps to the same direction"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_token_count(text: str) -> int:
+    """Cheap deterministic token estimate (roughly 4 characters per token)"""
+    return max(1, (len(text) + 3) // 4)
+
+
+class FakeEmbeddingServer():
+    """
+    Local OpenAI-compatible embeddings endpoint. Point a client at it with
+    OpenAI(base_url=server.url, api_key="fake") or AsyncOpenAI(base_url=server.url, api_key="fake").
+    """
+    def __init__(
+            self,
+            latency: float = 0.0,
+            latency_per_token: float = 0.0,
+            rate_limit_probability: float = 0.0,
+            requests_per_minute: Optional[int] = None,
+            tokens_per_minute: Optional[int] = None,
+            retry_after: float = 0.1,
+            max_dim: int = 3072,
+            seed: int = 0,
+            host: str = "127.0.0.1",
+            port: int = 0,
+        ) -> None:
+        """
+        Create a new FakeEmbeddingServer (call start() or use it as a context manager)
+
+        Args:
+            latency: Fixed latency added to every request in seconds
+            latency_per_token: Additional latency per input token in seconds
+            rate_limit_probability: Probability of answering a request with a 429
+            requests_per_minute: Enforced request quota per one minute window (None for unlimited)
+            tokens_per_minute: Enforced token quota per one minute window (None for unlimited)
+            retry_after: Value of the retry-after header sent with 429s in seconds
+            max_dim: Largest dimension accepted (full width if the request does not ask for one)
+            seed: Seed for the 429 injection
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+        """
+        self.latency: float = latency
+        self.latency_per_token: float = latency_per_token
+        self.rate_limit_probability: float = rate_limit_probability
+        self.requests_per_minute: Optional[int] = requests_per_minute
+        self.tokens_per_minute: Optional[int] = tokens_per_minute
+        self.retry_after: float = retry_after
+        self.max_dim: int = max_dim
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        # accounting
+        self.requests: int = 0
+        self.rate_limited: int = 0
+        self.tokens: int = 0
+        self.window_start: float = time.monotonic()
+        self.window_requests: int = 0
+        self.window_tokens: int = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+
+    def __str__(self) -> str:
+        return f"FakeEmbeddingServer(url={self.url}, requests={self.requests}, tokens={self.tokens}, rate_limited={self.rate_limited})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __enter__(self) -> "FakeEmbeddingServer":
+        return self.start()
+
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+    def start(self) -> "FakeEmbeddingServer":
+        """Serve requests on a background thread"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self.thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        """Stop serving and release the port"""
+        if self.thread is not None:
+            self.httpd.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.httpd.server_close()
+
+
+    def _admit(self, tokens: int) -> tuple[bool, dict[str, str]]:
+        """Decide whether a request is served or rejected with a 429 and build the rate limit headers"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.window_requests, self.window_tokens = now, 0, 0
+            reset = f"{max(0.0, 60 - (now - self.window_start)):.3f}s"
+
+            limited = self.random.random() < self.rate_limit_probability
+            if self.requests_per_minute is not None and self.window_requests + 1 > self.requests_per_minute:
+                limited = True
+            if self.tokens_per_minute is not None and self.window_tokens + tokens > self.tokens_per_minute:
+                limited = True
+            if not limited:
+                self.window_requests += 1
+                self.window_tokens += tokens
+                self.requests += 1
+                self.tokens += tokens
+            else:
+                self.rate_limited += 1
+
+            headers = {}
+            if self.requests_per_minute is not None:
+                headers["x-ratelimit-limit-requests"] = str(self.requests_per_minute)
+                headers["x-ratelimit-remaining-requests"] = str(max(0, self.requests_per_minute - self.window_requests))
+                headers["x-ratelimit-reset-requests"] = reset
+            if self.tokens_per_minute is not None:
+                headers["x-ratelimit-limit-tokens"] = str(self.tokens_per_minute)
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tokens_per_minute - self.window_tokens))
+                headers["x-ratelimit-reset-tokens"] = reset
+            return not limited, headers
+
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def _send(self, status: int, body: dict, headers: dict[str, str]) -> None:
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self) -> None:
+                if not self.path.rstrip("/").endswith("/embeddings"):
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}}, {})
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                texts = request["input"]
+                texts = [texts] if isinstance(texts, str) else texts
+                dim = int(request.get("dimensions") or server.max_dim)
+                tokens = sum(fake_token_count(text) for text in texts)
+
+                admitted, headers = server._admit(tokens)
+                if not admitted:
+                    headers["retry-after"] = str(server.retry_after)
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, headers)
+                    return
+
+                time.sleep(server.latency + server.latency_per_token * tokens)
+                data = []
+                for i, text in enumerate(texts):
+                    vector = fake_embedding(text, dim)
+                    if request.get("encoding_format") == "base64":
+                        embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+                    else:
+                        embedding = vector.tolist()
+                    data.append({"object": "embedding", "index": i, "embedding": embedding})
+                self._send(200, {
+                    "object": "list",
+                    "data": data,
+                    "model": request.get("model"),
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+                }, headers)
+
+        return Handler
+
+
+class FakeIndexDescription():
+    """What FakePinecone.describe_index returns: the fields PineconeDB reads"""
+    def __init__(self, name: str, dimension: int, metric: str) -> None:
+        self.name: str = name
+        self.dimension: int = dimension
+        self.metric: str = metric
+        self.status: dict[str, Any] = {"ready": True, "state": "Ready"}
+
+
+class FakeIndexList():
+    """What FakePinecone.list_indexes returns"""
+    def __init__(self, names: list[str]) -> None:
+        self._names: list[str] = names
+
+
+    def names(self) -> list[str]:
+        return self._names
+
+
+class FakeIndex():
+    """In-memory stand-in for pinecone.Index: one exact LocalNamespace per namespace"""
+    def __init__(self, client: "FakePinecone", name: str, dimension: int, metric: str) -> None:
+        self.client: "FakePinecone" = client
+        self.name: str = name
+        self.dimension: int = dimension
+        self.metric: str = metric
+        self.namespaces: dict[str, LocalNamespace] = {}
+        self.lock = threading.Lock()
+
+
+    def __str__(self) -> str:
+        return f"FakeIndex(name={self.name}, dimension={self.dimension}, metric={self.metric}, namespaces={len(self.namespaces)})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def upsert(self, vectors: list, namespace: str = "") -> dict[str, int]:
+        """Accepts record dicts or (id, values[, metadata]) tuples"""
+        self.client._request()
+        ids, values, metadata = [], [], []
+        for vector in vectors:
+            if isinstance(vector, dict):
+                ids.append(vector["id"])
+                values.append(vector["values"])
+                metadata.append(vector.get("metadata") or {})
+            else:
+                ids.append(vector[0])
+                values.append(vector[1])
+                metadata.append(vector[2] if len(vector) > 2 else {})
+        values = np.asarray(values, dtype=np.float32).reshape(len(ids), -1)
+        if values.shape[1] != self.dimension:
+            raise ValueError(f"Vector dimension {values.shape[1]} does not match the dimension of the index {self.dimension}")
+        with self.lock:
+            if namespace not in self.namespaces:
+                self.namespaces[namespace] = LocalNamespace(self.dimension, self.metric)
+            self.namespaces[namespace].upsert(ids, values, metadata)
+        return {"upserted_count": len(ids)}
+
+
+    def query(
+            self,
+            vector: list[float],
+            top_k: int = 10,
+            namespace: str = "",
+            include_values: bool = False,
+            include_metadata: bool = False,
+            **kwargs,
+        ) -> dict[str, list[dict[str, Any]]]:
+        self.client._request()
+        with self.lock:
+            ns = self.namespaces.get(namespace)
+            if ns is None or len(ns) == 0:
+                return {"matches": [], "namespace": namespace}
+            rows, scores = ns.search(np.asarray(vector, dtype=np.float32)[None, :], top_k)
+            matches = []
+            for row, score in zip(rows[0].tolist(), scores[0].tolist()):
+                if row < 0:
+                    continue
+                match = {"id": ns.ids[row], "score": score}
+                if include_values:
+                    match["values"] = ns.vectors[row].tolist()
+                if include_metadata:
+                    match["metadata"] = dict(ns.metadata[row])
+                matches.append(match)
+        return {"matches": matches, "namespace": namespace}
+
+
+    def delete(self, ids: Optional[list[str]] = None, delete_all: bool = False, namespace: str = "", **kwargs) -> dict:
+        self.client._request()
+        with self.lock:
+            if delete_all:
+                self.namespaces.pop(namespace, None)
+            elif namespace in self.namespaces:
+                self.namespaces[namespace].delete(ids or [])
+                if len(self.namespaces[namespace]) == 0:
+                    del self.namespaces[namespace]
+        return {}
+
+
+    def describe_index_stats(self, **kwargs) -> dict[str, Any]:
+        self.client._request()
+        with self.lock:
+            namespaces = {name: {"vector_count": len(ns)} for name, ns in self.namespaces.items()}
+        return {
+            "dimension": self.dimension,
+            "namespaces": namespaces,
+            "total_vector_count": sum(stats["vector_count"] for stats in namespaces.values())
+        }
+
+
+class FakePinecone():
+    """
+    In-memory Pinecone-compatible client for PineconeDB: PineconeDB(FakePinecone()). Every call
+    sleeps `latency` seconds to model the network round trip and is counted in `requests`.
+    """
+    def __init__(self, latency: float = 0.0) -> None:
+        """
+        Create a new FakePinecone
+
+        Args:
+            latency: Seconds added to every request
+        """
+        self.latency: float = latency
+        self.indexes: dict[str, FakeIndex] = {}
+        self.requests: int = 0
+        self.lock = threading.Lock()
+
+
+    def __str__(self) -> str:
+        return f"FakePinecone(indexes={list(self.indexes.keys())}, requests={self.requests})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def _request(self) -> None:
+        with self.lock:
+            self.requests += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+
+    def list_indexes(self) -> FakeIndexList:
+        self._request()
+        return FakeIndexList(list(self.indexes.keys()))
+
+
+    def create_index(self, name: str, dimension: int, metric: str = "cosine", spec: Any = None, **kwargs) -> None:
+        self._request()
+        if name in self.indexes:
+            raise ValueError(f"Index {name} already exists")
+        self.indexes[name] = FakeIndex(self, name, dimension, metric)
+
+
+    def describe_index(self, name: str) -> FakeIndexDescription:
+        self._request()
+        if name not in self.indexes:
+            raise ValueError(f"Index {name} does not exist")
+        index = self.indexes[name]
+        return FakeIndexDescription(name, index.dimension, index.metric)
+
+
+    def delete_index(self, name: str) -> None:
+        self._request()
+        if name not in self.indexes:
+            raise ValueError(f"Index {name} does not exist")
+        del self.indexes[name]
+
+
+    def Index(self, name: str) -> FakeIndex:
+        if name not in self.indexes:
+            raise ValueError(f"Index {name} does not exist")
+        return self.indexes[name]
@@ -0,0 +1,198 @@
+"""
+Offline benchmark suite: every pipeline stage measured on synthetic corpora of increasing size against
+the local stand-ins in bench/fakes.py (no API keys needed).
+
+    python -m bench.run                                  # run and write results/bench/<timestamp>.json
+    python -m bench.run --sizes 100,1000 --repeat 5
+    python -m bench.run --save-baseline                  # store this run as bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json --threshold 0.25
+
+A run fails (exit code 1) if any case is more than `threshold` slower than in the baseline. Cases that
+need the tiktoken encoding are skipped when it cannot be loaded.
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import numpy as np
+from openai import OpenAI
+from src.cache import EmbeddingCache
+from src.chunker import Chunker
+from src.db import PineconeDB
+from src.document import DocumentBatch
+from src.embedder import Embedder
+from src.evaluation import Qrels, evaluate
+from src.io import save_json, load_json
+from src.tokens import DEFAULT_ENCODING, get_encoding
+from preprocessors.cisi import CISIPreprocessor
+from .corpus import synthetic_texts, write_cisi
+from .fakes import FakeEmbeddingServer, FakePinecone
+from typing import Callable, Optional
+
+
+MIN_COMPARE_SECONDS: float = 0.005   # faster cases are too noisy to compare against the baseline
+
+
+def measure(fn: Callable[[], int], repeat: int = 3) -> dict[str, float]:
+    """Best wall time of `repeat` runs of fn, which returns the number of items it processed"""
+    best, items = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = fn()
+        best = min(best, time.perf_counter() - start)
+    return {"seconds": best, "items": items, "items_per_second": items / best if best > 0 else 0.0}
+
+
+def has_encoding(encoding_name: str = DEFAULT_ENCODING) -> bool:
+    try:
+        get_encoding(encoding_name)
+        return True
+    except Exception:
+        return False
+
+
+def chunker_cases(size: int, texts: list[str], token_mode: bool) -> dict[str, Callable[[], int]]:
+    cases = {}
+    modes = [("char", "recursive"), ("char", "character")] + ([("token", "recursive")] if token_mode else [])
+    for length_function, strategy in modes:
+        chunker = Chunker(chunk_size=500 if length_function == "char" else 128, chunk_overlap=50 if length_function == "char" else 16,
+                          strategy=strategy, length_function=length_function)
+        cases[f"chunker.{length_function}.{strategy}@{size}"] = lambda chunker=chunker: sum(len(chunks) for chunks in chunker.split_many(texts))
+    return cases
+
+
+def embedder_cases(size: int, texts: list[str], client: OpenAI, cache_dir: str) -> dict[str, Callable[[], int]]:
+    embedder = Embedder(client, "text-embedding-3-small", 256)
+    cache = EmbeddingCache(os.path.join(cache_dir, f"embeddings-{size}.sqlite"))
+    cached = Embedder(client, "text-embedding-3-small", 256, cache=cache)
+    cached.embed_batch(texts)   # warm the cache, the case measures the hit path
+    return {
+        f"embedder.batch@{size}": lambda: len(embedder.embed_batch(texts)),
+        f"embedder.cached@{size}": lambda: len(cached.embed_batch(texts)),
+    }
+
+
+def db_cases(size: int, texts: list[str], client: OpenAI, db_latency: float) -> dict[str, Callable[[], int]]:
+    embedder = Embedder(client, "text-embedding-3-small", 256)
+    embeddings = embedder.embed_batch(texts)
+    batch = DocumentBatch.from_columns([str(i) for i in range(len(texts))], (f"doc-{i // 4}" for i in range(len(texts))), texts, embeddings)
+    queries = texts[:min(100, len(texts))]
+    db = PineconeDB(FakePinecone(latency=db_latency))
+    db.get_index("bench", embedder)
+    db.upsert_bulk("bench", "ns", embedder, batch)
+    return {
+        f"db.upsert@{size}": lambda: db.upsert_bulk("bench", "ns", embedder, batch)["vectors"],
+        f"db.query@{size}": lambda: sum(len(result) for result in db.query_batch("bench", "ns", queries, embedder, top_k=10)),
+    }
+
+
+def cisi_cases(size: int, work_dir: str) -> dict[str, Callable[[], int]]:
+    raw_dir = write_cisi(os.path.join(work_dir, f"cisi-{size}", "raw"), size, num_queries=min(100, size))
+    preprocessor = CISIPreprocessor({"raw_dir": raw_dir, "processed_dir": os.path.join(work_dir, f"cisi-{size}", "processed")})
+    return {f"cisi.parse@{size}": lambda: preprocessor.process()["documents"]}
+
+
+def eval_cases(size: int, k: int = 100) -> dict[str, Callable[[], int]]:
+    rng = random.Random(size)
+    doc_ids = [str(i) for i in range(size)]
+    query_ids = [str(i) for i in range(size)]
+    qrels = Qrels((query_id, doc_id) for query_id in query_ids for doc_id in rng.sample(doc_ids, min(20, size)))
+    # several chunks of a document can be retrieved, so ids repeat like real chunk-level results
+    retrieved = [[rng.choice(doc_ids) for _ in range(k)] for _ in query_ids]
+    return {f"eval.metrics@{size}": lambda: evaluate(qrels, query_ids, retrieved, ks=(1, 5, 10, 100))["queries"]}
+
+
+def run(sizes: list[int], repeat: int, embed_latency: float, db_latency: float, only: Optional[str] = None) -> dict[str, dict[str, float]]:
+    """Run every case for every corpus size. Returns {case: measurement}"""
+    token_mode = has_encoding()
+    if not token_mode:
+        print(f"Encoding {DEFAULT_ENCODING} unavailable: skipping token-mode chunker, embedder and db cases")
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        with FakeEmbeddingServer(latency=embed_latency) as server:
+            client = OpenAI(base_url=server.url, api_key="fake", max_retries=0)
+            for size in sizes:
+                texts = synthetic_texts(size, seed=size)
+                cases = {}
+                cases.update(chunker_cases(size, texts, token_mode))
+                if token_mode:
+                    cases.update(embedder_cases(size, texts, client, work_dir))
+                    cases.update(db_cases(size, texts, client, db_latency))
+                cases.update(cisi_cases(size, work_dir))
+                cases.update(eval_cases(size))
+                for name, fn in cases.items():
+                    if only is not None and only not in name:
+                        continue
+                    results[name] = measure(fn, repeat)
+                    print(f"{name:<32} {results[name]['seconds']:>10.4f}s {results[name]['items_per_second']:>14.1f} items/s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], threshold: float) -> list[str]:
+    """Names of the cases more than `threshold` (relative) slower than the baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or baseline[name]["seconds"] < MIN_COMPARE_SECONDS:
+            continue
+        change = result["seconds"] / baseline[name]["seconds"] - 1
+        if change > threshold:
+            regressions.append(f"{name}: {baseline[name]['seconds']:.4f}s -> {result['seconds']:.4f}s (+{change:.0%})")
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma separated corpus sizes (documents)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the best is kept")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds of latency per embeddings request")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="seconds of latency per index request")
+    parser.add_argument("--only", default=None, help="only run cases whose name contains this string")
+    parser.add_argument("--out-dir", default="results/bench")
+    parser.add_argument("--baseline", default="bench/baseline.json")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown against the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args(argv)
+
+    results = run([int(size) for size in args.sizes.split(",")], args.repeat, args.embed_latency, args.db_latency, args.only)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    save_json(report, time.strftime("%Y%m%d-%H%M%S"), args.out_dir)
+
+    baseline_dir, baseline_file = os.path.split(args.baseline)
+    baseline_name = os.path.splitext(baseline_file)[0]
+    if args.save_baseline:
+        save_json(report, baseline_name, baseline_dir or ".")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, nothing to compare")
+        return 0
+
+    regressions = compare(results, load_json(baseline_name, baseline_dir or ".")["results"], args.threshold)
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
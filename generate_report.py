@@ -0,0 +1,17 @@
+import sys
+from src.evaluation import generate_report
+
+# merge results/intermediate/*.json into results/report.json and print one row per configuration
+if __name__ == "__main__":
+    in_dir = sys.argv[1] if len(sys.argv) > 1 else "results/intermediate"
+    report = generate_report(in_dir)
+    if not report:
+        print(f"No results found in {in_dir}")
+        exit(1)
+
+    columns = [key for key in next(iter(report.values()))["metrics"] if key != "queries"]
+    width = max(len(name) for name in report)
+    print(f"{'config':<{width}}  " + "  ".join(f"{column:>12}" for column in columns))
+    for name, result in sorted(report.items()):
+        metrics = result["metrics"]
+        print(f"{name:<{width}}  " + "  ".join(f"{metrics.get(column, float('nan')):>12.4f}" for column in columns))
@@ -1,6 +1,259 @@
-class DataPreprocessor():
+import os
+import json
+import heapq
+import shutil
+import numpy as np
+from abc import ABC, abstractmethod
+from functools import cached_property
+from itertools import islice, repeat
+from numpy.lib.format import open_memmap
+from src.document import DocumentBatch
+from src.io import iter_jsonl, save_json, load_json
+from typing import Iterator, Optional
+
+
+class DataPreprocessor(ABC):
+    """
+    Base class for dataset preprocessors. Subclasses implement process(), which converts the raw files
+    in data/<dataset_name>/raw into json lines files in data/<dataset_name>/processed:
+
+        documents.jsonl   {"id": id, "values": None, "metadata": {"source": source, "text": text, ...}}
+        queries.jsonl     {"id": id, "query": query, ...}
+        qrels.jsonl       {"query_id": query_id, "doc_id": doc_id}
+
+    Large datasets may split each file into shards <name>-00000.jsonl, <name>-00001.jsonl, ...
+
+    Nothing is read on construction: documents, queries and relevance are loaded (and the raw files
+    processed if needed) on first access and cached, iter_* stream the records without keeping them,
+    and get_document looks single documents up through an offset table in processed/index/.
+    """
     def __init__(self, config):
+        """
+        Create a new DataPreprocessor
+
+        Args:
+            config: Dict with the dataset_name and optionally data_dir (default "data"), raw_dir and processed_dir
+        """
         self.config = config
-        self.documents = self.read_documents()
-        self.queries = self.read_queries()
-        self.relevance = self.read_relevance()
\ No newline at end of file
+        self.dataset_name: str = config["dataset_name"]
+        data_dir = config.get("data_dir", "data")
+        self.raw_dir: str = config.get("raw_dir", os.path.join(data_dir, self.dataset_name, "raw"))
+        self.processed_dir: str = config.get("processed_dir", os.path.join(data_dir, self.dataset_name, "processed"))
+
+
+    def __str__(self) -> str:
+        return f"{type(self).__name__}(dataset_name={self.dataset_name}, processed_dir={self.processed_dir})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    @abstractmethod
+    def process(self) -> dict[str, int]:
+        """Convert the raw files into the processed files. Returns the number of records written per file"""
+
+
+    def shards(self, name: str) -> list[str]:
+        """Processed files of one kind, without extension: <name> or its shards <name>-00000, ..."""
+        if not os.path.isdir(self.processed_dir):
+            return []
+        files = sorted(
+            file for file in os.listdir(self.processed_dir)
+            if file == f"{name}.jsonl" or (file.startswith(f"{name}-") and file.endswith(".jsonl"))
+        )
+        return [file[:-len(".jsonl")] for file in files]
+
+
+    def is_processed(self) -> bool:
+        return all(self.shards(name) for name in ("documents", "queries", "qrels"))
+
+
+    def _records(self, name: str) -> Iterator[dict]:
+        if not self.is_processed():
+            self.process()
+        for shard in self.shards(name):
+            yield from iter_jsonl(shard, self.processed_dir)
+
+
+    def iter_documents(self) -> Iterator[dict]:
+        """Stream the document records without loading them all"""
+        return self._records("documents")
+
+
+    def iter_queries(self) -> Iterator[dict]:
+        """Stream the query records without loading them all"""
+        return self._records("queries")
+
+
+    def iter_relevance(self) -> Iterator[tuple[str, str]]:
+        """Stream the (query_id, doc_id) relevance pairs"""
+        for record in self._records("qrels"):
+            yield record["query_id"], record["doc_id"]
+
+
+    def read_documents(self) -> list[dict]:
+        return list(self.iter_documents())
+
+
+    def read_queries(self) -> list[dict]:
+        return list(self.iter_queries())
+
+
+    def read_relevance(self) -> dict[str, list[str]]:
+        """Map each query id to its relevant document ids"""
+        relevance: dict[str, list[str]] = {}
+        for query_id, doc_id in self.iter_relevance():
+            relevance.setdefault(query_id, []).append(doc_id)
+        return relevance
+
+
+    @cached_property
+    def documents(self) -> list[dict]:
+        """Every document record, loaded on first access"""
+        return self.read_documents()
+
+
+    @cached_property
+    def queries(self) -> list[dict]:
+        """Every query record, loaded on first access"""
+        return self.read_queries()
+
+
+    @cached_property
+    def relevance(self) -> dict[str, list[str]]:
+        """Relevant document ids per query id, loaded on first access"""
+        return self.read_relevance()
+
+
+    def _shard_sizes(self, name: str) -> dict[str, int]:
+        return {shard: os.path.getsize(os.path.join(self.processed_dir, f"{shard}.jsonl")) for shard in self.shards(name)}
+
+
+    def build_index(self, name: str = "documents", block_size: int = 65536) -> None:
+        """
+        Write the offset table of a record kind to processed/index/: ids sorted for binary search, and the
+        shard number and byte offset of each id's line. Each shard is sorted on its own and the sorted shards
+        are merged block by block into memory mapped output arrays, so only one shard's ids are held in memory
+        at a time. Ids are stored as fixed width unicode as wide as the longest one, so the table of a corpus
+        with a few long ids among many short ones is mostly padding.
+
+        Args:
+            name: Record kind, e.g. documents
+            block_size: Number of entries read from each sorted shard and written to the output at a time
+        """
+        if not self.is_processed():
+            self.process()
+        shards = self.shards(name)
+        index_dir = os.path.join(self.processed_dir, "index")
+        tmp_dir = os.path.join(index_dir, f"{name}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        # sort each shard on its own
+        total, width = 0, 1
+        for number, shard in enumerate(shards):
+            ids, offsets = [], []
+            with open(os.path.join(self.processed_dir, f"{shard}.jsonl"), "rb") as file:
+                offset = 0
+                for line in file:
+                    if line.strip():
+                        ids.append(json.loads(line)["id"])
+                        offsets.append(offset)
+                    offset += len(line)
+            ids = np.array(ids, dtype=str)
+            order = np.argsort(ids, kind="stable")
+            np.save(os.path.join(tmp_dir, f"{number}_ids.npy"), ids[order])
+            np.save(os.path.join(tmp_dir, f"{number}_offsets.npy"), np.asarray(offsets, dtype=np.int64)[order])
+            total += len(ids)
+            width = max(width, ids.dtype.itemsize // np.dtype("U1").itemsize)
+
+        def entries(number: int) -> Iterator[tuple[str, int, int]]:
+            ids = np.load(os.path.join(tmp_dir, f"{number}_ids.npy"), mmap_mode="r")
+            offsets = np.load(os.path.join(tmp_dir, f"{number}_offsets.npy"), mmap_mode="r")
+            for start in range(0, len(ids), block_size):
+                yield from zip(ids[start:start + block_size].tolist(), repeat(number), offsets[start:start + block_size].tolist())
+
+        # merge the sorted shards (ties keep shard and line order, as a stable sort of all ids would)
+        out_ids = open_memmap(os.path.join(index_dir, f"{name}_ids.npy"), mode="w+", dtype=f"<U{width}", shape=(total,))
+        out_shards = open_memmap(os.path.join(index_dir, f"{name}_shards.npy"), mode="w+", dtype=np.int32, shape=(total,))
+        out_offsets = open_memmap(os.path.join(index_dir, f"{name}_offsets.npy"), mode="w+", dtype=np.int64, shape=(total,))
+        position = 0
+        merged = heapq.merge(*(entries(number) for number in range(len(shards))))
+        while True:
+            block = list(islice(merged, block_size))
+            if not block:
+                break
+            ids, numbers, offsets = zip(*block)
+            out_ids[position:position + len(block)] = ids
+            out_shards[position:position + len(block)] = numbers
+            out_offsets[position:position + len(block)] = offsets
+            position += len(block)
+        for array in (out_ids, out_shards, out_offsets):
+            array.flush()
+        del out_ids, out_shards, out_offsets
+        shutil.rmtree(tmp_dir)
+        # written last: the table is only used while the shards it was built from are unchanged
+        save_json({"shards": self._shard_sizes(name)}, name, index_dir)
+
+
+    def _load_index(self, name: str) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+        index_dir = os.path.join(self.processed_dir, "index")
+        if not self.is_processed() or not os.path.exists(os.path.join(index_dir, f"{name}.json")) \
+                or load_json(name, index_dir)["shards"] != self._shard_sizes(name):
+            self.build_index(name)
+        return (
+            self.shards(name),
+            np.load(os.path.join(index_dir, f"{name}_ids.npy"), mmap_mode="r"),
+            np.load(os.path.join(index_dir, f"{name}_shards.npy"), mmap_mode="r"),
+            np.load(os.path.join(index_dir, f"{name}_offsets.npy"), mmap_mode="r"),
+        )
+
+
+    @cached_property
+    def document_index(self) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Memory mapped offset table of the documents (built on first use)"""
+        return self._load_index("documents")
+
+
+    def get_documents(self, ids: list[str]) -> list[Optional[dict]]:
+        """Look documents up by id through the offset table. Missing ids give None"""
+        shards, sorted_ids, shard_numbers, offsets = self.document_index
+        if len(sorted_ids) == 0:
+            return [None] * len(ids)
+        positions = np.minimum(np.searchsorted(sorted_ids, np.array(ids, dtype=str)), len(sorted_ids) - 1)
+
+        # read in (shard, offset) order so every shard is opened once and read front to back
+        found = [(int(shard_numbers[p]), int(offsets[p]), i) for i, p in enumerate(positions.tolist()) if sorted_ids[p] == ids[i]]
+        documents: list[Optional[dict]] = [None] * len(ids)
+        file, current = None, None
+        try:
+            for shard, offset, i in sorted(found):
+                if shard != current:
+                    if file is not None:
+                        file.close()
+                    file = open(os.path.join(self.processed_dir, f"{shards[shard]}.jsonl"), "rb")
+                    current = shard
+                file.seek(offset)
+                documents[i] = json.loads(file.readline())
+        finally:
+            if file is not None:
+                file.close()
+        return documents
+
+
+    def get_document(self, id: str) -> Optional[dict]:
+        """Look one document up by id through the offset table (None if missing)"""
+        return self.get_documents([id])[0]
+
+
+    def batch(self, ids: list[str]) -> DocumentBatch:
+        """Hydrate document ids (e.g. from PineconeDB.query_ids) into a DocumentBatch through the offset table"""
+        documents = self.get_documents(ids)
+        for id, document in zip(ids, documents):
+            if document is None:
+                raise ValueError(f"Document {id} is not in {self.processed_dir}")
+        return DocumentBatch.from_columns(
+            ids,
+            (document["metadata"]["source"] for document in documents),
+            (document["metadata"]["text"] for document in documents)
+        )
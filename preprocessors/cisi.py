@@ -1,5 +1,5 @@
 """
-File to preprocess CISI data and store it as json files. The CISI dataset is a collection of documents,
+File to preprocess CISI data and store it as json lines files. The CISI dataset is a collection of documents,
 queries, and relationships between queries and documents. The documents are stored in the file CISI.ALL,
 the queries are stored in the file CISI.QRY, and the relationships are stored in the file CISI.REL.
 
@@ -8,184 +8,156 @@ Dataset: https://www.kaggle.com/datasets/dmaso01dsta/cisi-a-dataset-for-informat
 File information:
 
     CISI.ALL:
-    A file of 1,460 "documents" each with a unique ID (.I), title (.T), author (.A), abstract (.W) and list 
-    of cross-references to other documents (.X). It is the dataset for training IR models when used in 
+    A file of 1,460 "documents" each with a unique ID (.I), title (.T), author (.A), abstract (.W) and list
+    of cross-references to other documents (.X). It is the dataset for training IR models when used in
     conjunction with the Queries (CISI.QRY).
 
     CISI.QRY:
     A file containing 112 queries each with a unique ID (.I) and query text (.W).
 
     CISI.REL:
-    A file containing the mapping of query ID (column 0) to document ID (column 1). A query may map to 
-    more than one document ID. This file contains the "ground truth" that links queries to documents. Use 
+    A file containing the mapping of query ID (column 0) to document ID (column 1). A query may map to
+    more than one document ID. This file contains the "ground truth" that links queries to documents. Use
     this to train and test your algorithm.
 
-Code for functions read_documents(), read_queries(), and read_mappings() is modified from: https://www.kaggle.com/code/aleksandrmorozov123/nlp-with-python
+Every file is parsed in a single streaming pass (one record in memory at a time), so the same parser
+handles much larger collections in this format. Usage: python -m preprocessors.cisi [data_dir]
 """
-from ..src.io import save_json
-import multiprocessing
 import os
-
+import sys
+from src.io import save_jsonl
+from .base import DataPreprocessor
+from typing import Iterable, Iterator
 
 
 '''
-data/cisi/raw
+data/cisi/raw/CISI.ALL, CISI.QRY, CISI.REL
 data/cisi/processed
-data/cisi/processed/documents.json
-[
+data/cisi/processed/documents.jsonl (one record per line)
     {
         "id": id,
         "values": None,
         "metadata": {
-            "source": source,
-            "text": text
+            "source": "CISI.ALL",
+            "title": title,
+            "author": author,
+            "text": abstract,
+            "cross_references": [doc_id, ...]
         }
     }
+data/cisi/processed/queries.jsonl
     {
         "id": id,
-        "values": None,
-        "metadata": {
-            "source": source,
-            "text": text
-        }
+        "query": query,
+        "title": title,
+        "author": author
     }
-]
-data/cisi/processed/queries.json
-[
+data/cisi/processed/qrels.jsonl
     {
-        "query": query,
+        "query_id": query_id,
+        "doc_id": doc_id
     }
-
-]
 '''
 
 
+# field markers: id, title, author, abstract/query text, bibliographic note, cross-references
+FIELDS: set[str] = {".I", ".T", ".A", ".W", ".B", ".X"}
+
+
+def parse_records(lines: Iterable[str]) -> Iterator[dict[str, list[str]]]:
+    """
+    Group the lines of a CISI.ALL/CISI.QRY style file into records. Yields one dict per .I entry,
+    mapping each field marker to its lines (in order) and "id" to the entry's id.
+    """
+    record = None
+    field = None
+    for line in lines:
+        marker = line[:2]
+        if marker in FIELDS and line[2:3] in ("", " ", "\t", "\n", "\r"):
+            if marker == ".I":
+                if record is not None:
+                    yield record
+                record = {"id": line[2:].strip()}
+                field = None
+                continue
+            field = marker
+            if record is None:
+                raise ValueError(f"Field {marker} found before the first .I")
+            record.setdefault(field, [])
+            rest = line[2:].strip()
+            if rest:
+                record[field].append(rest)
+        elif record is not None and field is not None:
+            record[field].append(line.strip())
+    if record is not None:
+        yield record
+
+
+def join_lines(lines: list[str]) -> str:
+    """Rejoin the wrapped lines of a field into one string"""
+    return " ".join(line for line in lines if line)
+
+
+def read_documents(path: str) -> Iterator[dict]:
+    """Stream CISI.ALL as document records"""
+    source = os.path.basename(path)
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for record in parse_records(file):
+            yield {
+                "id": record["id"],
+                "values": None,
+                "metadata": {
+                    "source": source,
+                    "title": join_lines(record.get(".T", [])),
+                    "author": "; ".join(line for line in record.get(".A", []) if line),
+                    "text": join_lines(record.get(".W", [])),
+                    "cross_references": [line.split()[0] for line in record.get(".X", []) if line]
+                }
+            }
+
+
+def read_queries(path: str) -> Iterator[dict]:
+    """Stream CISI.QRY as query records"""
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for record in parse_records(file):
+            yield {
+                "id": record["id"],
+                "query": join_lines(record.get(".W", [])),
+                "title": join_lines(record.get(".T", [])),
+                "author": "; ".join(line for line in record.get(".A", []) if line)
+            }
+
+
+def read_mappings(path: str) -> Iterator[dict]:
+    """Stream CISI.REL ("query_id doc_id 0 0.0" per line) as qrels records"""
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            columns = line.split()
+            if len(columns) >= 2:
+                yield {"query_id": columns[0], "doc_id": columns[1]}
+
+
+class CISIPreprocessor(DataPreprocessor):
+    """Preprocessor for the CISI dataset"""
+    def __init__(self, config=None):
+        config = {"dataset_name": "cisi"} if config is None else {"dataset_name": "cisi", **config}
+        super().__init__(config)
+
+
+    def process(self) -> dict[str, int]:
+        """Convert CISI.ALL, CISI.QRY and CISI.REL into documents.jsonl, queries.jsonl and qrels.jsonl"""
+        for name in ("CISI.ALL", "CISI.QRY", "CISI.REL"):
+            if not os.path.exists(os.path.join(self.raw_dir, name)):
+                raise ValueError(f"Raw file {name} not found in {self.raw_dir}")
+        counts = {
+            "documents": save_jsonl(read_documents(os.path.join(self.raw_dir, "CISI.ALL")), "documents", self.processed_dir),
+            "queries": save_jsonl(read_queries(os.path.join(self.raw_dir, "CISI.QRY")), "queries", self.processed_dir),
+            "qrels": save_jsonl(read_mappings(os.path.join(self.raw_dir, "CISI.REL")), "qrels", self.processed_dir),
+        }
+        print(f"Processed CISI into {self.processed_dir}: {counts}")
+        return counts
 
 
-
-
-
-
-
-
-
-
-
-
-class Document():
-    """Class to represent a document in the CISI dataset"""
-    def __init__(self, id, title, author, abstract, cross_references):
-        self.id = id
-        self.title = title
-        self.author = author
-        self.abstract = abstract
-        self.cross_references = cross_references
-
-class Query():
-    """Class to represent a query in the CISI dataset"""
-    def __init__(self, id, query_text):
-        self.id = id
-        self.query_text = query_text
-
-class Relationship():
-    """Class to represent a relationship between a query and a document in the CISI dataset"""
-    def __init__(self, query_id, document_id):
-        self.query_id = query_id
-        self.document_id = document_id
-
-
-def read_documents ():
-    f = open ("/kaggle/input/cisi-a-dataset-for-information-retrieval/CISI.ALL")
-    merged = " "
-    # the string variable merged keeps the result of merging the field identifier with its content
-    
-    for a_line in f.readlines ():
-        if a_line.startswith ("."):
-            merged += "\n" + a_line.strip ()
-        else:
-            merged += " " + a_line.strip ()
-    # updates the merged variable using a for-loop
-    
-    documents = {}
-    
-    content = ""
-    doc_id = ""
-    # each entry in the dictioanry contains key = doc_id and value = content
-    
-    for a_line in merged.split ("\n"):
-        if a_line.startswith (".I"):
-            doc_id = a_line.split (" ") [1].strip()
-        elif a_line.startswith (".X"):
-            documents[doc_id] = content
-            content = ""
-            doc_id = ""
-        else:
-            content += a_line.strip ()[3:] + " "
-    f.close ()
-    return documents
-
-# print out the size of the dictionary and the content of the very first article
-documents = read_documents ()
-print (len (documents))
-print (documents.get ("1"))
-
-
-def read_queries ():
-    f = open ("/kaggle/input/cisi-a-dataset-for-information-retrieval/CISI.QRY")
-    merged = ""
-    
-    # merge the conten of each field with its identifier and separate different fields with lune breaks
-    for a_line in f.readlines ():
-        if a_line.startswith ("."):
-            merged += "\n" + a_line.strip ()
-        else:
-            merged += " " + a_line.strip ()
-    
-    queries = {}
-    
-    # initialize queries dictionary with key = qry_id and value=content for each query in the dataset
-    content = ""
-    qry_id = ""
-    
-    for a_line in merged.split ("\n"):
-        if a_line.startswith (".I"):
-            if not content == "":
-                queries [qry_id] = content
-                content = ""
-                qry_id = ""
-            # add an enrty to the dictionary when you encounter an .I identifier
-            qry_id = a_line.split(" ")[1].strip ()
-        # otherwise, keep adding content to the content variable
-        elif a_line.startswith (".W") or a_line.startswith (".T"):
-            content += a_line.strip ()[3:] + " "
-    queries [qry_id] = content
-    f.close ()
-    return queries
-
-# print out the length of the dictionary and the content of the first query
-queries = read_queries ()
-print (len (queries))
-print (queries.get("1"))
-
-def read_mappings ():
-    f = open ("/kaggle/input/cisi-a-dataset-for-information-retrieval/CISI.REL")
-    mappings = {}
-    
-    for a_line in f.readlines ():
-        voc = a_line.strip ().split ()
-        key = voc[0].strip ()
-        current_value = voc[1].strip()
-        value = []
-        # update the entry in the mappings dictionary with the current value
-        if key in mappings.keys ():
-            value = mappings.get (key)
-        value.append (current_value)
-        mappings [key] = value
-    f.close ()
-    return mappings
-
-# print out some information about the mapping data structure
-mappings = read_mappings ()
-print (len (mappings))
-print (mappings.keys ())
-print (mappings.get ("1"))
\ No newline at end of file
+if __name__ == "__main__":
+    config = {"data_dir": sys.argv[1]} if len(sys.argv) > 1 else {}
+    CISIPreprocessor(config).process()
@@ -1,4 +1,165 @@
-# https://huggingface.co/datasets/ms_marco
+"""
+File to preprocess the MS MARCO passage ranking data (about 8.8M passages) into sharded json lines files.
 
+Dataset: https://huggingface.co/datasets/ms_marco
+         https://www.kaggle.com/datasets/asahicantu/msmarco
 
-# https://www.kaggle.com/datasets/asahicantu/msmarco 
\ No newline at end of file
+File information:
+
+    collection.tsv:
+    One passage per line: pid <tab> passage
+
+    queries.<split>.tsv:
+    One query per line: qid <tab> query (split is e.g. train, dev or dev.small)
+
+    qrels.<split>.tsv:
+    One judgement per line: qid <tab> 0 <tab> pid <tab> 1
+
+Every file is read line by line and cut into fixed-size shards, so memory stays bounded by the shard
+size (times the number of shards in flight) regardless of corpus size. Shards can be written by a
+process pool. Usage: python -m preprocessors.ms_marco [data_dir]
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from src.io import save_json, save_jsonl
+from .base import DataPreprocessor
+from typing import Iterable, Iterator, Optional
+
+
+'''
+data/ms_marco/raw/collection.tsv, queries.dev.small.tsv, qrels.dev.small.tsv
+data/ms_marco/processed/documents-00000.jsonl, documents-00001.jsonl, ...
+    {"id": pid, "values": None, "metadata": {"source": "collection.tsv", "text": passage}}
+data/ms_marco/processed/queries-00000.jsonl, ...
+    {"id": qid, "query": query}
+data/ms_marco/processed/qrels-00000.jsonl, ...
+    {"query_id": qid, "doc_id": pid}
+data/ms_marco/processed/manifest.json (written last)
+    {"split": split, "shard_size": shard_size, "documents": count, "queries": count, "qrels": count}
+'''
+
+
+SHARD_SIZE: int = 100_000
+
+
+def read_lines(path: str) -> Iterator[str]:
+    """Stream the non-empty lines of a tsv file"""
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for line in file:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line
+
+
+def parse_line(kind: str, line: str, source: str) -> Optional[dict]:
+    """Convert one tsv line into a documents, queries or qrels record (None for malformed lines)"""
+    if kind == "qrels":
+        columns = line.split()
+        if len(columns) == 4:
+            return {"query_id": columns[0], "doc_id": columns[2]} if columns[3] != "0" else None
+        return {"query_id": columns[0], "doc_id": columns[1]} if len(columns) >= 2 else None
+    id, sep, text = line.partition("\t")
+    if not sep:
+        return None
+    if kind == "documents":
+        return {"id": id, "values": None, "metadata": {"source": source, "text": text}}
+    return {"id": id, "query": text}
+
+
+def batches(lines: Iterable[str], size: int) -> Iterator[list[str]]:
+    """Cut a stream into lists of at most `size` items"""
+    iterator = iter(lines)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _write_shard(args: tuple) -> int:
+    """Worker: parse one shard of lines and write it. Returns the number of records written"""
+    kind, lines, filename, out_dir, source = args
+    records = (parse_line(kind, line, source) for line in lines)
+    return save_jsonl((record for record in records if record is not None), filename, out_dir)
+
+
+def write_shards(
+        kind: str,
+        path: str,
+        out_dir: str,
+        shard_size: int = SHARD_SIZE,
+        max_workers: Optional[int] = None,
+    ) -> int:
+    """
+    Stream a tsv file into <kind>-<shard number>.jsonl shards. With max_workers > 1 shards are parsed
+    and written by a process pool, with at most 2 * max_workers shards in flight.
+
+    Returns:
+        Number of records written
+    """
+    source = os.path.basename(path)
+    tasks = (
+        (kind, lines, f"{kind}-{shard:05d}", out_dir, source)
+        for shard, lines in enumerate(batches(read_lines(path), shard_size))
+    )
+    if max_workers is None or max_workers == 1:
+        return sum(_write_shard(task) for task in tasks)
+
+    count = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = []
+        for task in tasks:
+            in_flight.append(pool.submit(_write_shard, task))
+            if len(in_flight) >= 2 * max_workers:
+                count += in_flight.pop(0).result()
+        for future in in_flight:
+            count += future.result()
+    return count
+
+
+class MSMarcoPreprocessor(DataPreprocessor):
+    """Preprocessor for the MS MARCO passage ranking dataset"""
+    def __init__(self, config=None):
+        config = {"dataset_name": "ms_marco"} if config is None else {"dataset_name": "ms_marco", **config}
+        self.split: str = config.get("split", "dev.small")
+        self.shard_size: int = config.get("shard_size", SHARD_SIZE)
+        self.max_workers: Optional[int] = config.get("max_workers", None)
+        super().__init__(config)
+
+
+    def is_processed(self) -> bool:
+        # shards may be left over from an interrupted run, the manifest is only written once all are complete
+        return os.path.exists(os.path.join(self.processed_dir, "manifest.json"))
+
+
+    def process(self) -> dict[str, int]:
+        """Convert collection.tsv, queries.<split>.tsv and qrels.<split>.tsv into sharded json lines files"""
+        files = {
+            "documents": "collection.tsv",
+            "queries": f"queries.{self.split}.tsv",
+            "qrels": f"qrels.{self.split}.tsv",
+        }
+        for name in files.values():
+            if not os.path.exists(os.path.join(self.raw_dir, name)):
+                raise ValueError(f"Raw file {name} not found in {self.raw_dir}")
+
+        # remove the manifest and shards of a previous run so stale shards are never mixed in
+        os.makedirs(self.processed_dir, exist_ok=True)
+        for name in os.listdir(self.processed_dir):
+            if name == "manifest.json" or (name.endswith(".jsonl") and name.split("-", 1)[0] in files):
+                os.remove(os.path.join(self.processed_dir, name))
+
+        counts = {
+            kind: write_shards(kind, os.path.join(self.raw_dir, name), self.processed_dir, self.shard_size, self.max_workers)
+            for kind, name in files.items()
+        }
+        save_json({"split": self.split, "shard_size": self.shard_size, **counts}, "manifest", self.processed_dir)
+        print(f"Processed MS MARCO into {self.processed_dir}: {counts}")
+        return counts
+
+
+if __name__ == "__main__":
+    config = {"data_dir": sys.argv[1]} if len(sys.argv) > 1 else {}
+    MSMarcoPreprocessor(config).process()
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import numpy as np
+from typing import Optional
+
+
+def _ranking(queries: np.ndarray, vectors: np.ndarray, sq_norms: Optional[np.ndarray]) -> np.ndarray:
+    """Score vectors against queries so that larger is better (euclidean drops the constant |q|^2 term)"""
+    ranking = queries @ vectors.T
+    if sq_norms is not None:
+        ranking = 2 * ranking - sq_norms
+    return ranking
+
+
+def kmeans(
+        vectors: np.ndarray,
+        k: int,
+        niter: int = 20,
+        metric: str = "cosine",
+        seed: int = 0,
+        block_size: int = 8192,
+    ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lloyd's k-means. Assignment uses inner product for cosine/dotproduct and L2 for euclidean; centroids
+    are re-normalized for cosine (spherical k-means). Returns (centroids, assignments).
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    if k > n:
+        raise ValueError(f"Cannot build {k} clusters from {n} vectors")
+    centroids = np.array(vectors[rng.choice(n, k, replace=False)], dtype=np.float32)
+    assignments = np.zeros(n, dtype=np.int64)
+
+    for _ in range(niter):
+        sq_norms = np.einsum("ij,ij->i", centroids, centroids) if metric == "euclidean" else None
+        for start in range(0, n, block_size):
+            assignments[start:start + block_size] = _ranking(vectors[start:start + block_size], centroids, sq_norms).argmax(axis=1)
+
+        # recompute centroids from the sorted assignments in one reduceat
+        order = np.argsort(assignments, kind="stable")
+        clusters, starts = np.unique(assignments[order], return_index=True)
+        sums = np.add.reduceat(np.asarray(vectors)[order], starts, axis=0)
+        counts = np.diff(np.append(starts, n))
+        centroids[clusters] = sums / counts[:, None]
+
+        # reseed empty clusters with random vectors
+        empty = np.setdiff1d(np.arange(k), clusters)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(n, len(empty), replace=False)]
+        if metric == "cosine":
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms == 0, 1, norms)
+
+    sq_norms = np.einsum("ij,ij->i", centroids, centroids) if metric == "euclidean" else None
+    for start in range(0, n, block_size):
+        assignments[start:start + block_size] = _ranking(vectors[start:start + block_size], centroids, sq_norms).argmax(axis=1)
+    return centroids, assignments
+
+
+class IVFIndex():
+    """
+    Inverted file index: vectors are clustered into nlist lists around k-means centroids and stored
+    contiguously per list. A search scores the nprobe closest lists only. Vectors are expected to be
+    prepared for the metric already (normalized for cosine).
+    """
+    def __init__(self, dimension: int, metric: str = "cosine", nlist: int = 1024, niter: int = 20, seed: int = 0) -> None:
+        """
+        Create a new, unbuilt IVFIndex
+
+        Args:
+            dimension: Dimension of the vectors
+            metric: "cosine", "dotproduct" or "euclidean"
+            nlist: Number of inverted lists (clusters), typically around sqrt(n) to 4 * sqrt(n)
+            niter: Number of k-means iterations used to train the centroids
+            seed: Random seed for training
+        """
+        self.dimension: int = dimension
+        self.metric: str = metric
+        self.nlist: int = nlist
+        self.niter: int = niter
+        self.seed: int = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.offsets: Optional[np.ndarray] = None    # list l holds positions offsets[l]:offsets[l + 1]
+        self.rows: Optional[np.ndarray] = None       # original row of each stored position
+        self.vectors: Optional[np.ndarray] = None    # vectors ordered by list
+        self.sq_norms: Optional[np.ndarray] = None   # only used for euclidean
+
+
+    def __str__(self) -> str:
+        return f"IVFIndex(dimension={self.dimension}, metric={self.metric}, nlist={self.nlist}, size={len(self)})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __len__(self) -> int:
+        return 0 if self.rows is None else len(self.rows)
+
+
+    def build(self, vectors: np.ndarray, max_train: Optional[int] = None) -> "IVFIndex":
+        """
+        Train the centroids and assign every vector to its list
+
+        Args:
+            vectors: (n, dimension) float32 matrix, row i is reported as row i by search
+            max_train: Maximum number of vectors used to train the centroids (default 256 per list)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n = vectors.shape[0]
+        self.nlist = min(self.nlist, n)
+        max_train = max_train if max_train is not None else 256 * self.nlist
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[np.sort(rng.choice(n, max_train, replace=False))] if n > max_train else vectors
+        self.centroids, _ = kmeans(sample, self.nlist, self.niter, self.metric, self.seed)
+
+        # assign all vectors and lay them out list by list
+        sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids) if self.metric == "euclidean" else None
+        assignments = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 8192):
+            assignments[start:start + 8192] = _ranking(vectors[start:start + 8192], self.centroids, sq_norms).argmax(axis=1)
+        self.rows = np.argsort(assignments, kind="stable")
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=self.nlist), out=self.offsets[1:])
+        self.vectors = np.ascontiguousarray(vectors[self.rows])
+        if self.metric == "euclidean":
+            self.sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        return self
+
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: int = 8) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top_k search. Returns (rows, scores) of shape (num_queries, top_k) ranked like
+        LocalNamespace.search; slots without a candidate hold row -1 and a NaN score.
+        """
+        if self.centroids is None:
+            raise ValueError("IVFIndex has not been built")
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        nprobe = min(nprobe, self.nlist)
+        rows = np.full((queries.shape[0], top_k), -1, dtype=np.int64)
+        scores = np.full((queries.shape[0], top_k), np.nan, dtype=np.float32)
+
+        # pick the nprobe best lists for every query at once
+        centroid_sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids) if self.metric == "euclidean" else None
+        coarse = _ranking(queries, self.centroids, centroid_sq_norms)
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe] if nprobe < self.nlist else np.broadcast_to(np.arange(self.nlist), coarse.shape)
+
+        for i, query in enumerate(queries):
+            positions = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in probes[i]])
+            if len(positions) == 0:
+                continue
+            sq_norms = self.sq_norms[positions] if self.sq_norms is not None else None
+            ranking = _ranking(query[None, :], self.vectors[positions], sq_norms)[0]
+            k = min(top_k, len(positions))
+            top = np.argpartition(-ranking, k - 1)[:k] if k < len(positions) else np.arange(len(positions))
+            top = top[np.argsort(-ranking[top], kind="stable")]
+            rows[i, :k] = self.rows[positions[top]]
+            if self.metric == "euclidean":
+                scores[i, :k] = np.sqrt(np.maximum(query @ query - ranking[top], 0))
+            else:
+                scores[i, :k] = ranking[top]
+        return rows, scores
+
+
+    def save(self, path: str) -> None:
+        """Write the index to a directory of .npy files (plus meta.json) that load() can memory map"""
+        if self.centroids is None:
+            raise ValueError("IVFIndex has not been built")
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "rows.npy"), self.rows)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        if self.sq_norms is not None:
+            np.save(os.path.join(path, "sq_norms.npy"), self.sq_norms)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump({
+                "type": "ivf",
+                "dimension": self.dimension,
+                "metric": self.metric,
+                "nlist": self.nlist,
+                "niter": self.niter,
+                "seed": self.seed,
+                "size": len(self)
+            }, file, indent=4)
+
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "IVFIndex":
+        """Load an index written by save(). With mmap the vectors stay on disk and are paged in on demand"""
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        index = cls(meta["dimension"], meta["metric"], meta["nlist"], meta["niter"], meta["seed"])
+        mmap_mode = "r" if mmap else None
+        index.centroids = np.load(os.path.join(path, "centroids.npy"))
+        index.offsets = np.load(os.path.join(path, "offsets.npy"))
+        index.rows = np.load(os.path.join(path, "rows.npy"), mmap_mode=mmap_mode)
+        index.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+        if os.path.exists(os.path.join(path, "sq_norms.npy")):
+            index.sq_norms = np.load(os.path.join(path, "sq_norms.npy"), mmap_mode=mmap_mode)
+        return index
+
+
+def recall_at_k(approx_rows: np.ndarray, exact_rows: np.ndarray) -> float:
+    """Mean fraction of the exact top-k rows that the approximate search also returned"""
+    if exact_rows.size == 0:
+        return 1.0
+    hits = [len(np.intersect1d(approx[approx >= 0], exact)) for approx, exact in zip(approx_rows, exact_rows)]
+    return float(np.sum(hits) / exact_rows.size)
+
+
+def sweep_nprobe(namespace, queries: np.ndarray, top_k: int = 10, nprobes: tuple[int, ...] = (1, 2, 4, 8, 16, 32, 64)) -> list[dict[str, float]]:
+    """
+    Measure the latency/recall curve of a LocalNamespace's IVF index against its exact search.
+    Returns one row per operating point with recall@k and queries per second (nprobe=None is exact).
+    """
+    if namespace.ann is None:
+        raise ValueError("Namespace has no ANN index -- build one first")
+    queries = namespace.prepare(queries)
+
+    start = time.perf_counter()
+    exact_rows, _ = namespace.search(queries, top_k)
+    elapsed = time.perf_counter() - start
+    results = [{"nprobe": None, "recall": 1.0, "qps": len(queries) / elapsed if elapsed > 0 else float("inf")}]
+
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        approx_rows, _ = namespace.search(queries, top_k, nprobe=nprobe)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "nprobe": nprobe,
+            "recall": recall_at_k(approx_rows, exact_rows),
+            "qps": len(queries) / elapsed if elapsed > 0 else float("inf")
+        })
+    return results
@@ -0,0 +1,355 @@
+import re
+import time
+import random
+import asyncio
+import numpy as np
+import openai
+from openai import AsyncOpenAI
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional, Union
+from .cache import EmbeddingCache, normalize_text
+from .embedder import Embedder, PRICE_PER_MILLION_TOKENS, plan_batches
+from .metrics import Metrics
+from .tokens import DEFAULT_ENCODING, count_tokens
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse a rate limit reset header such as '1s', '6m0s', '20ms' or '0.5' into seconds"""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+class RateLimiter():
+    """
+    Token bucket limiter that tracks requests-per-minute and tokens-per-minute. The refill rate backs
+    off multiplicatively on 429 responses and recovers slowly on success, and the buckets are clamped
+    to the remaining quota reported by the rate limit headers.
+    """
+    def __init__(
+            self,
+            requests_per_minute: int = 3000,
+            tokens_per_minute: int = 1_000_000,
+            base_backoff: float = 1.0,
+            max_backoff: float = 60.0,
+            min_scale: float = 0.1,
+        ) -> None:
+        """
+        Create a new RateLimiter
+
+        Args:
+            requests_per_minute: Request quota per minute
+            tokens_per_minute: Token quota per minute
+            base_backoff: Backoff in seconds after the first 429, doubled for each consecutive one
+            max_backoff: Upper bound on a single backoff in seconds
+            min_scale: Lowest fraction of the configured rate the limiter will back off to
+        """
+        if requests_per_minute < 1 or tokens_per_minute < 1:
+            raise ValueError("requests_per_minute and tokens_per_minute must be >= 1")
+        self.requests_per_minute: int = requests_per_minute
+        self.tokens_per_minute: int = tokens_per_minute
+        self.base_backoff: float = base_backoff
+        self.max_backoff: float = max_backoff
+        self.min_scale: float = min_scale
+
+        # buckets start full
+        self.request_level: float = float(requests_per_minute)
+        self.token_level: float = float(tokens_per_minute)
+        self.scale: float = 1.0
+        self.paused_until: float = 0.0
+        self.consecutive_limited: int = 0
+        self.last_refill: float = time.monotonic()
+        self.lock: Optional[asyncio.Lock] = None
+
+
+    def __str__(self) -> str:
+        return f"RateLimiter(rpm={self.requests_per_minute}, tpm={self.tokens_per_minute}, scale={self.scale:.2f})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def _refill(self, now: float) -> None:
+        """Add the quota accrued since the last refill, scaled by the current backoff"""
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.request_level = min(self.requests_per_minute, self.request_level + elapsed * self.requests_per_minute * self.scale / 60)
+        self.token_level = min(self.tokens_per_minute, self.token_level + elapsed * self.tokens_per_minute * self.scale / 60)
+
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request carrying `tokens` tokens fits in both buckets, then consume it"""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            async with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0 and self.request_level >= 1 and self.token_level >= tokens:
+                    self.request_level -= 1
+                    self.token_level -= tokens
+                    return
+                wait = max(
+                    wait,
+                    (1 - self.request_level) * 60 / (self.requests_per_minute * self.scale),
+                    (tokens - self.token_level) * 60 / (self.tokens_per_minute * self.scale),
+                    0.001,
+                )
+            await asyncio.sleep(wait)
+
+
+    def on_success(self, headers: Optional[dict[str, str]] = None) -> None:
+        """Recover the rate after a successful request and clamp the buckets to the reported quota"""
+        self.consecutive_limited = 0
+        self.scale = min(1.0, self.scale * 1.05)
+        if not headers:
+            return
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_requests is not None:
+            self.request_level = min(self.request_level, float(remaining_requests))
+        if remaining_tokens is not None:
+            self.token_level = min(self.token_level, float(remaining_tokens))
+
+        # if the server says a quota is exhausted, hold off until it resets
+        now = time.monotonic()
+        for remaining, reset in [
+            (remaining_requests, headers.get("x-ratelimit-reset-requests")),
+            (remaining_tokens, headers.get("x-ratelimit-reset-tokens")),
+        ]:
+            if remaining is not None and float(remaining) <= 0:
+                delay = parse_duration(reset)
+                if delay is not None:
+                    self.paused_until = max(self.paused_until, now + delay)
+
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """Back off after a 429: halve the rate and pause all requests for a jittered delay. Returns the delay"""
+        self.consecutive_limited += 1
+        self.scale = max(self.min_scale, self.scale * 0.5)
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.consecutive_limited - 1))
+        delay = max(retry_after or 0.0, backoff) * random.uniform(0.5, 1.5)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+
+class AsyncEmbedder(Embedder):
+    """
+    Asynchronous version of Embedder built on the AsyncOpenAI client. Requests are sent concurrently
+    with a bounded number in flight and paced by a RateLimiter.
+    """
+    def __init__(
+            self,
+            client: AsyncOpenAI = None,
+            model_name: str = "text-embedding-3-small",
+            dim: int = 1536,
+            metric: str = "cosine",
+            cache: Optional[EmbeddingCache] = None,
+            matryoshka: bool = False,
+            encoding_name: str = DEFAULT_ENCODING,
+            limiter: Optional[RateLimiter] = None,
+            max_concurrency: int = 8,
+            max_pending: int = 32,
+            max_retries: int = 6,
+            metrics: Optional[Metrics] = None,
+        ) -> None:
+        """
+        Create a new AsyncEmbedder
+
+        Args:
+            client: AsyncOpenAI client (its own retries are disabled, retries are handled here)
+            model_name, dim, metric, cache, matryoshka, encoding_name: See Embedder
+            limiter: RateLimiter shared by every request (a default one is created if not given)
+            max_concurrency: Maximum number of requests in flight
+            max_pending: Maximum number of batches embed_stream will queue ahead of the consumer
+            max_retries: Maximum number of retries for a request after 429s or transient errors
+            metrics: See Embedder
+        """
+        super().__init__(client, model_name, dim, metric, cache, matryoshka, encoding_name, metrics)
+        if max_concurrency < 1:
+            raise ValueError(f"Invalid max_concurrency: {max_concurrency}. Must be >= 1")
+        if max_pending < 1:
+            raise ValueError(f"Invalid max_pending: {max_pending}. Must be >= 1")
+        if hasattr(client, "with_options"):
+            self.client = client.with_options(max_retries=0)
+        self.limiter: RateLimiter = limiter if limiter is not None else RateLimiter()
+        self.max_concurrency: int = max_concurrency
+        self.max_pending: int = max_pending
+        self.max_retries: int = max_retries
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+        # throughput accounting
+        self.stats: dict[str, int] = {"requests": 0, "tokens": 0, "retries": 0, "rate_limited": 0}
+        self.first_request: Optional[float] = None
+        self.last_response: Optional[float] = None
+
+
+    def __str__(self) -> str:
+        return f"AsyncEmbedder(model_name={self.model_name}, dim={self.dim}, metric={self.metric}, max_concurrency={self.max_concurrency})"
+
+
+    def tokens_per_second(self) -> float:
+        """Sustained throughput: tokens embedded per second between the first request and the last response"""
+        if self.first_request is None or self.last_response is None or self.last_response <= self.first_request:
+            return 0.0
+        return self.stats["tokens"] / (self.last_response - self.first_request)
+
+
+    async def _create(self, texts: list[str], dim: int, tokens: int = 0) -> list[list[float]]:
+        """Send one request through the rate limiter, retrying on 429s and transient errors"""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(tokens)
+            async with self.semaphore:
+                if self.first_request is None:
+                    self.first_request = time.monotonic()
+                start = time.perf_counter()
+                try:
+                    raw = await self.client.embeddings.with_raw_response.create(input=texts, model=self.model_name, dimensions=dim)
+                except openai.RateLimitError as e:
+                    self.stats["rate_limited"] += 1
+                    self.metrics.count("embedder.rate_limited", model=self.model_name)
+                    delay = self.limiter.on_rate_limited(parse_duration(e.response.headers.get("retry-after")))
+                    error = e
+                except (openai.APIConnectionError, openai.InternalServerError) as e:
+                    delay = min(self.limiter.max_backoff, self.limiter.base_backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    error = e
+                else:
+                    self.limiter.on_success(raw.headers)
+                    response = raw.parse()
+                    used = response.usage.total_tokens if response.usage is not None else tokens
+                    self.stats["requests"] += 1
+                    self.stats["tokens"] += used
+                    self.last_response = time.monotonic()
+                    if self.metrics.enabled:
+                        self.metrics.observe("embedder.request_seconds", time.perf_counter() - start, model=self.model_name)
+                        self.metrics.observe("embedder.request_texts", len(texts), model=self.model_name)
+                        self.metrics.count("embedder.requests", model=self.model_name)
+                        self.metrics.count("embedder.tokens", used, model=self.model_name)
+                        self.metrics.count("embedder.cost_usd", used * PRICE_PER_MILLION_TOKENS[self.model_name] / 1e6, model=self.model_name)
+                    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                self.metrics.count("embedder.retries", model=self.model_name)
+                await asyncio.sleep(delay)
+        self.metrics.count("embedder.errors", model=self.model_name)
+        print(f"Error embedding batch of texts after {self.max_retries} retries: {str(error)}")
+        raise error
+
+
+    async def _embed(self, texts: list[str], dim: int) -> np.ndarray:
+        """Embed texts at the given width, sending the packed batches of cache misses concurrently"""
+        texts = [normalize_text(text) for text in texts]
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+
+        cached = self.cache.get_many(self.model_name, dim, texts) if self.cache is not None else [None] * len(texts)
+        misses: dict[str, list[int]] = {}
+        for i, vector in enumerate(cached):
+            if vector is None:
+                misses.setdefault(texts[i], []).append(i)
+            else:
+                embeddings[i] = vector
+        if self.metrics.enabled:
+            self.metrics.count("embedder.texts", len(texts), model=self.model_name)
+            self.metrics.count("embedder.cache_hits", len(texts) - sum(len(rows) for rows in misses.values()), model=self.model_name)
+        if not misses:
+            return embeddings
+
+        miss_texts = list(misses.keys())
+        token_counts = count_tokens(miss_texts, self.encoding_name)
+
+        async def embed_one(batch: list[int]) -> None:
+            batch_texts = [miss_texts[i] for i in batch]
+            fetched = np.asarray(
+                await self._create(batch_texts, dim, sum(token_counts[i] for i in batch)),
+                dtype=np.float32
+            )
+            if self.cache is not None:
+                self.cache.put_many(self.model_name, dim, batch_texts, fetched)
+            for text, embedding in zip(batch_texts, fetched):
+                embeddings[misses[text]] = embedding
+
+        # batches are planned longest first, so the slowest requests start first
+        tasks = [asyncio.ensure_future(embed_one(batch)) for batch in plan_batches(token_counts)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return embeddings
+
+
+    async def embed_text(self, text: str) -> np.ndarray:
+        """Embed a given text using the selected model. Returns a float32 vector"""
+        return (await self.embed_batch([text]))[0]
+
+
+    async def embed_batch(self, texts: list[str]) -> np.ndarray:
+        """Embed a batch of texts using the selected model. Returns a contiguous (len(texts), dim) float32 matrix"""
+        embeddings = await self._embed(texts, self.fetch_dim)
+        if self.fetch_dim != self.dim:
+            return self.truncate(embeddings, self.dim)
+        return embeddings
+
+
+    async def embed_dims(self, texts: list[str], dims: list[int]) -> dict[int, np.ndarray]:
+        """Embed texts once at the model's full width and derive every requested dimension locally"""
+        for dim in dims:
+            if dim > self.max_dim or dim < 1:
+                raise ValueError(f"Invalid dimension for model {self.model_name}: {dim}. Valid dimensions in range: [1, {self.max_dim}]")
+        full = await self._embed(texts, self.max_dim)
+        return {dim: self.truncate(full, dim) for dim in sorted(set(dims))}
+
+
+    async def embed_stream(
+            self,
+            text_batches: Union[Iterable[list[str]], AsyncIterable[list[str]]],
+        ) -> AsyncIterator[tuple[list[str], np.ndarray]]:
+        """
+        Embed a stream of text batches, yielding (texts, embeddings) in input order. At most
+        max_pending batches are queued ahead of the consumer, so a fast producer blocks instead
+        of queueing unbounded work.
+        """
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+
+        async def produce() -> None:
+            try:
+                if hasattr(text_batches, "__aiter__"):
+                    async for texts in text_batches:
+                        await pending.put((texts, asyncio.ensure_future(self.embed_batch(texts))))
+                else:
+                    for texts in text_batches:
+                        await pending.put((texts, asyncio.ensure_future(self.embed_batch(texts))))
+            finally:
+                # always end the stream, awaiting the producer below re-raises its error
+                await pending.put(None)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+                texts, task = item
+                yield texts, await task
+            await producer
+        finally:
+            # drop any queued work if the consumer stops early or a batch fails
+            producer.cancel()
+            while not pending.empty():
+                item = pending.get_nowait()
+                if item is not None:
+                    item[1].cancel()
@@ -0,0 +1,320 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Optional
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text the same way it is sent to the embedding API"""
+    return text.replace("\n", " ")
+
+
+def cache_key(model_name: str, dim: int, text: str) -> str:
+    """Content-addressed key for an embedding: hash of (model_name, dim, normalized text)"""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model_name}:{dim}:{digest}"
+
+
+class EmbeddingCache():
+    """
+    Two tier embedding cache: a bounded in-memory LRU in front of a persistent SQLite store.
+    Vectors are stored as raw float32 bytes keyed by (model_name, dim, normalized text hash).
+    """
+    def __init__(
+            self,
+            path: Optional[str] = "data/cache/embeddings.sqlite",
+            max_memory_items: int = 100_000,
+        ) -> None:
+        """
+        Create a new EmbeddingCache
+
+        Args:
+            path: Path to the SQLite file for the on-disk tier (None to keep the cache in memory only)
+            max_memory_items: Maximum number of vectors kept in the in-memory LRU tier
+        """
+        if max_memory_items < 0:
+            raise ValueError(f"Invalid max_memory_items: {max_memory_items}. Must be >= 0")
+        self.path: Optional[str] = path
+        self.max_memory_items: int = max_memory_items
+        self.memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+
+        # on-disk tier
+        self.conn: Optional[sqlite3.Connection] = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self.conn.commit()
+
+
+    def __str__(self) -> str:
+        return f"EmbeddingCache(path={self.path}, memory_items={len(self.memory)}, hits={self.hits}, misses={self.misses})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __len__(self) -> int:
+        if self.conn is None:
+            return len(self.memory)
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """Insert a vector into the LRU tier, evicting the least recently used entries"""
+        if self.max_memory_items == 0:
+            return
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+
+    def get_many(self, model_name: str, dim: int, texts: list[str]) -> list[Optional[np.ndarray]]:
+        """Look up a list of texts. Returns a list aligned with texts holding a vector or None for each miss"""
+        keys = [cache_key(model_name, dim, text) for text in texts]
+        results: list[Optional[np.ndarray]] = [None] * len(keys)
+        disk_lookups: dict[str, list[int]] = {}
+
+        with self.lock:
+            # memory tier first
+            for i, key in enumerate(keys):
+                vector = self.memory.get(key)
+                if vector is not None:
+                    self.memory.move_to_end(key)
+                    results[i] = vector
+                else:
+                    disk_lookups.setdefault(key, []).append(i)
+
+            # then a single round trip per block of keys to the disk tier
+            if self.conn is not None and disk_lookups:
+                pending = list(disk_lookups.keys())
+                for start in range(0, len(pending), 500):
+                    block = pending[start:start + 500]
+                    rows = self.conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(block))})",
+                        block
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, vector)
+                        for i in disk_lookups[key]:
+                            results[i] = vector
+
+            found = sum(result is not None for result in results)
+            self.hits += found
+            self.misses += len(results) - found
+        return results
+
+
+    def get(self, model_name: str, dim: int, text: str) -> Optional[np.ndarray]:
+        """Look up a single text. Returns None on a miss"""
+        return self.get_many(model_name, dim, [text])[0]
+
+
+    def put_many(self, model_name: str, dim: int, texts: list[str], embeddings: list[list[float]]) -> None:
+        """Store embeddings for a list of texts in both tiers"""
+        if len(texts) != len(embeddings):
+            raise ValueError(f"Number of texts ({len(texts)}) does not match number of embeddings ({len(embeddings)})")
+        rows = []
+        with self.lock:
+            for text, embedding in zip(texts, embeddings):
+                key = cache_key(model_name, dim, text)
+                # a copy, so the LRU does not keep the whole batch matrix a row view belongs to alive
+                vector = np.array(embedding, dtype=np.float32, copy=True)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes()))
+            if self.conn is not None and rows:
+                self.conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self.conn.commit()
+
+
+    def put(self, model_name: str, dim: int, text: str, embedding: list[float]) -> None:
+        """Store the embedding for a single text"""
+        self.put_many(model_name, dim, [text], [embedding])
+
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers"""
+        with self.lock:
+            self.memory.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM embeddings")
+                self.conn.commit()
+
+
+    def close(self) -> None:
+        """Close the on-disk tier"""
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+def query_key(index_name: str, namespace: str, model_name: str, dim: int, top_k: int, version: int, query: str) -> str:
+    """Key of one query result: hash of the index, namespace, embedder, top_k, content version and normalized query"""
+    digest = hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{index_name}\0{namespace}\0{model_name}\0{dim}\0{top_k}\0{version}\0{digest}".encode("utf-8")).hexdigest()
+
+
+class QueryCache():
+    """
+    Persistent SQLite memo of query results: the ids (newline separated) and float32 scores of the
+    matches, keyed by (index, namespace, query hash, embedder, top_k, content version). Every
+    namespace has a version that writers bump on upserts and deletes (PineconeDB does so when given
+    the cache), so results cached before a write are never read again and are removed on the bump.
+    Writes made without going through the cache are not seen: call invalidate() after them.
+
+    Pinecone is eventually consistent, so queries sent shortly after a write may not see it yet. Results
+    are therefore not stored until settle_seconds have passed since the last bump of their namespace.
+    """
+    def __init__(self, path: Optional[str] = "data/cache/queries.sqlite", settle_seconds: float = 10.0) -> None:
+        """
+        Create a new QueryCache
+
+        Args:
+            path: Path to the SQLite file (None to keep the cache in memory only)
+            settle_seconds: Time after a write during which results of the namespace are not cached, as the
+                            index may not reflect the write yet (0 for indexes with read-after-write consistency)
+        """
+        if settle_seconds < 0:
+            raise ValueError(f"Invalid settle_seconds: {settle_seconds}. Must be >= 0")
+        self.path: Optional[str] = path
+        self.settle_seconds: float = settle_seconds
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+        if path is not None and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn: sqlite3.Connection = sqlite3.connect(path if path is not None else ":memory:", check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS versions (index_name TEXT, namespace TEXT, version INTEGER NOT NULL, updated REAL, PRIMARY KEY (index_name, namespace))"
+        )
+        # caches created before bump times were recorded
+        if "updated" not in [column[1] for column in self.conn.execute("PRAGMA table_info(versions)").fetchall()]:
+            self.conn.execute("ALTER TABLE versions ADD COLUMN updated REAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, index_name TEXT, namespace TEXT, version INTEGER, ids TEXT NOT NULL, scores BLOB NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_namespace ON results (index_name, namespace, version)")
+        self.conn.commit()
+
+
+    def __str__(self) -> str:
+        return f"QueryCache(path={self.path}, hits={self.hits}, misses={self.misses})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+    def version(self, index_name: str, namespace: str) -> int:
+        """Current content version of a namespace (0 until its first invalidation)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version FROM versions WHERE index_name = ? AND namespace = ?", (index_name, namespace)
+            ).fetchone()
+        return row[0] if row is not None else 0
+
+
+    def invalidate(self, index_name: str, namespace: Optional[str] = None) -> None:
+        """Bump the version of a namespace (or of every known namespace of the index), record when, and drop its cached results"""
+        now = time.time()
+        with self.lock:
+            if namespace is None:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO versions (index_name, namespace, version) "
+                    "SELECT DISTINCT index_name, namespace, 0 FROM results WHERE index_name = ?",
+                    (index_name,)
+                )
+                self.conn.execute("UPDATE versions SET version = version + 1, updated = ? WHERE index_name = ?", (now, index_name))
+                self.conn.execute("DELETE FROM results WHERE index_name = ?", (index_name,))
+            else:
+                self.conn.execute(
+                    "INSERT INTO versions (index_name, namespace, version, updated) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT (index_name, namespace) DO UPDATE SET version = version + 1, updated = excluded.updated",
+                    (index_name, namespace, now)
+                )
+                self.conn.execute("DELETE FROM results WHERE index_name = ? AND namespace = ?", (index_name, namespace))
+            self.conn.commit()
+
+
+    def get_many(self, keys: list[str]) -> list[Optional[tuple[list[str], np.ndarray]]]:
+        """Look up query keys. Returns a list aligned with keys holding (ids, scores) or None for each miss"""
+        results: dict[str, tuple[list[str], np.ndarray]] = {}
+        with self.lock:
+            distinct = list(dict.fromkeys(keys))
+            for start in range(0, len(distinct), 500):
+                block = distinct[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, ids, scores FROM results WHERE key IN ({','.join('?' * len(block))})",
+                    block
+                ).fetchall()
+                for key, ids, scores in rows:
+                    results[key] = (ids.split("\n") if ids else [], np.frombuffer(scores, dtype=np.float32))
+            found = [results.get(key) for key in keys]
+            hits = sum(result is not None for result in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+
+    def put_many(self, index_name: str, namespace: str, version: int, keys: list[str], results: list[tuple[list[str], np.ndarray]]) -> None:
+        """
+        Store (ids, scores) results computed at the given namespace version (read before the queries were sent).
+        Nothing is stored if the version changed since or if the last write is less than settle_seconds old
+        """
+        if len(keys) != len(results):
+            raise ValueError(f"Number of keys ({len(keys)}) does not match number of results ({len(results)})")
+        rows = [
+            (key, index_name, namespace, version, "\n".join(ids), np.asarray(scores, dtype=np.float32).tobytes())
+            for key, (ids, scores) in zip(keys, results)
+        ]
+        with self.lock:
+            # a write may have bumped the version while the queries ran: those results are already stale
+            row = self.conn.execute(
+                "SELECT version, updated FROM versions WHERE index_name = ? AND namespace = ?", (index_name, namespace)
+            ).fetchone()
+            current, updated = row if row is not None else (0, None)
+            if current != version:
+                return
+            # or the index may not reflect the last write yet
+            if updated is not None and time.time() - updated < self.settle_seconds:
+                return
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results (key, index_name, namespace, version, ids, scores) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+
+    def clear(self) -> None:
+        """Remove every cached result (versions are kept)"""
+        with self.lock:
+            self.conn.execute("DELETE FROM results")
+            self.conn.commit()
+
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
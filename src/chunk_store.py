@@ -0,0 +1,260 @@
+"""
+On-disk store for chunk sets, laid out as planned in notes.txt:
+
+    data/<dataset>/chunks/<chunking_strategy>/<chunk_size>/
+        manifest.json   source hash + chunker parameters + chunk count (written last)
+        text.bin        every chunk's utf-8 text concatenated into one blob
+        offsets.npy     int64 byte offsets into text.bin (num_chunks + 1)
+        doc_index.npy   int32 index of each chunk's source document in doc_ids.json
+        doc_ids.json    table of source document ids
+
+A chunk set is only rebuilt when its manifest is missing or its source hash or parameters changed,
+and loading memory maps the blob and arrays instead of reading them.
+"""
+import os
+import mmap
+import shutil
+import hashlib
+import numpy as np
+from array import array
+from .chunker import SpanSet
+from .document import DocumentBatch
+from .io import save_json, load_json
+from typing import Callable, Iterable, Iterator, Optional
+
+
+def hash_files(paths: list[str], block_size: int = 1 << 20) -> str:
+    """sha256 over the contents of a list of files, read in blocks"""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(block_size), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_texts(doc_ids: list[str], texts: list[str]) -> str:
+    """sha256 over (doc_id, text) pairs, for sources that are already in memory"""
+    digest = hashlib.sha256()
+    for doc_id, text in zip(doc_ids, texts):
+        digest.update(doc_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ChunkSet():
+    """Read-only view of a stored chunk set. The text blob and arrays are memory mapped, chunks are decoded on access"""
+    def __init__(self, path: str, use_mmap: bool = True) -> None:
+        self.path: str = path
+        self.manifest: dict = load_json("manifest", path)
+        self.doc_ids: list[str] = load_json("doc_ids", path)
+        mmap_mode = "r" if use_mmap else None
+        self.offsets: np.ndarray = np.load(os.path.join(path, "offsets.npy"), mmap_mode=mmap_mode)
+        self.doc_index: np.ndarray = np.load(os.path.join(path, "doc_index.npy"), mmap_mode=mmap_mode)
+        # chunk id lookup tables, built on first use (see rows)
+        self.doc_table: Optional[dict[str, int]] = None
+        self.doc_rows: Optional[np.ndarray] = None
+        self.doc_starts: Optional[np.ndarray] = None
+
+        self.file = open(os.path.join(path, "text.bin"), "rb")
+        if os.path.getsize(os.path.join(path, "text.bin")) == 0:
+            self.blob = b""
+        elif use_mmap:
+            self.blob = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.blob = self.file.read()
+
+
+    def __str__(self) -> str:
+        return f"ChunkSet(path={self.path}, chunks={len(self)})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __len__(self) -> int:
+        return len(self.doc_index)
+
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.blob[start:end].decode("utf-8")
+
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+    def doc_id(self, i: int) -> str:
+        """Id of the source document of chunk i"""
+        return self.doc_ids[self.doc_index[i]]
+
+
+    def rows(self, ids: list[str]) -> np.ndarray:
+        """
+        Row of each chunk id <doc_id>-<chunk_number> (chunk_number counting a document's chunks in
+        order, as written by Pipeline and Planner), -1 if it is not in the set
+        """
+        if self.doc_table is None:
+            self.doc_table = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+            # rows grouped by document, in order, and where each document's group starts
+            self.doc_rows = np.argsort(self.doc_index, kind="stable")
+            self.doc_starts = np.searchsorted(self.doc_index[self.doc_rows], np.arange(len(self.doc_ids) + 1))
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        for i, id in enumerate(ids):
+            doc_id, _, number = id.rpartition("-")
+            doc = self.doc_table.get(doc_id)
+            if doc is not None and number.isdigit() and self.doc_starts[doc] + int(number) < self.doc_starts[doc + 1]:
+                rows[i] = self.doc_rows[self.doc_starts[doc] + int(number)]
+        return rows
+
+
+    def batch(self, ids: list[str]) -> DocumentBatch:
+        """Hydrate chunk ids (e.g. from PineconeDB.query_ids) into a DocumentBatch read from the memory mapped text"""
+        rows = self.rows(ids)
+        if (rows < 0).any():
+            raise ValueError(f"Chunk {ids[int(np.argmax(rows < 0))]} is not in chunk set {self.path}")
+        rows = rows.tolist()
+        return DocumentBatch.from_columns(ids, (self.doc_id(row) for row in rows), (self[row] for row in rows))
+
+
+    def close(self) -> None:
+        """Release the memory map and file handle"""
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self.file.close()
+
+
+class ChunkStore():
+    """
+    Store of chunk sets under <root>/<chunking_strategy>/<chunk_size>, with manifest-based skip logic
+    """
+    def __init__(self, root: str) -> None:
+        """
+        Create a new ChunkStore
+
+        Args:
+            root: Chunk directory of a dataset, e.g. data/cisi/chunks
+        """
+        self.root: str = root
+
+
+    def __str__(self) -> str:
+        return f"ChunkStore(root={self.root}, chunk_sets={len(self.chunk_sets())})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def path(self, strategy: str, chunk_size: int) -> str:
+        return os.path.join(self.root, strategy, str(chunk_size))
+
+
+    def manifest(self, strategy: str, chunk_size: int) -> Optional[dict]:
+        """Manifest of a stored chunk set, or None if it does not exist (or was never completed)"""
+        path = self.path(strategy, chunk_size)
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            return None
+        return load_json("manifest", path)
+
+
+    def is_fresh(self, strategy: str, chunk_size: int, source_hash: str, params: dict) -> bool:
+        """True if the chunk set exists and was built from the same source data with the same parameters"""
+        manifest = self.manifest(strategy, chunk_size)
+        return manifest is not None and manifest["source_hash"] == source_hash and manifest["params"] == params
+
+
+    def chunk_sets(self) -> list[tuple[str, int]]:
+        """(strategy, chunk_size) of every completed chunk set"""
+        if not os.path.isdir(self.root):
+            return []
+        chunk_sets = []
+        for strategy in sorted(os.listdir(self.root)):
+            strategy_dir = os.path.join(self.root, strategy)
+            if not os.path.isdir(strategy_dir):
+                continue
+            for chunk_size in sorted(os.listdir(strategy_dir)):
+                if chunk_size.isdigit() and os.path.exists(os.path.join(strategy_dir, chunk_size, "manifest.json")):
+                    chunk_sets.append((strategy, int(chunk_size)))
+        return chunk_sets
+
+
+    def write(self, strategy: str, chunk_size: int, chunks: Iterable[tuple[str, str]], source_hash: str, params: dict) -> ChunkSet:
+        """
+        Stream (doc_id, chunk_text) pairs into a chunk set. Everything is written to a temporary
+        directory that replaces the old set only once complete, so a crash never leaves a partial set.
+        """
+        path = self.path(strategy, chunk_size)
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        offsets = array("q", [0])
+        doc_index = array("i")
+        doc_table: dict[str, int] = {}
+        with open(os.path.join(tmp_path, "text.bin"), "wb") as file:
+            position = 0
+            for doc_id, text in chunks:
+                data = text.encode("utf-8")
+                file.write(data)
+                position += len(data)
+                offsets.append(position)
+                doc_index.append(doc_table.setdefault(doc_id, len(doc_table)))
+
+        np.save(os.path.join(tmp_path, "offsets.npy"), np.frombuffer(offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_path, "doc_index.npy"), np.frombuffer(doc_index, dtype=np.int32))
+        save_json(list(doc_table.keys()), "doc_ids", tmp_path, indent=None)
+        save_json({
+            "strategy": strategy,
+            "chunk_size": chunk_size,
+            "source_hash": source_hash,
+            "params": params,
+            "chunks": len(doc_index),
+            "documents": len(doc_table)
+        }, "manifest", tmp_path)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        return ChunkSet(path)
+
+
+    def write_spans(self, strategy: str, chunk_size: int, spans: SpanSet, texts: list[str], source_hash: str, params: dict) -> ChunkSet:
+        """Store a SpanSet produced by SweepChunker (texts aligned with spans.doc_ids)"""
+        doc_ids = spans.doc_ids
+        return self.write(
+            strategy,
+            chunk_size,
+            ((doc_ids[doc], texts[doc][start:end]) for doc, start, end in zip(spans.doc_index.tolist(), spans.starts.tolist(), spans.ends.tolist())),
+            source_hash,
+            params
+        )
+
+
+    def load(self, strategy: str, chunk_size: int, use_mmap: bool = True) -> ChunkSet:
+        """Open a stored chunk set"""
+        if self.manifest(strategy, chunk_size) is None:
+            raise ValueError(f"Chunk set {strategy}/{chunk_size} does not exist in {self.root}")
+        return ChunkSet(self.path(strategy, chunk_size), use_mmap)
+
+
+    def get_or_build(
+            self,
+            strategy: str,
+            chunk_size: int,
+            source_hash: str,
+            params: dict,
+            build: Callable[[], Iterable[tuple[str, str]]],
+        ) -> ChunkSet:
+        """Load the chunk set if it is up to date, otherwise build it with `build` and store it"""
+        if self.is_fresh(strategy, chunk_size, source_hash, params):
+            return self.load(strategy, chunk_size)
+        print(f"Chunking {strategy}/{chunk_size}...")
+        return self.write(strategy, chunk_size, build(), source_hash, params)
@@ -1,35 +1,308 @@
-import tiktoken
+import re
+import hashlib
+import threading
+import numpy as np
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.documents import Document as LCDocument
 from langchain_text_splitters import (
     CharacterTextSplitter,
     RecursiveCharacterTextSplitter,
-    SemanticChunker
 )
-from typing import Callable, Union
+from typing import Any, Callable, Optional, Union
+from .embedder import Embedder
+from .metrics import Metrics, NULL_METRICS
+from .tokens import DEFAULT_ENCODING, count_tokens, get_encoding
 
 
 # https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-def num_tokens_from_string(string: str, encoding_name: str = "CL100K_Base") -> int:
-    """Returns the number of tokens in a text string: CL100K_Base is encoding for gpt models"""
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+def num_tokens_from_string(string: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """Returns the number of tokens in a text string: cl100k_base is encoding for gpt models"""
+    return len(get_encoding(encoding_name).encode(string, disallowed_special=()))
 
 
-# https://python.langchain.com/docs/modules/data_connection/document_transformers/
-strategies: dict[str, Union[RecursiveCharacterTextSplitter, CharacterTextSplitter]]= {
-    "character": CharacterTextSplitter,           # split by single characters
-    "recursive": RecursiveCharacterTextSplitter,  # split list of chars to keep paragraphs, sentences, and then words together for as long as possible
-    "semantic":  SemanticChunker,                 # splits into sentences, then groups into groups of 3 sentences, and then merges ones that are similar in the embedding space
-}
+def num_tokens_from_strings(strings: list[str], encoding_name: str = DEFAULT_ENCODING) -> list[int]:
+    """Returns the number of tokens in each text string, tokenized in one batch"""
+    return count_tokens(strings, encoding_name)
+
+
+class TokenLength():
+    """
+    Token length function for the text splitters. A document is tokenized once when it is bound, and
+    the length of any substring of it is then read from the token offsets instead of re-encoding it.
+    Strings that are not part of the bound document fall back to encoding (and every result is memoized).
+    """
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, min_lookup_length: int = 16) -> None:
+        """
+        Args:
+            encoding_name: tiktoken encoding to count with
+            min_lookup_length: Shorter strings (e.g. separators) are encoded directly, since their
+                               first occurrence in the document may not be where they were split from
+        """
+        self.encoding_name: str = encoding_name
+        self.min_lookup_length: int = min_lookup_length
+        self.text: Optional[str] = None
+        self.offsets: list[int] = []
+        self.hint: int = 0
+        self.memo: dict[str, int] = {}
+
+
+    def bind(self, text: str, tokens: Optional[list[int]] = None) -> "TokenLength":
+        """Tokenize a document once (or reuse its tokens) and measure substrings of it from the offsets"""
+        encoding = get_encoding(self.encoding_name)
+        if tokens is None:
+            tokens = encoding.encode(text, disallowed_special=())
+        _, self.offsets = encoding.decode_with_offsets(tokens)
+        self.text = text
+        self.hint = 0
+        self.memo = {}
+        return self
+
+
+    def unbind(self) -> None:
+        """Forget the bound document"""
+        self.text = None
+        self.offsets = []
+        self.memo = {}
+
+
+    def __call__(self, string: str) -> int:
+        count = self.memo.get(string)
+        if count is not None:
+            return count
+
+        start = -1
+        if self.text is not None and len(string) >= self.min_lookup_length:
+            # the splitters measure pieces mostly in document order, so search forward from the last hit first
+            start = self.text.find(string, self.hint)
+            if start == -1:
+                start = self.text.find(string)
+        if start != -1:
+            self.hint = start
+            count = bisect_left(self.offsets, start + len(string)) - bisect_left(self.offsets, start)
+        else:
+            count = num_tokens_from_string(string, self.encoding_name)
+        self.memo[string] = count
+        return count
 
 
 # *** callable takes a string and returns an int ***
+# (token mode uses a TokenLength per Chunker so that each document is tokenized once)
 length_functions: dict[str, Callable[[str], int]] = {
     "char": len,
     "token": num_tokens_from_string
 }
 
 
+SENTENCE_PATTERN = re.compile(r"(?<=[.?!])\s+")
+
+
+class DistanceMemo():
+    """
+    Bounded LRU of the adjacent sentence-group distances of texts, keyed by a hash of the embedder
+    model and dim, the buffer size and the text. Shared between SemanticSplitters (e.g. one per chunk
+    size) so re-chunking a text reuses its distances instead of embedding it again; evicted texts are
+    embedded again, which only costs cache lookups if the embedder has an EmbeddingCache.
+    """
+    def __init__(self, max_items: int = 100_000) -> None:
+        """
+        Create a new DistanceMemo
+
+        Args:
+            max_items: Maximum number of texts kept (should hold at least one split_many batch)
+        """
+        if max_items < 1:
+            raise ValueError(f"Invalid max_items: {max_items}. Must be >= 1")
+        self.max_items: int = max_items
+        self.items: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def __str__(self) -> str:
+        return f"DistanceMemo(items={len(self.items)}, max_items={self.max_items})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+    def key(self, embedder: Embedder, buffer_size: int, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{embedder.model_name}:{embedder.dim}:{buffer_size}:{digest}"
+
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self.lock:
+            distances = self.items.get(key)
+            if distances is not None:
+                self.items.move_to_end(key)
+            return distances
+
+
+    def put(self, key: str, distances: np.ndarray) -> None:
+        with self.lock:
+            self.items[key] = distances
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+
+
+class SemanticSplitter():
+    """
+    Semantic chunking (the algorithm of langchain's SemanticChunker) on top of our Embedder, so sentence
+    embeddings go through the same batching, cache and rate limiting as everything else. Each sentence
+    is embedded together with its neighbours, the cosine distance between adjacent groups is computed
+    for the whole document at once, and a chunk starts wherever the distance exceeds the given
+    percentile (or the chunk would grow past chunk_size). The trailing sentences of a chunk that fit in
+    chunk_overlap are repeated at the start of the next one.
+
+    Distances are kept in a DistanceMemo, which can be shared between splitters, so re-chunking at
+    another chunk size reuses them instead of embedding again.
+    """
+    def __init__(
+            self,
+            embedder: Embedder,
+            chunk_size: int = 1000,
+            chunk_overlap: int = 0,
+            length_function: Callable[[str], int] = len,
+            breakpoint_percentile: float = 95.0,
+            buffer_size: int = 1,
+            memo: Optional[DistanceMemo] = None,
+        ) -> None:
+        """
+        Create a new SemanticSplitter
+
+        Args:
+            embedder: Embedder used for the sentence groups
+            chunk_size: Maximum size of chunks (a single longer sentence is kept whole)
+            chunk_overlap: Maximum size of the trailing sentences of a chunk repeated at the start of the next
+            length_function: Function that measures the length of sentences
+            breakpoint_percentile: Percentile of the adjacent distances above which a chunk ends
+            buffer_size: Number of neighbouring sentences on each side embedded with a sentence
+            memo: Optional DistanceMemo shared between splitters (a private one is created if not given)
+        """
+        if chunk_overlap < 0 or chunk_overlap >= chunk_size:
+            raise ValueError(f"Invalid chunk size/overlap: ({chunk_size}, {chunk_overlap}). Need 0 <= chunk_overlap < chunk_size")
+        self.embedder: Embedder = embedder
+        self.chunk_size: int = chunk_size
+        self.chunk_overlap: int = chunk_overlap
+        self.length_function: Callable[[str], int] = length_function
+        self.breakpoint_percentile: float = breakpoint_percentile
+        self.buffer_size: int = buffer_size
+        self.memo: DistanceMemo = DistanceMemo() if memo is None else memo
+
+
+    def __str__(self) -> str:
+        return f"SemanticSplitter(chunk_size={self.chunk_size}, breakpoint_percentile={self.breakpoint_percentile}, buffer_size={self.buffer_size})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def sentences(self, text: str) -> list[str]:
+        return [sentence for sentence in SENTENCE_PATTERN.split(text.strip()) if sentence]
+
+
+    def distances(self, texts: list[str]) -> list[tuple[list[str], np.ndarray]]:
+        """
+        Sentences and adjacent-group cosine distances of each text. The sentence groups of every text
+        not in the memo are embedded in one batch.
+        """
+        found: dict[str, np.ndarray] = {}
+        pending = []
+        for text in dict.fromkeys(texts):
+            distances = self.memo.get(self.memo.key(self.embedder, self.buffer_size, text))
+            if distances is None:
+                pending.append(text)
+            else:
+                found[text] = distances
+        if pending:
+            sentences = [self.sentences(text) for text in pending]
+            groups = [
+                " ".join(doc_sentences[max(0, i - self.buffer_size):i + self.buffer_size + 1])
+                for doc_sentences in sentences
+                for i in range(len(doc_sentences))
+            ]
+            embeddings = self.embedder.embed_batch(groups) if groups else np.empty((0, self.embedder.dim), dtype=np.float32)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.where(norms == 0, 1, norms)
+
+            start = 0
+            for text, doc_sentences in zip(pending, sentences):
+                doc_embeddings = embeddings[start:start + len(doc_sentences)]
+                start += len(doc_sentences)
+                found[text] = 1 - np.einsum("ij,ij->i", doc_embeddings[:-1], doc_embeddings[1:])
+                self.memo.put(self.memo.key(self.embedder, self.buffer_size, text), found[text])
+        return [(self.sentences(text), found[text]) for text in texts]
+
+
+    def pack(self, sentences: list[str], distances: np.ndarray) -> list[str]:
+        """
+        Group sentences into chunks at the semantic breakpoints, also breaking before chunk_size is exceeded.
+        Each chunk after the first starts with the trailing sentences of the previous one that fit in chunk_overlap
+        """
+        if not sentences:
+            return []
+        breaks = np.zeros(len(sentences), dtype=bool)
+        if len(distances):
+            breaks[1:] = distances > np.percentile(distances, self.breakpoint_percentile)
+        lengths = [self.length_function(sentence) for sentence in sentences]
+
+        chunks = []
+        current, current_lengths, current_length = [], [], 0
+        for sentence, length, is_break in zip(sentences, lengths, breaks.tolist()):
+            if current and (is_break or current_length + 1 + length > self.chunk_size):
+                chunks.append(" ".join(current))
+                # carry the trailing sentences that fit in the overlap (and leave room for this sentence)
+                carried, carried_length = 0, -1
+                for previous_length in reversed(current_lengths):
+                    extended = carried_length + 1 + previous_length
+                    if extended > self.chunk_overlap or extended + 1 + length > self.chunk_size:
+                        break
+                    carried, carried_length = carried + 1, extended
+                current = current[len(current) - carried:]
+                current_lengths = current_lengths[len(current_lengths) - carried:]
+                current_length = max(carried_length, 0)
+            current_length += length + (1 if current else 0)
+            current.append(sentence)
+            current_lengths.append(length)
+        chunks.append(" ".join(current))
+        return chunks
+
+
+    def split_texts(self, texts: list[str]) -> list[list[str]]:
+        """Chunk several texts, embedding all of their sentence groups together"""
+        return [self.pack(sentences, distances) for sentences, distances in self.distances(texts)]
+
+
+    def split_text(self, text: str) -> list[str]:
+        return self.split_texts([text])[0]
+
+
+    def create_documents(self, texts: list[str], metadatas: Optional[list[dict]] = None) -> list[LCDocument]:
+        """Same interface as the langchain text splitters"""
+        metadatas = metadatas or [{}] * len(texts)
+        return [
+            LCDocument(page_content=chunk, metadata=dict(metadata))
+            for chunks, metadata in zip(self.split_texts(texts), metadatas)
+            for chunk in chunks
+        ]
+
+
+# https://python.langchain.com/docs/modules/data_connection/document_transformers/
+strategies: dict[str, Union[RecursiveCharacterTextSplitter, CharacterTextSplitter, SemanticSplitter]] = {
+    "character": CharacterTextSplitter,           # split by single characters
+    "recursive": RecursiveCharacterTextSplitter,  # split list of chars to keep paragraphs, sentences, and then words together for as long as possible
+    "semantic":  SemanticSplitter,                # splits into sentences, embeds each with its neighbours, and breaks where adjacent groups are far apart in the embedding space
+}
+
+
 class Chunker():
     """
     Class to handle chunking of text
@@ -40,9 +313,11 @@ class Chunker():
         chunk_overlap: int = 200,
         strategy: str = "recursive",
         length_function: str = "char",
-        # keep_separator: bool = False,  # TODO: prob remove
         add_start_index: bool = False,
         strip_whitespace: bool = True,
+        embedder: Optional[Embedder] = None,
+        semantic_memo: Optional[DistanceMemo] = None,
+        metrics: Optional[Metrics] = None,
     ) -> None:
         """
         Create a new Chunker
@@ -52,46 +327,49 @@ class Chunker():
             chunk_overlap: Overlap in characters between chunks
             strategy: Strategy to use for splitting text
             length_function: Function that measures the length of given chunks (char or token)
-            keep_separator: Whether to keep the separator in the chunks
             add_start_index: If `True`, includes chunk's start index in metadata
             strip_whitespace: If `True`, strips whitespace from the start and end of
                               every document
+            embedder: Embedder for the sentence embeddings of the semantic strategy
+            semantic_memo: Optional DistanceMemo of sentence distances shared between semantic Chunkers
+                           (e.g. one per chunk size), see SemanticSplitter
+            metrics: Optional Metrics recording split times and document/chunk counts (disabled by default)
         """
         self.chunk_size: int = chunk_size
         self.chunk_overlap: int = chunk_overlap
         self.strategy: str = strategy.lower()
         self.length_function: str = length_function.lower()
-        # self.keep_separator: bool = keep_separator
         self.add_start_index: bool = add_start_index    
         self.strip_whitespace: bool = strip_whitespace
+        self.metrics: Metrics = metrics if metrics is not None else NULL_METRICS
+
+        # get length function
+        if self.length_function not in length_functions:
+            raise ValueError(f"Invalid length function: {self.length_function}. Valid length functions are: {', '.join(length_functions.keys())}")
+        self.token_length: Optional[TokenLength] = TokenLength() if self.length_function == "token" else None
+        length_function = self.token_length if self.token_length is not None else length_functions[self.length_function]
 
         # get text splitter
         if self.strategy in strategies:
             if self.strategy == "semantic":
+                if embedder is None:
+                    raise ValueError("The semantic strategy requires an embedder")
                 self.splitter = strategies[self.strategy](
+                            embedder,
                             chunk_size=self.chunk_size,
-                            chunk_overlap=self.overlap,
-                            length_function=length_functions[self.length_function],
-                            # normalize_function=normalize_l2,
-                            # api_key=api_key
+                            chunk_overlap=self.chunk_overlap,
+                            length_function=length_function,
+                            memo=semantic_memo,
                         )
             else:
                 self.splitter = strategies[self.strategy](
                                 chunk_size=self.chunk_size,
-                                chunk_overlap=self.overlap,
-                                length_function=length_functions[self.length_function],
+                                chunk_overlap=self.chunk_overlap,
+                                length_function=length_function,
                             )
         else:
-            raise ValueError(f"Invalid strategy: {self.strategy}. Valid strategies are: {", ".joinlist(strategies.keys())}")
-        
+            raise ValueError(f"Invalid strategy: {self.strategy}. Valid strategies are: {', '.join(strategies.keys())}")
 
-        self.splitter =  CharacterTextSplitter(
-                            separator="\n\n",
-                            chunk_size=self.chunk_size,
-                            chunk_overlap=self.overlap,
-                            length_function=length_functions[self.length_function],
-                            is_separator_regex=False,
-                        )
 
     def split(self, text):
         '''
@@ -102,11 +380,266 @@ class Chunker():
         print(documents[0])
         
         '''
-        return self.splitter.create_documents([text])
+        with self.metrics.timer("chunker.split_seconds", **self._tags()):
+            if self.token_length is None:
+                chunks = self.splitter.create_documents([text])
+            else:
+                try:
+                    self.token_length.bind(text)
+                    chunks = self.splitter.create_documents([text])
+                finally:
+                    self.token_length.unbind()
+        self._count([chunks])
+        return chunks
+
+
+    def _tags(self) -> dict[str, Any]:
+        if not self.metrics.enabled:
+            return {}
+        return {"strategy": self.strategy, "chunk_size": self.chunk_size, "length_function": self.length_function}
+
+
+    def _count(self, chunks: list[list]) -> None:
+        if self.metrics.enabled:
+            tags = self._tags()
+            self.metrics.count("chunker.documents", len(chunks), **tags)
+            self.metrics.count("chunker.chunks", sum(len(doc_chunks) for doc_chunks in chunks), **tags)
+
+
+    def split_many(self, texts: list[str]) -> list[list]:
+        """Split several texts; in token mode all of them are tokenized in a single batch"""
+        with self.metrics.timer("chunker.split_many_seconds", **self._tags()):
+            chunks = self._split_many(texts)
+        self._count(chunks)
+        return chunks
+
+
+    def _split_many(self, texts: list[str]) -> list[list]:
+        if self.strategy == "semantic":
+            # embed the sentence groups of all texts in one batch and pack each text from its distances
+            # (not from the memo, which may be smaller than the batch)
+            pairs = self.splitter.distances(texts)
+            split = lambda i, text: [LCDocument(page_content=chunk, metadata={}) for chunk in self.splitter.pack(*pairs[i])]
+        else:
+            split = lambda i, text: self.splitter.create_documents([text])
+        if self.token_length is None:
+            return [split(i, text) for i, text in enumerate(texts)]
+        all_tokens = get_encoding(self.token_length.encoding_name).encode_batch(texts, disallowed_special=())
+        chunks = []
+        try:
+            for i, (text, tokens) in enumerate(zip(texts, all_tokens)):
+                self.token_length.bind(text, tokens)
+                chunks.append(split(i, text))
+        finally:
+            self.token_length.unbind()
+        return chunks
     
 
     def split_code(self, text, lang: str = "py"):
         ...
 
     def chunk(self, data):
-        return [data[i:i+self.chunk_size] for i in range(0, len(data), self.chunk_size)]
\ No newline at end of file
+        return [data[i:i+self.chunk_size] for i in range(0, len(data), self.chunk_size)]
+
+
+# boundary strength after a word: paragraph break > line break > space (same preference order
+# as RecursiveCharacterTextSplitter's default separators)
+WORD_PATTERN = re.compile(r"\S+")
+PARAGRAPH, LINE, SPACE = 2, 1, 0
+
+
+def segment(text: str, length_function: str = "char", encoding_name: str = DEFAULT_ENCODING) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Segment a document once into words. Returns (starts, ends, lengths, levels): the character span
+    of each word, its length including the whitespace that follows it (in characters or tokens),
+    and the strength of the boundary after it.
+    """
+    spans = np.array([match.span() for match in WORD_PATTERN.finditer(text)], dtype=np.int64).reshape(-1, 2)
+    starts, ends = spans[:, 0], spans[:, 1]
+    # each word owns the whitespace up to the next word
+    next_starts = np.append(starts[1:], len(text))
+
+    levels = np.full(len(starts), SPACE, dtype=np.int8)
+    for i in np.flatnonzero(next_starts - ends > 0):
+        gap = text[ends[i]:next_starts[i]]
+        if "\n\n" in gap:
+            levels[i] = PARAGRAPH
+        elif "\n" in gap:
+            levels[i] = LINE
+
+    if length_function == "token":
+        # one tokenization per document: count the tokens starting inside each word's span
+        encoding = get_encoding(encoding_name)
+        _, offsets = encoding.decode_with_offsets(encoding.encode(text, disallowed_special=()))
+        offsets = np.asarray(offsets, dtype=np.int64)
+        bounds = np.searchsorted(offsets, np.append(starts, len(text)))
+        bounds[0] = 0
+        lengths = np.diff(bounds)
+    else:
+        lengths = next_starts - starts
+    return starts, ends, lengths, levels
+
+
+def pack_spans(
+        starts: np.ndarray,
+        ends: np.ndarray,
+        lengths: np.ndarray,
+        levels: np.ndarray,
+        chunk_size: int,
+        chunk_overlap: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Greedily pack a segmented document into chunks of at most chunk_size, cutting at the strongest
+    boundary in the second half of each chunk, with chunk_overlap carried into the next chunk.
+    Returns the (start, end) character offsets of the chunks.
+    """
+    n = len(starts)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    prefix = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lengths, out=prefix[1:])
+    # cut positions (exclusive word index) that follow a paragraph or a line break
+    strong = {level: np.flatnonzero(levels >= level) + 1 for level in (PARAGRAPH, LINE)}
+
+    chunk_starts, chunk_ends = [], []
+    i = 0
+    while i < n:
+        # furthest cut that fits (always at least one word so that oversized words still progress)
+        j = max(int(np.searchsorted(prefix, prefix[i] + chunk_size, side="right")) - 1, i + 1)
+        cut = j
+        if j < n:
+            for level in (PARAGRAPH, LINE):
+                positions = strong[level]
+                k = int(np.searchsorted(positions, j, side="right")) - 1
+                if k >= 0 and positions[k] > i and 2 * (prefix[positions[k]] - prefix[i]) >= chunk_size:
+                    cut = int(positions[k])
+                    break
+        chunk_starts.append(starts[i])
+        chunk_ends.append(ends[cut - 1])
+        if cut >= n:
+            break
+        # step back over as many words as fit in the overlap
+        i = max(int(np.searchsorted(prefix, prefix[cut] - chunk_overlap, side="left")), i + 1)
+    return np.asarray(chunk_starts, dtype=np.int64), np.asarray(chunk_ends, dtype=np.int64)
+
+
+class SpanSet():
+    """
+    Chunks of a chunk set stored as (doc_index, start, end) character offsets into the source
+    documents instead of copied strings
+    """
+    def __init__(self, doc_ids: list[str], doc_index: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> None:
+        self.doc_ids: list[str] = doc_ids
+        self.doc_index: np.ndarray = doc_index
+        self.starts: np.ndarray = starts
+        self.ends: np.ndarray = ends
+
+
+    def __str__(self) -> str:
+        return f"SpanSet(documents={len(self.doc_ids)}, chunks={len(self)})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+    def text(self, i: int, texts: list[str]) -> str:
+        """Materialize chunk i from the source texts (aligned with doc_ids)"""
+        return texts[self.doc_index[i]][self.starts[i]:self.ends[i]]
+
+
+    def texts(self, texts: list[str]):
+        """Iterate over the chunk strings, materializing one at a time"""
+        for doc, start, end in zip(self.doc_index.tolist(), self.starts.tolist(), self.ends.tolist()):
+            yield texts[doc][start:end]
+
+
+def _span_documents(args: tuple) -> dict[tuple[int, int], tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Worker: segment a block of documents once and pack them for every (chunk_size, chunk_overlap)"""
+    offset, texts, configs, length_function, encoding_name = args
+    spans = {config: ([], [], []) for config in configs}
+    for doc, text in enumerate(texts, start=offset):
+        segments = segment(text, length_function, encoding_name)
+        for config in configs:
+            starts, ends = pack_spans(*segments, *config)
+            doc_index, all_starts, all_ends = spans[config]
+            doc_index.append(np.full(len(starts), doc, dtype=np.int32))
+            all_starts.append(starts)
+            all_ends.append(ends)
+    return {
+        config: tuple(np.concatenate(parts) if parts else np.empty(0, dtype=np.int64) for parts in arrays)
+        for config, arrays in spans.items()
+    }
+
+
+class SweepChunker():
+    """
+    Chunking engine for chunk size sweeps: every document is segmented (and tokenized) once and the
+    shared segmentation is packed into a chunk set for every requested (chunk_size, chunk_overlap)
+    """
+    def __init__(
+        self,
+        configs: list[tuple[int, int]],
+        length_function: str = "char",
+        encoding_name: str = DEFAULT_ENCODING,
+        max_workers: Optional[int] = None,
+        docs_per_task: int = 256,
+    ) -> None:
+        """
+        Create a new SweepChunker
+
+        Args:
+            configs: (chunk_size, chunk_overlap) pairs to produce
+            length_function: Unit of chunk_size and chunk_overlap (char or token)
+            encoding_name: tiktoken encoding used in token mode
+            max_workers: Number of worker processes (None or 1 to chunk in this process)
+            docs_per_task: Number of documents sent to a worker at a time
+        """
+        if length_function not in length_functions:
+            raise ValueError(f"Invalid length function: {length_function}. Valid length functions are: {', '.join(length_functions.keys())}")
+        for chunk_size, chunk_overlap in configs:
+            if chunk_size < 1 or chunk_overlap < 0 or chunk_overlap >= chunk_size:
+                raise ValueError(f"Invalid chunk size/overlap: ({chunk_size}, {chunk_overlap}). Need 0 <= chunk_overlap < chunk_size")
+        self.configs: list[tuple[int, int]] = list(dict.fromkeys(configs))
+        self.length_function: str = length_function
+        self.encoding_name: str = encoding_name
+        self.max_workers: Optional[int] = max_workers
+        self.docs_per_task: int = docs_per_task
+
+
+    def __str__(self) -> str:
+        return f"SweepChunker(configs={self.configs}, length_function={self.length_function})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def split(self, doc_ids: list[str], texts: list[str]) -> dict[tuple[int, int], SpanSet]:
+        """Chunk every document for every config. Returns a SpanSet per (chunk_size, chunk_overlap)"""
+        if len(doc_ids) != len(texts):
+            raise ValueError(f"Got {len(doc_ids)} document ids and {len(texts)} texts")
+        tasks = [
+            (start, texts[start:start + self.docs_per_task], self.configs, self.length_function, self.encoding_name)
+            for start in range(0, len(texts), self.docs_per_task)
+        ]
+        if self.max_workers is None or self.max_workers == 1 or len(tasks) <= 1:
+            results = [_span_documents(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(_span_documents, tasks))
+
+        span_sets = {}
+        for config in self.configs:
+            parts = [result[config] for result in results]
+            span_sets[config] = SpanSet(
+                doc_ids,
+                np.concatenate([part[0] for part in parts]).astype(np.int32) if parts else np.empty(0, dtype=np.int32),
+                np.concatenate([part[1] for part in parts]).astype(np.int64) if parts else np.empty(0, dtype=np.int64),
+                np.concatenate([part[2] for part in parts]).astype(np.int64) if parts else np.empty(0, dtype=np.int64),
+            )
+        return span_sets
@@ -1,8 +1,75 @@
+import json
 import time
+import random
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .cache import QueryCache, query_key
 from .embedder import Embedder
-from .document import Document
+from .document import Document, DocumentBatch
+from .metrics import Metrics, NULL_METRICS
 from pinecone import Pinecone, ServerlessSpec
-from typing import Union
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+if TYPE_CHECKING:
+    # only for annotations: chunk_store imports the chunker and its text splitters
+    from .chunk_store import ChunkSet
+
+
+# request limits of the upsert endpoint
+MAX_UPSERT_VECTORS: int = 1000
+MAX_UPSERT_BYTES: int = 2 * 1024 * 1024
+BYTES_PER_VALUE: int = 22       # upper bound on a serialized float32 value, e.g. "-0.012345678901234567, "
+
+
+def estimate_record_bytes(record: dict[str, any]) -> int:
+    """Estimate the serialized size of one Pinecone record without serializing its values"""
+    values = record.get("values") or []
+    return len(record["id"]) + BYTES_PER_VALUE * len(values) + len(json.dumps(record.get("metadata") or {})) + 64
+
+
+def estimate_batch_bytes(batch: DocumentBatch, include_text: bool = True) -> list[int]:
+    """
+    estimate_record_bytes of every record of an embedded DocumentBatch, from the matrix shape and the
+    id and metadata sizes, without building the records (or converting any vector to a list)
+    """
+    values_bytes = BYTES_PER_VALUE * batch.embeddings.shape[1]
+    sizes = []
+    for i, id in enumerate(batch.ids):
+        metadata = {"source": batch.source(i), "text": batch.text(i)} if include_text else {"source": batch.source(i)}
+        sizes.append(len(id) + values_bytes + len(json.dumps(metadata)) + 64)
+    return sizes
+
+
+def plan_upsert_ranges(
+        sizes: list[int],
+        ids: list[str],
+        max_vectors: int = MAX_UPSERT_VECTORS,
+        max_bytes: int = MAX_UPSERT_BYTES,
+    ) -> list[tuple[int, int]]:
+    """Split records of the given estimated sizes into consecutive (start, end) ranges under both the vector count and payload size limits"""
+    ranges: list[tuple[int, int]] = []
+    start, batch_bytes = 0, 0
+    for i, record_bytes in enumerate(sizes):
+        if record_bytes > max_bytes:
+            raise ValueError(f"Record {ids[i]} is about {record_bytes} bytes, over the {max_bytes} byte request limit")
+        if i > start and (i - start == max_vectors or batch_bytes + record_bytes > max_bytes):
+            ranges.append((start, i))
+            start, batch_bytes = i, 0
+        batch_bytes += record_bytes
+    if start < len(sizes):
+        ranges.append((start, len(sizes)))
+    return ranges
+
+
+def plan_upsert_batches(
+        records: list[dict[str, any]],
+        max_vectors: int = MAX_UPSERT_VECTORS,
+        max_bytes: int = MAX_UPSERT_BYTES,
+    ) -> list[list[dict[str, any]]]:
+    """Split records into consecutive batches that stay under both the vector count and payload size limits"""
+    ranges = plan_upsert_ranges([estimate_record_bytes(record) for record in records], [record["id"] for record in records], max_vectors, max_bytes)
+    return [records[start:end] for start, end in ranges]
 
 
 class PineconeDB():
@@ -12,20 +79,40 @@ class PineconeDB():
     def __init__(
             self, 
             client: Pinecone = None,
+            ttl: float = 300.0,
+            metrics: Optional[Metrics] = None,
+            query_cache: Optional[QueryCache] = None,
         ) -> None:
         """
         Create a new PineconeDB connection
         
         Args:
             client: Pinecone client
+            ttl: Seconds before cached index metadata (dimension, metric, namespaces) is re-fetched
+            metrics: Optional Metrics recording request counts, latencies and retries (disabled by default)
+            query_cache: Optional QueryCache memoizing query_ids results, invalidated by every write made here
         """
         if client is None:
             raise ValueError("Pinecone client is required")
         self.client: Pinecone = client      
+        self.ttl: float = ttl
+        self.metrics: Metrics = metrics if metrics is not None else NULL_METRICS
+        self.query_cache: Optional[QueryCache] = query_cache
+        # serializes index creation between threads (e.g. concurrent upserts into new namespaces of one index)
+        self.lock = threading.Lock()
+
+        # create cache to minimize API calls: map index names to Pinecone.Index objects + metadata
+        # each index has format: {"index_name": {"index": Pinecone.Index, "namespaces": {namespace1, ...}, 
+        #                                        "dimension": int, "metric": str, "expires": float,
+        #                                        "written": {namespace: float}}}
+        # "written" holds the monotonic time of our last write to each namespace: index stats lag behind
+        # writes, so those namespaces are kept in "namespaces" for ttl seconds even if the stats miss them
+        self.indexes: dict[str, dict[str, Union[Pinecone.Index, set[str], int, str, float]]] = {}
 
-        # create cache to minimize API calls: map index names to Pinecone.Index objects + list of namespaces
-        # each index has format: {"index_name": {"index": Pinecone.Index, "namespaces": [namespace1, namespace2, ...]}}
-        self.indexes: dict[str, dict[str, Union[Pinecone.Index, list[str]]]] = {}
+        # cached result of list_indexes() and the (index_name, dim, metric) pairs already validated
+        self.index_names: set[str] = set()
+        self.index_names_expires: float = 0.0
+        self.validated: set[tuple[str, int, str]] = set()
 
 
     def __str__(self) -> str:
@@ -42,26 +129,102 @@ class PineconeDB():
         return self.__str__()
 
 
+    def list_indexes(self, refresh: bool = False) -> set[str]:
+        """Names of the indexes in the database, cached for ttl seconds"""
+        if refresh or time.monotonic() >= self.index_names_expires:
+            self.metrics.count("db.requests", operation="list_indexes")
+            self.index_names = set(self.client.list_indexes().names())
+            self.index_names_expires = time.monotonic() + self.ttl
+        return self.index_names
+
+
     def get_index(self, index_name: str, embedder: Embedder) -> Pinecone.Index:
         """Get or create an index object"""
-        if index_name not in self.indexes:
-            # if not cached, check if it exists in the database
-            if index_name not in self.client.list_indexes().names():
-                # if not in the database, create it
-                self.create_index(index_name, embedder)
+        if index_name in self.indexes:
+            return self.indexes[index_name]["index"]
+        with self.lock:
+            if index_name not in self.indexes:
+                # if not cached, check if it exists in the database
+                if index_name not in self.list_indexes():
+                    # if not in the database, create it
+                    self.create_index(index_name, embedder)
+
+            if index_name not in self.indexes:
+                # create a new index object and add it to the cache (metadata is fetched on first use)
+                self.indexes[index_name] = {
+                    "index": self.client.Index(index_name),
+                    "namespaces": set(),
+                    "dimension": None,
+                    "metric": None,
+                    "expires": 0.0,
+                    "written": {}
+                }
+        return self.indexes[index_name]["index"]
+
 
-            # create a new index object and add it to the cache
-            index = self.client.Index(index_name)
+    def describe(self, index_name: str, refresh: bool = False) -> dict[str, Union[Pinecone.Index, set[str], int, str, float]]:
+        """Cached dimension, metric and namespaces of an existing index, re-fetched after ttl seconds or on refresh"""
+        if index_name not in self.indexes:
+            if index_name not in self.list_indexes(refresh=refresh):
+                raise ValueError(f"Index {index_name} does not exist")
             self.indexes[index_name] = {
-                "index": index,
-                "namespaces": []
+                "index": self.client.Index(index_name),
+                "namespaces": set(),
+                "dimension": None,
+                "metric": None,
+                "expires": 0.0,
+                "written": {}
             }
-        return self.indexes[index_name]["index"]
+        entry = self.indexes[index_name]
+        if refresh or time.monotonic() >= entry["expires"]:
+            self.metrics.count("db.requests", 2, operation="describe", index=index_name)
+            try:
+                index_description = self.client.describe_index(index_name)
+                index_stats = entry["index"].describe_index_stats()
+            except Exception as e:
+                raise ValueError(f"Error retrieving index information: {str(e)}")
+            entry["dimension"] = index_description.dimension
+            entry["metric"] = index_description.metric
+            now = time.monotonic()
+            entry["written"] = {namespace: written for namespace, written in entry["written"].items() if now - written < self.ttl}
+            entry["namespaces"] = set(index_stats["namespaces"].keys()) | entry["written"].keys()
+            entry["expires"] = now + self.ttl
+        return entry
+
+
+    def refresh(self, index_name: str = None) -> None:
+        """Drop cached metadata for one index (or all of them) so it is re-fetched on next use"""
+        self.index_names_expires = 0.0
+        for name, entry in self.indexes.items():
+            if index_name is None or name == index_name:
+                entry["expires"] = 0.0
+        self.validated = {key for key in self.validated if index_name is not None and key[0] != index_name}
+
+
+    def validate(self, index_name: str, namespace: str, embedder: Embedder) -> Pinecone.Index:
+        """
+        Ensure that the embedder is compatible with the index and that the namespace exists. The
+        dim/metric check runs once per (index, embedder) pair; namespaces are checked against the cache.
+        """
+        entry = self.describe(index_name)
+        key = (index_name, embedder.dim, embedder.metric)
+        if key not in self.validated:
+            if embedder.dim != entry["dimension"]:
+                raise ValueError(f"Embedder dimension {embedder.dim} does not match index dimension {entry['dimension']}")
+            if embedder.metric != entry["metric"]:
+                raise ValueError(f"Embedder metric {embedder.metric} does not match index metric {entry['metric']}")
+            self.validated.add(key)
+        if namespace not in entry["namespaces"]:
+            # the namespace may have been created elsewhere since the last fetch
+            entry = self.describe(index_name, refresh=True)
+            if namespace not in entry["namespaces"]:
+                raise ValueError(f"Namespace {namespace} does not exist in index {index_name}")
+        return entry["index"]
 
 
     def create_index(self, index_name: str, embedder: Embedder) -> None:
         """Create a new index in Pinecone"""
-        if index_name not in self.client.list_indexes().names():
+        if index_name not in self.list_indexes(refresh=True):
             print(f"Creating index {index_name}...")
             try:
                 self.client.create_index(
@@ -77,10 +240,15 @@ class PineconeDB():
                 while not self.client.describe_index(index_name).status['ready']:
                     time.sleep(1)
 
-                # add index to cache
+                # add index to cache: a new index has no namespaces yet
+                self.index_names.add(index_name)
                 self.indexes[index_name] = {
                     "index": self.client.Index(index_name),
-                    "namespaces": []
+                    "namespaces": set(),
+                    "dimension": embedder.dim,
+                    "metric": embedder.metric,
+                    "expires": time.monotonic() + self.ttl,
+                    "written": {}
                 }
             except Exception as e:
                 print(f"Error creating index {index_name}: {str(e)}")
@@ -92,126 +260,462 @@ class PineconeDB():
     def delete_index(self, index_name: str) -> None:
         """Delete an existing index in Pinecone"""
         # check that index is cached first before making api call to check if it exists
-        if index_name in self.indexes or index_name in self.client.list_indexes().names():
+        if index_name in self.indexes or index_name in self.list_indexes(refresh=True):
             print(f"Deleting index {index_name}...")
             try:
                 # remove index from cache if present
                 if index_name in self.indexes:
                     del self.indexes[index_name]
+                self.index_names.discard(index_name)
+                self.validated = {key for key in self.validated if key[0] != index_name}
                 # delete index from db
                 self.client.delete_index(index_name)
             except Exception as e:
                 print(f"Error deleting index {index_name}: {str(e)}")
                 raise
+            finally:
+                self._invalidate(index_name)
         else:
             print(f"Index {index_name} does not exist -- cannot delete")
 
 
+    def delete(self, index_name: str, namespace: str, ids: list[str]) -> None:
+        """Delete vectors by id from a namespace"""
+        try:
+            index: Pinecone.Index = self.describe(index_name)["index"]
+            index.delete(ids=ids, namespace=namespace)
+        except Exception as e:
+            print(f"Error deleting vectors from index {index_name} in namespace {namespace}: {str(e)}")
+            raise
+        finally:
+            self._invalidate(index_name, namespace)
+        # the namespace disappears once it is empty, so re-fetch on next use and trust the stats
+        self.indexes[index_name]["expires"] = 0.0
+        self.indexes[index_name]["written"].pop(namespace, None)
+
+
+    def delete_namespace(self, index_name: str, namespace: str) -> None:
+        """Delete every vector in a namespace"""
+        try:
+            index: Pinecone.Index = self.describe(index_name)["index"]
+            index.delete(delete_all=True, namespace=namespace)
+        except Exception as e:
+            print(f"Error deleting namespace {namespace} from index {index_name}: {str(e)}")
+            raise
+        finally:
+            self._invalidate(index_name, namespace)
+        self.indexes[index_name]["namespaces"].discard(namespace)
+        self.indexes[index_name]["written"].pop(namespace, None)
+
+
+    def _written(self, index_name: str, namespace: str) -> None:
+        """Record a write to a namespace, so it counts as existing until the index stats catch up"""
+        entry = self.indexes[index_name]
+        entry["namespaces"].add(namespace)
+        entry["written"][namespace] = time.monotonic()
+
+
+    def _invalidate(self, index_name: str, namespace: Optional[str] = None) -> None:
+        """Mark cached query results of a namespace (or a whole index) as stale after a write, even a failed one"""
+        if self.query_cache is not None:
+            self.query_cache.invalidate(index_name, namespace)
+
+
     def format_doc(self, doc: Document, embedder: Embedder) -> dict[str, str]:
         """Format a document as a Pinecone entry"""
-        embedding: list[float] = embedder.embed_text(doc.text)
+        embedding: list[float] = embedder.embed_text(doc.text).tolist()
         return doc.to_dict(embedding)
     
 
-    def format_batch_docs(self, docs: list[Document], embedder: Embedder) -> list[dict[str, str]]:
-        """Format a batch of documents as Pinecone entries"""
-        embeddings: list[list[float]] = embedder.embed_batch([doc.text for doc in docs])
-        return [self.format_data(doc, embedding) for doc, embedding in zip(docs, embeddings)]
+    def format_batch_docs(
+            self,
+            docs: Union[list[Document], DocumentBatch],
+            embedder: Embedder,
+            embeddings: np.ndarray = None,
+            include_text: bool = True,
+        ) -> list[dict[str, str]]:
+        """
+        Format a batch of documents as Pinecone entries. Precomputed embeddings (e.g. from Embedder.embed_dims)
+        are used as is. Without text the metadata only holds the source (see DocumentBatch.to_records)
+        """
+        return self.embedded_batch(docs, embedder, embeddings).to_records(include_text)
+
+
+    def embedded_batch(self, docs: Union[list[Document], DocumentBatch], embedder: Embedder, embeddings: np.ndarray = None) -> DocumentBatch:
+        """Documents as a DocumentBatch with its (len(docs), dim) embedding matrix, computed with the embedder unless given or attached"""
+        batch = DocumentBatch.from_documents(docs)
+        if embeddings is None:
+            embeddings = batch.embeddings if batch.embeddings is not None else embedder.embed_batch(batch.texts())
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape != (len(batch), embedder.dim):
+            raise ValueError(f"Embeddings shape {embeddings.shape} does not match ({len(batch)}, {embedder.dim})")
+        return batch.with_embeddings(embeddings)
 
 
     def upsert_doc(self, index_name: str, namespace: str, embedder: Embedder, doc: Document) -> None:
         """Store an embedding in Pinecone"""
         try:
-            index: Pinecone.Index = self.get_index(index_name)
+            index: Pinecone.Index = self.get_index(index_name, embedder)
             data: dict[str, str] = self.format_doc(doc, embedder)
             index.upsert([data], namespace=namespace)
+            self._written(index_name, namespace)
         except Exception as e:
             print(f"Error upserting document to index {index_name} in namespace {namespace}: {str(e)}")
             raise
+        finally:
+            self._invalidate(index_name, namespace)
 
 
-    def upsert_batch(self, index_name: str, namespace: str, embedder: Embedder, docs: list[Document]) -> None:
-        """Store a batch of embeddings in Pinecone"""
+    def upsert_batch(
+            self,
+            index_name: str,
+            namespace: str,
+            embedder: Embedder,
+            docs: Union[list[Document], DocumentBatch],
+            embeddings: np.ndarray = None,
+            include_text: bool = True,
+        ) -> None:
+        """Store a batch of embeddings in Pinecone. Embeddings are computed with the embedder unless given"""
+        self.upsert_bulk(index_name, namespace, embedder, docs, embeddings, include_text=include_text)
+
+
+    def _upsert_with_retry(
+            self,
+            index: Pinecone.Index,
+            namespace: str,
+            batch: DocumentBatch,
+            start: int,
+            end: int,
+            include_text: bool,
+            max_retries: int,
+            tags: Optional[dict[str, Any]] = None,
+        ) -> int:
+        """
+        Upsert rows start:end of an embedded batch, retrying with jittered exponential backoff. Upserts are
+        idempotent by id. The records (and vector lists) of the request are only built here, so at most one
+        request's worth exists per worker. Returns the number of retries. Metrics are recorded with the given
+        tags, since this may run on a worker thread
+        """
+        tags = tags or {}
+        records = batch.to_records(include_text, start, end)
+        for attempt in range(max_retries + 1):
+            try:
+                with self.metrics.timer("db.upsert_request_seconds", **tags):
+                    index.upsert(records, namespace=namespace)
+                self.metrics.count("db.requests", operation="upsert", **tags)
+                return attempt
+            except Exception as e:
+                self.metrics.count("db.errors", operation="upsert", **tags)
+                if attempt == max_retries:
+                    raise
+                self.metrics.count("db.retries", operation="upsert", **tags)
+                delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"Retrying upsert of {len(records)} vectors in namespace {namespace} in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+
+
+    def upsert_bulk(
+            self,
+            index_name: str,
+            namespace: str,
+            embedder: Embedder,
+            docs: Union[list[Document], DocumentBatch],
+            embeddings: np.ndarray = None,
+            max_vectors: int = MAX_UPSERT_VECTORS,
+            max_bytes: int = MAX_UPSERT_BYTES,
+            max_workers: int = 8,
+            max_retries: int = 3,
+            include_text: bool = True,
+        ) -> dict[str, float]:
+        """
+        Store any number of documents: records are split into batches under the request limits and
+        sent concurrently, and failed batches are retried.
+
+        Args:
+            index_name: Name of the index (created with the embedder's dim and metric if missing)
+            namespace: Namespace to upsert into
+            embedder: Embedder used for the index and to embed the docs if embeddings are not given
+            docs: Documents to store, as Documents or a DocumentBatch
+            embeddings: Optional precomputed (len(docs), dim) matrix (defaults to the batch's embeddings)
+            max_vectors: Maximum number of vectors per request
+            max_bytes: Maximum estimated payload size per request
+            max_workers: Maximum number of requests in flight
+            max_retries: Retries per batch before giving up
+            include_text: If `False`, only ids, vectors and sources are stored and the text is hydrated
+                          locally at query time (see query_batch), which keeps payloads and metadata small
+
+        Returns:
+            Stats with the number of vectors, batches and retries, the elapsed seconds and vectors/sec
+        """
+        start = time.perf_counter()
+        tags = {**self.metrics.context(), "index": index_name, "namespace": namespace} if self.metrics.enabled else None
         try:
-            index: Pinecone.Index = self.get_index(index_name)
-            data: list[dict[str, str]] = self.format_batch_docs(docs, embedder)
-            index.upsert(data, namespace=namespace)
+            index: Pinecone.Index = self.get_index(index_name, embedder)
+            batch = self.embedded_batch(docs, embedder, embeddings)
+            # request boundaries are planned from sizes, the records of each request are built when it is sent
+            ranges = plan_upsert_ranges(estimate_batch_bytes(batch, include_text), batch.ids, max_vectors, max_bytes)
+
+            retries = 0
+            if len(ranges) == 1 or max_workers == 1:
+                for start_row, end_row in ranges:
+                    retries += self._upsert_with_retry(index, namespace, batch, start_row, end_row, include_text, max_retries, tags)
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    futures = [
+                        pool.submit(self._upsert_with_retry, index, namespace, batch, start_row, end_row, include_text, max_retries, tags)
+                        for start_row, end_row in ranges
+                    ]
+                    for future in as_completed(futures):
+                        retries += future.result()
+            if len(batch):
+                self._written(index_name, namespace)
         except Exception as e:
             print(f"Error upserting batch of documents to index {index_name} in namespace {namespace}: {str(e)}")
             raise
+        finally:
+            # batches may have landed before a failure
+            self._invalidate(index_name, namespace)
+
+        elapsed = time.perf_counter() - start
+        if self.metrics.enabled:
+            self.metrics.observe("db.upsert_seconds", elapsed, **tags)
+            self.metrics.count("db.vectors_upserted", len(batch), **tags)
+        return {
+            "vectors": len(batch),
+            "batches": len(ranges),
+            "retries": retries,
+            "seconds": elapsed,
+            "vectors_per_second": len(batch) / elapsed if elapsed > 0 else 0.0
+        }
 
 
     # https://github.com/langchain-ai/langchain/blob/master/libs/partners/pinecone/langchain_pinecone/vectorstores.py
     # https://docs.pinecone.io/reference/describe_index_stats
     # https://docs.pinecone.io/reference/describe_index
-    def query(self, index_name: str, namespace: str, query: str, embedder: Embedder, top_k: int = 5) -> list[Document]:
-        """Query Pinecone for similar embeddings. Returns list of top_k Documents in the database."""
-        try:
-            index = self.get_index(index_name)
-            index_description = self.client.describe_index(index_name)
-            index_stats = index.describe_index_stats()
-        except Exception as e:
-            raise ValueError(f"Error retrieving index information: {str(e)}")
-
-        # ensure that the embedder is compatible with the index and that the namespace exists
-        if embedder.dim != index_description.dimension:
-            raise ValueError(f"Embedder dimension {embedder.dim} does not match index dimension {index_description.dimension}")
-        if embedder.metric != index_description.metric:
-            raise ValueError(f"Embedder metric {embedder.metric} does not match index metric {index_description.metric}")
-        if namespace not in index_stats["namespaces"].keys():
-            raise ValueError(f"Namespace {namespace} does not exist in index {index_name}")
-
-        # get the top_k matches
-        matches = index.query(
-            namespace=namespace,
-            vector=embedder.embed_text(query),
-            top_k=top_k
-        )["matches"]
-
-        # format the matches as Document objects
-        return [
-            Document(
-                source = match["metadata"]["source"],
-                text = match["metadata"]["text"],
-                id = match["id"]
-            )
-            for match in matches
-        ]
-    
+    def query(self, index_name: str, namespace: str, query: str, embedder: Embedder, top_k: int = 5) -> DocumentBatch:
+        """Query Pinecone for similar embeddings. Returns the top_k Documents in the database as a DocumentBatch."""
+        return self.query_batch(index_name, namespace, [query], embedder, top_k)[0]
 
-    def query_batch(self, index_name: str, namespace: str, queries: list[str], embedder: Embedder, top_k: int = 5) -> list[list[Document]]:
-        """Query Pinecone for similar embeddings. Returns a list of lists of top_k Documents for each query."""
-        try:
-            index = self.get_index(index_name)
-            index_description = self.client.describe_index(index_name)
-            index_stats = index.describe_index_stats()
-        except Exception as e:
-            raise ValueError(f"Error retrieving index information: {str(e)}")
-
-        # ensure that the embedder is compatible with the index and that the namespace exists
-        if embedder.dim != index_description.dimension:
-            raise ValueError(f"Embedder dimension {embedder.dim} does not match index dimension {index_description.dimension}")
-        if embedder.metric != index_description.metric:
-            raise ValueError(f"Embedder metric {embedder.metric} does not match index metric {index_description.metric}")
-        if namespace not in index_stats["namespaces"].keys():
-            raise ValueError(f"Namespace {namespace} does not exist in index {index_name}")
-
-        # get the top_k matches for each query
-        matches_list = index.query(
-            namespace=namespace,
-            queries=embedder.embed_batch(queries),
-            top_k=top_k
+
+    def _query_matches(
+            self,
+            index: Pinecone.Index,
+            namespace: str,
+            vector: list[float],
+            top_k: int,
+            include_metadata: bool,
+            tags: Optional[dict[str, Any]] = None,
+        ) -> list[dict[str, any]]:
+        """Run one query and return its matches"""
+        tags = tags or {}
+        with self.metrics.timer("db.query_request_seconds", **tags):
+            matches = index.query(
+                namespace=namespace,
+                vector=vector,
+                top_k=top_k,
+                include_metadata=include_metadata
+            )["matches"]
+        self.metrics.count("db.requests", operation="query", **tags)
+        return matches
+
+
+    def _query_vector(self, index: Pinecone.Index, namespace: str, vector: list[float], top_k: int, tags: Optional[dict[str, Any]] = None) -> DocumentBatch:
+        """Run one query and hydrate its matches into a DocumentBatch"""
+        matches = self._query_matches(index, namespace, vector, top_k, True, tags)
+        if any("text" not in (match.get("metadata") or {}) for match in matches):
+            raise ValueError(f"Matches in namespace {namespace} have no text metadata (upserted with include_text=False): pass a store to hydrate them")
+        return DocumentBatch.from_columns(
+            [match["id"] for match in matches],
+            (match["metadata"]["source"] for match in matches),
+            (match["metadata"]["text"] for match in matches)
         )
 
-        # format the matches as Document objects
-        return [
-            [
-                Document(
-                    source=match["metadata"]["source"],
-                    text=match["metadata"]["text"],
-                    id=match["id"]
-                )
-                for match in matches
-            ]
-            for matches in matches_list
-        ]
\ No newline at end of file
+
+    def query_batch(
+            self,
+            index_name: str,
+            namespace: str,
+            queries: list[str],
+            embedder: Embedder,
+            top_k: int = 5,
+            max_workers: int = 8,
+            store: Optional["ChunkSet"] = None,
+        ) -> list[DocumentBatch]:
+        """
+        Query Pinecone for similar embeddings. The queries are embedded in one batch and sent concurrently
+        (the query endpoint takes one vector per request). Returns a DocumentBatch of the top_k Documents for each query.
+
+        With a store (a ChunkSet, or a DataPreprocessor for document ids) the matches are fetched without
+        metadata through query_ids (and its query cache) and their text is read from the local store instead,
+        as needed for namespaces upserted with include_text=False.
+        """
+        if store is not None:
+            ids, _ = self.query_ids(index_name, namespace, queries, embedder, top_k, max_workers)
+            return [store.batch(query_ids) for query_ids in ids]
+
+        # ensure that the embedder is compatible with the index and that the namespace exists (cached)
+        index = self.validate(index_name, namespace, embedder)
+        tags = self._tags(index_name, namespace)
+        with self.metrics.timer("db.query_seconds", **(tags or {})):
+            vectors = embedder.embed_batch(queries).tolist()
+            if len(vectors) == 1 or max_workers == 1:
+                results = [self._query_vector(index, namespace, vector, top_k, tags) for vector in vectors]
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    results = list(pool.map(lambda vector: self._query_vector(index, namespace, vector, top_k, tags), vectors))
+        self.metrics.count("db.queries", len(queries), **(tags or {}))
+        return results
+
+
+    def _tags(self, index_name: str, namespace: str) -> Optional[dict[str, Any]]:
+        """Metric tags of a query, captured on the calling thread for the worker threads"""
+        return {**self.metrics.context(), "index": index_name, "namespace": namespace} if self.metrics.enabled else None
+
+
+    def _cached_results(
+            self,
+            index_name: str,
+            namespace: str,
+            queries: list[str],
+            embedder: Embedder,
+            top_k: int,
+        ) -> tuple[list[str], list[Optional[tuple[list[str], np.ndarray]]], dict[str, list[int]], int]:
+        """
+        Look queries up in the query cache. Returns the key of each query, the cached results (None for
+        misses), the positions of each distinct miss by key and the namespace version
+        """
+        version = 0
+        if self.query_cache is not None:
+            version = self.query_cache.version(index_name, namespace)
+            keys = [query_key(index_name, namespace, embedder.model_name, embedder.dim, top_k, version, query) for query in queries]
+            results = self.query_cache.get_many(keys)
+        else:
+            keys = list(queries)
+            results = [None] * len(queries)
+        misses: dict[str, list[int]] = {}
+        for i, result in enumerate(results):
+            if result is None:
+                misses.setdefault(keys[i], []).append(i)
+        if self.metrics.enabled:
+            tags = self._tags(index_name, namespace)
+            self.metrics.count("db.queries", len(queries), **tags)
+            self.metrics.count("db.query_cache_hits", len(queries) - sum(len(positions) for positions in misses.values()), **tags)
+        return keys, results, misses, version
+
+
+    def _store_results(
+            self,
+            index_name: str,
+            namespace: str,
+            version: int,
+            results: list[Optional[tuple[list[str], np.ndarray]]],
+            misses: dict[str, list[int]],
+            fetched: list[tuple[list[str], np.ndarray]],
+        ) -> None:
+        """Fill the fetched results of the distinct misses in and add them to the query cache"""
+        for positions, result in zip(misses.values(), fetched):
+            for i in positions:
+                results[i] = result
+        if self.query_cache is not None:
+            self.query_cache.put_many(index_name, namespace, version, list(misses.keys()), fetched)
+
+
+    def _search_ids(self, index: Pinecone.Index, namespace: str, vector: list[float], top_k: int, tags: Optional[dict[str, Any]]) -> tuple[list[str], np.ndarray]:
+        """Run one query without metadata. Returns the match ids and float32 scores"""
+        matches = self._query_matches(index, namespace, vector, top_k, False, tags)
+        return [match["id"] for match in matches], np.array([match["score"] for match in matches], dtype=np.float32)
+
+
+    def _run_searches(self, searches: list[tuple], max_workers: int) -> list[tuple[list[str], np.ndarray]]:
+        """Run _search_ids for each argument tuple with at most max_workers requests in flight"""
+        if len(searches) == 1 or max_workers == 1:
+            return [self._search_ids(*args) for args in searches]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda args: self._search_ids(*args), searches))
+
+
+    def query_ids(
+            self,
+            index_name: str,
+            namespace: str,
+            queries: list[str],
+            embedder: Embedder,
+            top_k: int = 5,
+            max_workers: int = 8,
+        ) -> tuple[list[list[str]], list[np.ndarray]]:
+        """
+        Ids and scores of the top_k matches of each query, fetched without metadata (what evaluation needs).
+        With a query_cache the results are memoized per (index, namespace, query, embedder, top_k, content
+        version): only the distinct queries missing from the cache are embedded and sent.
+
+        Returns:
+            The match ids of each query and a float32 array of their scores
+        """
+        index = self.validate(index_name, namespace, embedder)
+        tags = self._tags(index_name, namespace)
+        keys, results, misses, version = self._cached_results(index_name, namespace, queries, embedder, top_k)
+        if misses:
+            vectors = embedder.embed_batch([queries[positions[0]] for positions in misses.values()]).tolist()
+            with self.metrics.timer("db.query_seconds", **(tags or {})):
+                fetched = self._run_searches([(index, namespace, vector, top_k, tags) for vector in vectors], max_workers)
+            self._store_results(index_name, namespace, version, results, misses, fetched)
+        return [ids for ids, _ in results], [scores for _, scores in results]
+
+
+    def query_namespaces(
+            self,
+            targets: dict[str, str],
+            queries: list[str],
+            embedder: Embedder,
+            top_k: int = 5,
+            max_workers: int = 16,
+        ) -> dict[str, tuple[list[list[str]], list[np.ndarray]]]:
+        """
+        Fan the same queries out to many <strategy>-<size>-<dim> namespaces. Each query is embedded once
+        at the model's full width and every namespace's dim is derived by truncation + re-normalization
+        (see Embedder.embed_dims). The searches of all namespaces share one pool of max_workers requests,
+        so latency follows the slowest namespace rather than the sum of them. Cached results (query_cache)
+        are reused per namespace as in query_ids.
+
+        Args:
+            targets: Index name of each namespace to search
+            queries: Query texts
+            embedder: Embedder of the model (and metric) the namespaces were built with, at any dim
+            top_k: Number of matches per query and namespace
+            max_workers: Maximum number of query requests in flight over all namespaces
+
+        Returns:
+            (ids, scores) of each namespace, as returned by query_ids
+        """
+        lookups = {}
+        for namespace, index_name in targets.items():
+            try:
+                dim = int(namespace.rsplit("-", 1)[1])
+            except (IndexError, ValueError):
+                raise ValueError(f"Invalid namespace: {namespace}. Expected <chunking_strategy>-<chunk_size>-<num_dims>")
+            dim_embedder = embedder.with_dim(dim)
+            index = self.validate(index_name, namespace, dim_embedder)
+            lookups[namespace] = (index_name, index, dim, *self._cached_results(index_name, namespace, queries, dim_embedder, top_k))
+
+        # one full width embedding pass over the queries that any namespace still has to send
+        rows = sorted({positions[0] for *_, misses, _ in lookups.values() for positions in misses.values()})
+        row_index = {row: i for i, row in enumerate(rows)}
+        dims = {dim for _, _, dim, _, _, misses, _ in lookups.values() if misses}
+        vectors = embedder.embed_dims([queries[row] for row in rows], sorted(dims)) if rows else {}
+
+        searches = []
+        for namespace, (index_name, index, dim, keys, results, misses, version) in lookups.items():
+            tags = self._tags(index_name, namespace)
+            for positions in misses.values():
+                searches.append((index, namespace, vectors[dim][row_index[positions[0]]].tolist(), top_k, tags))
+        with self.metrics.timer("db.query_namespaces_seconds"):
+            fetched = self._run_searches(searches, max_workers) if searches else []
+
+        output = {}
+        start = 0
+        for namespace, (index_name, index, dim, keys, results, misses, version) in lookups.items():
+            if misses:
+                self._store_results(index_name, namespace, version, results, misses, fetched[start:start + len(misses)])
+                start += len(misses)
+            output[namespace] = ([ids for ids, _ in results], [scores for _, scores in results])
+        return output
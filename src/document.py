@@ -1,19 +1,24 @@
+import sys
 import uuid
+import numpy as np
+from typing import Iterable, Iterator, Optional, Union
+
 
 class Document():
     """Class to hold data in Pinecone's Document format"""
+    __slots__ = ("source", "text", "id")
 
     def __init__(self, source: str, text: str, id: str = None) -> None:
         self.source: str = source
         self.text: str = text
-        self.id: str = str(uuid.uuid4()) if None else id
+        self.id: str = str(uuid.uuid4()) if id is None else id
 
-    def __str__(self) -> str:  
+    def __str__(self) -> str:
         return f"Document(id={self.id}, source={self.source}, text={self.text[:50]}...)"
 
     def __repr__(self) -> str:
         return self.__str__()
-    
+
     '''
     If a tuple is used, it must be of the form (id, values, metadata) or (id, values). where id is a string, vector is a list of floats, metadata is a dict,
     and sparse_values is a dict of the form {'indices': List[int], 'values': List[float]}.
@@ -28,3 +33,123 @@ class Document():
                 "text": self.text
             }
         }
+
+
+class DocumentBatch():
+    """
+    Columnar batch of documents: an id list, a table of distinct (interned) sources with an int32
+    index per document, every text concatenated into one string with int64 offsets, and an optional
+    (n, dim) float32 embedding matrix. Used instead of one Document (and one dict) per vector on the
+    upsert and query paths; vectors only become Python lists in to_records(), at the network boundary.
+    """
+    def __init__(
+            self,
+            ids: list[str],
+            sources: list[str],
+            source_index: np.ndarray,
+            text_data: str,
+            text_offsets: np.ndarray,
+            embeddings: Optional[np.ndarray] = None,
+        ) -> None:
+        """
+        Create a new DocumentBatch (see from_columns and from_documents for the usual constructors)
+
+        Args:
+            ids: Id of each document
+            sources: Table of distinct sources
+            source_index: int32 index into sources of each document
+            text_data: Texts of all documents concatenated
+            text_offsets: int64 offsets of each text in text_data (len(ids) + 1)
+            embeddings: Optional (len(ids), dim) embedding matrix
+        """
+        if len(source_index) != len(ids) or len(text_offsets) != len(ids) + 1:
+            raise ValueError(f"Columns do not match: {len(ids)} ids, {len(source_index)} source indices, {len(text_offsets)} text offsets")
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            if embeddings.ndim != 2 or embeddings.shape[0] != len(ids):
+                raise ValueError(f"Embeddings shape {embeddings.shape} does not match {len(ids)} documents")
+        self.ids: list[str] = ids
+        self.sources: list[str] = sources
+        self.source_index: np.ndarray = source_index
+        self.text_data: str = text_data
+        self.text_offsets: np.ndarray = text_offsets
+        self.embeddings: Optional[np.ndarray] = embeddings
+
+
+    @classmethod
+    def from_columns(cls, ids: list[str], sources: Iterable[str], texts: Iterable[str], embeddings: Optional[np.ndarray] = None) -> "DocumentBatch":
+        """Build a batch from parallel id, source and text columns"""
+        table: dict[str, int] = {}
+        source_index = np.fromiter((table.setdefault(sys.intern(source), len(table)) for source in sources), dtype=np.int32, count=len(ids))
+        texts = list(texts)
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=text_offsets[1:])
+        return cls(list(ids), list(table.keys()), source_index, "".join(texts), text_offsets, embeddings)
+
+
+    @classmethod
+    def from_documents(cls, docs: Union[list[Document], "DocumentBatch"], embeddings: Optional[np.ndarray] = None) -> "DocumentBatch":
+        """Build a batch from Documents (a DocumentBatch is returned as is, with the embeddings attached if given)"""
+        if isinstance(docs, DocumentBatch):
+            return docs if embeddings is None else docs.with_embeddings(embeddings)
+        return cls.from_columns([doc.id for doc in docs], (doc.source for doc in docs), (doc.text for doc in docs), embeddings)
+
+
+    def __str__(self) -> str:
+        dim = None if self.embeddings is None else self.embeddings.shape[1]
+        return f"DocumentBatch(documents={len(self)}, sources={len(self.sources)}, dim={dim})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+    def __getitem__(self, i: int) -> Document:
+        return Document(source=self.source(i), text=self.text(i), id=self.ids[i])
+
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+    def text(self, i: int) -> str:
+        return self.text_data[self.text_offsets[i]:self.text_offsets[i + 1]]
+
+
+    def texts(self) -> list[str]:
+        offsets = self.text_offsets.tolist()
+        return [self.text_data[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+    def source(self, i: int) -> str:
+        return self.sources[self.source_index[i]]
+
+
+    def with_embeddings(self, embeddings: np.ndarray) -> "DocumentBatch":
+        """Same documents with another embedding matrix (columns are shared, not copied)"""
+        return DocumentBatch(self.ids, self.sources, self.source_index, self.text_data, self.text_offsets, embeddings)
+
+
+    def to_records(self, include_text: bool = True, start: int = 0, end: Optional[int] = None) -> list[dict[str, any]]:
+        """
+        Pinecone upsert records of rows start:end. Only those rows of the embedding matrix are converted to
+        lists, so callers can build one request's worth of records at a time. Without text the metadata
+        only holds the source, and the text is hydrated locally at query time
+        """
+        if self.embeddings is None:
+            raise ValueError("DocumentBatch has no embeddings")
+        end = len(self) if end is None else end
+        ids = self.ids[start:end]
+        values = self.embeddings[start:end].tolist()
+        sources = [self.sources[i] for i in self.source_index[start:end].tolist()]
+        if not include_text:
+            return [{"id": id, "values": vector, "metadata": {"source": source}} for id, vector, source in zip(ids, values, sources)]
+        return [
+            {"id": id, "values": vector, "metadata": {"source": source, "text": self.text(i)}}
+            for i, id, vector, source in zip(range(start, end), ids, values, sources)
+        ]
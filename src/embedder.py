@@ -1,4 +1,9 @@
+import numpy as np
 from openai import OpenAI
+from typing import Optional
+from .cache import EmbeddingCache, normalize_text
+from .metrics import Metrics, NULL_METRICS
+from .tokens import DEFAULT_ENCODING, count_tokens
 
 # valid inputs
 VALID_MODELS: list[str] = ["text-embedding-3-small", "text-embedding-3-large"]
@@ -8,12 +13,51 @@ VALID_DIMENSIONS: dict[str, int] = {
     "text-embedding-3-large": 3072
 }
 
+# https://openai.com/api/pricing/ (USD per million input tokens)
+PRICE_PER_MILLION_TOKENS: dict[str, float] = {
+    "text-embedding-3-small": 0.02,
+    "text-embedding-3-large": 0.13
+}
+
+# request limits of the embeddings endpoint
+MAX_BATCH_INPUTS: int = 2048        # inputs per request
+MAX_INPUT_TOKENS: int = 8191        # tokens per input
+MAX_REQUEST_TOKENS: int = 300_000   # tokens per request (summed over all inputs)
+
 
 def format_list(lst: list[str]) -> str: 
     """Format a list of strings as 'item1', 'item2', 'item3', ..."""
     return "'" + "', '".join(lst) + "'"
 
 
+def plan_batches(
+        token_counts: list[int],
+        max_inputs: int = MAX_BATCH_INPUTS,
+        max_input_tokens: int = MAX_INPUT_TOKENS,
+        max_request_tokens: int = MAX_REQUEST_TOKENS,
+    ) -> list[list[int]]:
+    """
+    Pack texts into requests that stay under the endpoint limits. Texts are taken longest first so
+    the slowest requests are sent first. Returns a list of batches, each a list of indices into token_counts.
+    """
+    too_long = [i for i, count in enumerate(token_counts) if count > max_input_tokens]
+    if too_long:
+        raise ValueError(f"{len(too_long)} text(s) exceed the limit of {max_input_tokens} tokens per input (first at index {too_long[0]})")
+
+    batches: list[list[int]] = []
+    batch: list[int] = []
+    batch_tokens = 0
+    for i in sorted(range(len(token_counts)), key=lambda i: token_counts[i], reverse=True):
+        if batch and (len(batch) == max_inputs or batch_tokens + token_counts[i] > max_request_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += token_counts[i]
+    if batch:
+        batches.append(batch)
+    return batches
+
+
 class Embedder():
     """
     Class to handle text embeddings using OpenAI's embedding models
@@ -23,7 +67,11 @@ class Embedder():
             client: OpenAI = None,
             model_name: str = "text-embedding-3-small", 
             dim: int = 1536, 
-            metric: str = "cosine"
+            metric: str = "cosine",
+            cache: Optional[EmbeddingCache] = None,
+            matryoshka: bool = False,
+            encoding_name: str = DEFAULT_ENCODING,
+            metrics: Optional[Metrics] = None,
         ) -> None:
         """
         Create a new Embedder
@@ -32,11 +80,21 @@ class Embedder():
             model_name: Name of the OpenAI embedding model to use: "text-embedding-3-small", "text-embedding-3-large"
             dim: Dimension of the embeddings
             metric: Metric to use for similarity search in Pinecone: "euclidean", "cosine", or "dotproduct"
+            cache: Optional EmbeddingCache consulted before calling the API
+            matryoshka: If `True`, always fetch embeddings at the model's full width and derive `dim`
+                        locally by truncation + L2 re-normalization, so embedders of the same model
+                        share one API pass (and one cache entry) per text
+            encoding_name: tiktoken encoding used to count tokens when packing requests
+            metrics: Optional Metrics recording requests, tokens, cost and cache hits (disabled by default)
         """
         self.client: OpenAI = client
         self.model_name: str = model_name
         self.dim: int = dim
         self.metric: str = metric
+        self.cache: Optional[EmbeddingCache] = cache
+        self.matryoshka: bool = matryoshka
+        self.encoding_name: str = encoding_name
+        self.metrics: Metrics = metrics if metrics is not None else NULL_METRICS
 
         # validate inputs
         if client is None:
@@ -48,50 +106,115 @@ class Embedder():
         if dim > VALID_DIMENSIONS[model_name] or dim < 1:
             raise ValueError(f"Invalid dimension for model {model_name}: {dim}. Valid dimensions in range: [1, {VALID_DIMENSIONS[model_name]}]")
 
+        # width requested from the API
+        self.max_dim: int = VALID_DIMENSIONS[model_name]
+        self.fetch_dim: int = self.max_dim if matryoshka else dim
+
 
     def __str__(self) -> str:
-        return f"Embedder(model_name={self.model_name}, dim={self.dim}, metric={self.metric})"
+        return f"Embedder(model_name={self.model_name}, dim={self.dim}, metric={self.metric}, matryoshka={self.matryoshka})"
 
 
     def __repr__(self) -> str:
         return self.__str__()
 
 
-    def embed_text(self, text: str) -> list[float]:
-        """Embed a given text using the selected model"""
-        text = text.replace("\n", " ")
-        try:
-            embedding = self.client.embeddings.create(input = [text], model=self.model_name).data[0].embedding
-        except Exception as e:
-            print(f"Error embedding text: {str(e)}")
-            raise
-        return embedding
-
-
-    def embed_batch(self, texts: list[str]) -> list[list[float]]:
-        """Embed a batch of texts using the selected model"""
-        texts = [text.replace("\n", " ") for text in texts]
-        try:
-            embeddings = self.client.embeddings.create(input = texts, model=self.model_name).data
-        except Exception as e:
-            print(f"Error embedding batch of texts: {str(e)}")
-            raise
+    def _create(self, texts: list[str], dim: int) -> list[list[float]]:
+        """Send already normalized texts to the API and return their embeddings in input order"""
+        response = self.client.embeddings.create(input=texts, model=self.model_name, dimensions=dim)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+    def _embed(self, texts: list[str], dim: int) -> np.ndarray:
+        """Embed texts at the given width. Only cache misses are sent to the API, packed into as few requests as the limits allow"""
+        texts = [normalize_text(text) for text in texts]
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+
+        # look up every text, then send each distinct miss exactly once
+        cached = self.cache.get_many(self.model_name, dim, texts) if self.cache is not None else [None] * len(texts)
+        misses: dict[str, list[int]] = {}
+        for i, vector in enumerate(cached):
+            if vector is None:
+                misses.setdefault(texts[i], []).append(i)
+            else:
+                embeddings[i] = vector
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.count("embedder.texts", len(texts), model=self.model_name)
+            metrics.count("embedder.cache_hits", len(texts) - sum(len(rows) for rows in misses.values()), model=self.model_name)
+        if not misses:
+            return embeddings
+
+        miss_texts = list(misses.keys())
+        token_counts = count_tokens(miss_texts, self.encoding_name)
+        for batch in plan_batches(token_counts):
+            batch_texts = [miss_texts[i] for i in batch]
+            try:
+                with metrics.timer("embedder.request_seconds", model=self.model_name):
+                    fetched = np.asarray(self._create(batch_texts, dim), dtype=np.float32)
+            except Exception as e:
+                metrics.count("embedder.errors", model=self.model_name)
+                print(f"Error embedding batch of texts: {str(e)}")
+                raise
+            if metrics.enabled:
+                tokens = sum(token_counts[i] for i in batch)
+                metrics.count("embedder.requests", model=self.model_name)
+                metrics.count("embedder.tokens", tokens, model=self.model_name)
+                metrics.count("embedder.cost_usd", tokens * PRICE_PER_MILLION_TOKENS[self.model_name] / 1e6, model=self.model_name)
+                metrics.observe("embedder.request_texts", len(batch), model=self.model_name)
+            if self.cache is not None:
+                self.cache.put_many(self.model_name, dim, batch_texts, fetched)
+
+            # merge the fetched embeddings back in input order
+            for text, embedding in zip(batch_texts, fetched):
+                embeddings[misses[text]] = embedding
         return embeddings
+
+
+    def embed_text(self, text: str) -> np.ndarray:
+        """Embed a given text using the selected model. Returns a float32 vector"""
+        return self.embed_batch([text])[0]
+
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        """Embed a batch of texts using the selected model. Returns a contiguous (len(texts), dim) float32 matrix"""
+        embeddings = self._embed(texts, self.fetch_dim)
+        if self.fetch_dim != self.dim:
+            return self.truncate(embeddings, self.dim)
+        return embeddings
+
+
+    def embed_dims(self, texts: list[str], dims: list[int]) -> dict[int, np.ndarray]:
+        """
+        Embed texts once at the model's full width and derive every requested dimension locally.
+        Returns a dict mapping each dim to a (len(texts), dim) float32 matrix.
+        """
+        for dim in dims:
+            if dim > self.max_dim or dim < 1:
+                raise ValueError(f"Invalid dimension for model {self.model_name}: {dim}. Valid dimensions in range: [1, {self.max_dim}]")
+        full = self._embed(texts, self.max_dim)
+        return {dim: self.truncate(full, dim) for dim in sorted(set(dims))}
+
+
+    def with_dim(self, dim: int) -> "Embedder":
+        """Embedder of the same model, metric, cache and metrics at another dim (matryoshka, so they share API passes)"""
+        return Embedder(self.client, self.model_name, dim, self.metric, self.cache, True, self.encoding_name, self.metrics)
+
+
+    def truncate(self, embeddings: list[list[float]], dim: int) -> np.ndarray:
+        """Shorten full width embeddings to their first `dim` components and re-normalize them"""
+        x = np.asarray(embeddings, dtype=np.float32)
+        return self.normalize_l2(x[..., :dim])
     
 
-    def normalize_l2(self, x: list[float]) -> list[float]:
-        """Normalize a list of floats to have L2 norm of 1"""
-        try:
-            import numpy as np
-        except:
-            raise ImportError("This function requires numpy to be installed")
-        x = np.array(x)
+    def normalize_l2(self, x: list[float]) -> np.ndarray:
+        """Normalize a vector (or each row of a matrix) to have L2 norm of 1"""
+        x = np.asarray(x, dtype=np.float32)
         if x.ndim == 1:
             norm = np.linalg.norm(x)
             if norm == 0:
                 return x
-            out = x / norm
-            return out.tolist()
+            return x / norm
         else:
             norm = np.linalg.norm(x, 2, axis=1, keepdims=True)
-            return np.where(norm == 0, x, x / norm).tolist()
\ No newline at end of file
+            return np.ascontiguousarray(np.where(norm == 0, x, x / np.where(norm == 0, 1, norm)))
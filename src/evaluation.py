@@ -0,0 +1,232 @@
+"""
+Vectorized retrieval evaluation. Relevance judgements (qrels) are held as a sorted array of
+(query, document) keys, retrieved results as a (num_queries, k) matrix of document indices, and
+every metric is computed for all queries of a configuration at once.
+
+Each configuration (e.g. a <chunking_strategy>-<chunk_size>-<num_dims> namespace) is scored
+independently, optionally in a process pool, into results/intermediate/<name>.json, and
+generate_report() merges the intermediate files.
+"""
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .io import save_json, load_json
+from typing import Callable, Iterable, Optional
+
+
+class Qrels():
+    """Sparse relevance matrix: the (query, document) pairs judged relevant"""
+    def __init__(self, pairs: Iterable[tuple[str, str]]) -> None:
+        """
+        Create a new Qrels
+
+        Args:
+            pairs: (query_id, doc_id) pairs judged relevant
+        """
+        self.query_index: dict[str, int] = {}
+        self.doc_index: dict[str, int] = {}
+        keys = []
+        for query_id, doc_id in pairs:
+            q = self.query_index.setdefault(query_id, len(self.query_index))
+            d = self.doc_index.setdefault(doc_id, len(self.doc_index))
+            keys.append((q, d))
+        keys = np.asarray(keys, dtype=np.int64).reshape(-1, 2)
+        self.num_docs: int = max(len(self.doc_index), 1)
+        # row-major keys q * num_docs + d, sorted for searchsorted membership tests
+        self.keys: np.ndarray = np.unique(keys[:, 0] * self.num_docs + keys[:, 1])
+        self.num_relevant: np.ndarray = np.bincount(self.keys // self.num_docs, minlength=len(self.query_index))
+
+
+    def __str__(self) -> str:
+        return f"Qrels(queries={len(self.query_index)}, documents={len(self.doc_index)}, pairs={len(self.keys)})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    @classmethod
+    def from_file(cls, path: str) -> "Qrels":
+        """
+        Read whitespace separated qrels: CISI.REL ("query_id doc_id 0 0.0") or TREC/MS MARCO
+        ("query_id 0 doc_id relevance", 4 columns with a non-zero last column counted as relevant)
+        """
+        def pairs():
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    columns = line.split()
+                    if not columns:
+                        continue
+                    if len(columns) == 4 and columns[1] == "0":
+                        # TREC layout: judgements with relevance 0 are not relevant
+                        if float(columns[3]) != 0:
+                            yield columns[0], columns[2]
+                    else:
+                        yield columns[0], columns[1]
+        return cls(pairs())
+
+
+    @classmethod
+    def from_mapping(cls, mapping: dict[str, list[str]]) -> "Qrels":
+        """Build from {query_id: [doc_id, ...]}"""
+        return cls((query_id, doc_id) for query_id, doc_ids in mapping.items() for doc_id in doc_ids)
+
+
+    def encode(self, query_ids: list[str], retrieved: list[list[str]], k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Map query ids to indices (-1 if unjudged) and retrieved doc ids to a (num_queries, k) index
+        matrix (-1 for empty slots). Documents without judgements get indices past num_docs, so they
+        still take up a rank.
+        """
+        queries = np.array([self.query_index.get(query_id, -1) for query_id in query_ids], dtype=np.int64)
+        docs = np.full((len(retrieved), k), -1, dtype=np.int64)
+        unjudged: dict[str, int] = {}
+        for i, doc_ids in enumerate(retrieved):
+            row = [
+                self.doc_index[doc_id] if doc_id in self.doc_index else unjudged.setdefault(doc_id, self.num_docs + len(unjudged))
+                for doc_id in doc_ids[:k]
+            ]
+            docs[i, :len(row)] = row
+        return queries, docs
+
+
+    def relevance(self, queries: np.ndarray, docs: np.ndarray) -> np.ndarray:
+        """Boolean (num_queries, k) matrix: is docs[i, j] relevant to queries[i]"""
+        judged = (docs >= 0) & (docs < self.num_docs) & (queries[:, None] >= 0)
+        keys = np.where(judged, queries[:, None] * self.num_docs + docs, -1)
+        positions = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        found = self.keys[positions] == keys if len(self.keys) else np.zeros(keys.shape, dtype=bool)
+        return found & judged
+
+
+def source_id(chunk_id: str) -> str:
+    """Source document id of a chunk id <doc_id>-<chunk_number> (as written by Pipeline)"""
+    return chunk_id.rsplit("-", 1)[0]
+
+
+def dedupe(docs: np.ndarray) -> np.ndarray:
+    """
+    Drop repeated documents in each row (several chunks of one document retrieved), keeping the first
+    occurrence and shifting later documents up so ranks stay consecutive. Empty slots are -1.
+    """
+    if docs.size == 0:
+        return docs
+    order = np.argsort(docs, axis=1, kind="stable")
+    sorted_docs = np.take_along_axis(docs, order, axis=1)
+    repeated = np.zeros(docs.shape, dtype=bool)
+    repeated[:, 1:] = sorted_docs[:, 1:] == sorted_docs[:, :-1]
+    duplicate = np.zeros(docs.shape, dtype=bool)
+    np.put_along_axis(duplicate, order, repeated, axis=1)
+    docs = np.where(duplicate, -1, docs)
+    # compact: move the -1 holes to the end of each row, keeping rank order
+    compact = np.argsort(docs < 0, axis=1, kind="stable")
+    return np.take_along_axis(docs, compact, axis=1)
+
+
+def score(hits: np.ndarray, num_relevant: np.ndarray, ks: Iterable[int] = (1, 3, 5, 10)) -> dict[str, float]:
+    """
+    Mean recall@k, precision@k, hit_rate@k (at least one relevant document), nDCG@k and MRR over
+    the queries that have relevant documents
+
+    Args:
+        hits: Boolean (num_queries, depth) relevance of the ranked results
+        num_relevant: Number of relevant documents of each query
+        ks: Cutoffs to report
+    """
+    judged = num_relevant > 0
+    hits, num_relevant = hits[judged], num_relevant[judged]
+    results: dict[str, float] = {"queries": int(len(num_relevant))}
+    if len(num_relevant) == 0:
+        return results
+
+    depth = hits.shape[1]
+    discounts = 1 / np.log2(np.arange(2, depth + 2))
+    cumulative_hits = np.cumsum(hits, axis=1)
+    cumulative_gain = np.cumsum(hits * discounts, axis=1)
+    ideal_gain = np.concatenate([[0.0], np.cumsum(discounts)])
+    for k in ks:
+        if k > depth:
+            continue
+        found = cumulative_hits[:, k - 1]
+        results[f"recall@{k}"] = float(np.mean(found / num_relevant))
+        results[f"precision@{k}"] = float(np.mean(found / k))
+        results[f"hit_rate@{k}"] = float(np.mean(found > 0))
+        results[f"ndcg@{k}"] = float(np.mean(cumulative_gain[:, k - 1] / ideal_gain[np.minimum(num_relevant, k)]))
+
+    first = np.where(hits.any(axis=1), hits.argmax(axis=1) + 1, np.inf)
+    results["mrr"] = float(np.mean(1 / first))
+    return results
+
+
+def evaluate(qrels: Qrels, query_ids: list[str], retrieved: list[list[str]], ks: Iterable[int] = (1, 3, 5, 10)) -> dict[str, float]:
+    """Score ranked document ids (one list per query, duplicates allowed) against the qrels"""
+    depth = max([len(doc_ids) for doc_ids in retrieved] + list(ks))
+    queries, docs = qrels.encode(query_ids, retrieved, depth)
+    docs = dedupe(docs)
+    num_relevant = np.where(queries >= 0, qrels.num_relevant[np.maximum(queries, 0)], 0)
+    return score(qrels.relevance(queries, docs), num_relevant, ks)
+
+
+def _evaluate_config(args: tuple) -> tuple[str, dict[str, float]]:
+    """Worker: retrieve for one configuration, score it and write its intermediate result"""
+    name, config, retrieve, qrels, ks, out_dir = args
+    query_ids, retrieved = retrieve(config)
+    results = {"config": config, "metrics": evaluate(qrels, query_ids, retrieved, ks)}
+    save_json(results, name, out_dir)
+    return name, results
+
+
+def evaluate_configs(
+        configs: dict[str, dict],
+        retrieve: Callable[[dict], tuple[list[str], list[list[str]]]],
+        qrels: Qrels,
+        ks: Iterable[int] = (1, 3, 5, 10),
+        out_dir: str = "results/intermediate",
+        max_workers: Optional[int] = None,
+        overwrite: bool = False,
+    ) -> dict[str, dict]:
+    """
+    Score many configurations, each into its own intermediate file. Configurations that already
+    have a result file are skipped unless overwrite is set.
+
+    Args:
+        configs: {name: config}, e.g. {"recursive-500-256": {"strategy": "recursive", ...}}
+        retrieve: Picklable function taking a config and returning (query_ids, ranked doc ids per query)
+        qrels: Relevance judgements
+        ks: Cutoffs to report
+        out_dir: Directory for the intermediate <name>.json files
+        max_workers: Number of worker processes (None or 1 to evaluate in this process)
+        overwrite: Re-evaluate configurations that already have results
+
+    Returns:
+        {name: {"config": config, "metrics": metrics}} for the configurations evaluated in this call
+    """
+    ks = tuple(ks)
+    pending = [
+        (name, config, retrieve, qrels, ks, out_dir)
+        for name, config in configs.items()
+        if overwrite or not os.path.exists(os.path.join(out_dir, f"{name}.json"))
+    ]
+    results: dict[str, dict] = {}
+    if max_workers is None or max_workers == 1 or len(pending) <= 1:
+        for task in pending:
+            name, result = _evaluate_config(task)
+            results[name] = result
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_evaluate_config, task) for task in pending]
+            for future in as_completed(futures):
+                name, result = future.result()
+                results[name] = result
+    return results
+
+
+def generate_report(in_dir: str = "results/intermediate", filename: str = "report", out_dir: str = "results") -> dict[str, dict]:
+    """Merge every intermediate result file into results/<filename>.json and return the merged results"""
+    report: dict[str, dict] = {}
+    if os.path.isdir(in_dir):
+        for file in sorted(os.listdir(in_dir)):
+            if file.endswith(".json"):
+                report[file[:-len(".json")]] = load_json(file[:-len(".json")], in_dir)
+    save_json(report, filename, out_dir)
+    return report
@@ -1,9 +1,44 @@
 import os
 import json
+from typing import Iterable, Iterator, Optional
 
-def save_json(content: dict, filename: str = "out", out_dir: str = "results"):
-    """Save a Python dictionary to a json file"""
+def save_json(content: dict, filename: str = "out", out_dir: str = "results", indent: Optional[int] = 4):
+    """Save a Python dictionary to a json file (indent=None writes compact json)"""
     os.makedirs(out_dir, exist_ok=True)
     path = os.path.join(out_dir, f"{filename}.json")
+    separators = (",", ":") if indent is None else None
     with open(path, "w", encoding="utf-8") as file:
-        json.dump(content, file, ensure_ascii=False, indent=4)
\ No newline at end of file
+        json.dump(content, file, ensure_ascii=False, indent=indent, separators=separators)
+
+
+def load_json(filename: str = "out", out_dir: str = "results"):
+    """Load a json file written by save_json"""
+    path = os.path.join(out_dir, f"{filename}.json")
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_jsonl(records: Iterable[dict], filename: str = "out", out_dir: str = "results") -> int:
+    """
+    Stream records to a json lines file, one compact record per line. The file is written under a
+    temporary name and renamed once complete. Returns the number of records
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{filename}.jsonl")
+    count = 0
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            file.write("\n")
+            count += 1
+    os.replace(f"{path}.tmp", path)
+    return count
+
+
+def iter_jsonl(filename: str = "out", out_dir: str = "results") -> Iterator[dict]:
+    """Iterate over the records of a json lines file written by save_jsonl"""
+    path = os.path.join(out_dir, f"{filename}.jsonl")
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,406 @@
+import os
+import numpy as np
+from .ann import IVFIndex
+from .embedder import Embedder, VALID_METRICS, format_list
+from .document import Document, DocumentBatch
+from typing import TYPE_CHECKING, Optional, Union
+
+if TYPE_CHECKING:
+    from .chunk_store import ChunkSet
+
+
+class LocalNamespace():
+    """
+    Vectors of one namespace held as a contiguous float32 matrix (grown by doubling) with the
+    ids and metadata in parallel lists
+    """
+    def __init__(self, dimension: int, metric: str) -> None:
+        self.dimension: int = dimension
+        self.metric: str = metric
+        self.size: int = 0
+        self.vectors: np.ndarray = np.empty((0, dimension), dtype=np.float32)
+        self.sq_norms: np.ndarray = np.empty(0, dtype=np.float32)   # only used for euclidean
+        self.ids: list[str] = []
+        self.metadata: list[dict[str, str]] = []
+        self.rows: dict[str, int] = {}
+        self.ann: Optional[IVFIndex] = None   # approximate index, dropped when the namespace changes
+
+
+    def __len__(self) -> int:
+        return self.size
+
+
+    def _reserve(self, capacity: int) -> None:
+        """Grow the backing matrix so that it holds at least `capacity` rows"""
+        if capacity <= self.vectors.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self.vectors.shape[0], 1024)
+        vectors = np.empty((new_capacity, self.dimension), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        sq_norms = np.empty(new_capacity, dtype=np.float32)
+        sq_norms[:self.size] = self.sq_norms[:self.size]
+        self.vectors, self.sq_norms = vectors, sq_norms
+
+
+    def prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """Cast vectors to float32 and normalize them for the cosine metric"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dimension}")
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors
+
+
+    def upsert(self, ids: list[str], vectors: np.ndarray, metadata: list[dict[str, str]]) -> None:
+        """Insert new ids and overwrite existing ones"""
+        vectors = self.prepare(vectors)
+        self.ann = None
+        if not (len(ids) == vectors.shape[0] == len(metadata)):
+            raise ValueError(f"Got {len(ids)} ids, {vectors.shape[0]} vectors and {len(metadata)} metadata entries")
+        self._reserve(self.size + len(ids))
+        rows = np.empty(len(ids), dtype=np.int64)
+        for i, (id, meta) in enumerate(zip(ids, metadata)):
+            row = self.rows.get(id)
+            if row is None:
+                row = self.size
+                self.rows[id] = row
+                self.ids.append(id)
+                self.metadata.append(meta)
+                self.size += 1
+            else:
+                self.metadata[row] = meta
+            rows[i] = row
+        self.vectors[rows] = vectors
+        if self.metric == "euclidean":
+            self.sq_norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+
+
+    def delete(self, ids: list[str]) -> None:
+        """Delete ids by moving the last row into each freed slot"""
+        self.ann = None
+        for id in ids:
+            row = self.rows.pop(id, None)
+            if row is None:
+                continue
+            last = self.size - 1
+            if row != last:
+                self.vectors[row] = self.vectors[last]
+                self.sq_norms[row] = self.sq_norms[last]
+                self.ids[row] = self.ids[last]
+                self.metadata[row] = self.metadata[last]
+                self.rows[self.ids[row]] = row
+            self.ids.pop()
+            self.metadata.pop()
+            self.size -= 1
+
+
+    def search(self, queries: np.ndarray, top_k: int, block_size: int = 1024, nprobe: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top_k search for a batch of queries: one matrix multiply per block of queries plus an
+        argpartition. Returns (rows, scores), each of shape (num_queries, min(top_k, size)). Scores are
+        similarities for cosine/dotproduct (descending) and distances for euclidean (ascending).
+        If nprobe is given, the approximate IVF index is searched instead (missing slots hold row -1).
+        """
+        queries = self.prepare(queries)
+        if nprobe is not None:
+            if self.ann is None:
+                raise ValueError("Namespace has no ANN index -- build or load one first")
+            return self.ann.search(queries, top_k, nprobe)
+        k = min(top_k, self.size)
+        rows = np.empty((queries.shape[0], k), dtype=np.int64)
+        scores = np.empty((queries.shape[0], k), dtype=np.float32)
+        if k == 0:
+            return rows, scores
+
+        vectors = self.vectors[:self.size]
+        for start in range(0, queries.shape[0], block_size):
+            block = queries[start:start + block_size]
+            # rank by a value where larger is better so both cases share the top-k code
+            ranking = block @ vectors.T
+            if self.metric == "euclidean":
+                ranking = 2 * ranking - self.sq_norms[:self.size]
+            if k < self.size:
+                top = np.argpartition(-ranking, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(self.size), (block.shape[0], self.size))
+            top_ranking = np.take_along_axis(ranking, top, axis=1)
+            order = np.argsort(-top_ranking, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_ranking = np.take_along_axis(top_ranking, order, axis=1)
+
+            rows[start:start + block.shape[0]] = top
+            if self.metric == "euclidean":
+                q_sq_norms = np.einsum("ij,ij->i", block, block)[:, None]
+                scores[start:start + block.shape[0]] = np.sqrt(np.maximum(q_sq_norms - top_ranking, 0))
+            else:
+                scores[start:start + block.shape[0]] = top_ranking
+        return rows, scores
+
+
+class LocalIndex():
+    """In-process index: a dimension, a metric and a set of namespaces"""
+    def __init__(self, name: str, dimension: int, metric: str) -> None:
+        if metric not in VALID_METRICS:
+            raise ValueError(f"Invalid metric: {metric}. Valid metrics are: {format_list(VALID_METRICS)}")
+        self.name: str = name
+        self.dimension: int = dimension
+        self.metric: str = metric
+        self.namespaces: dict[str, LocalNamespace] = {}
+
+
+    def namespace(self, namespace: str, create: bool = False) -> LocalNamespace:
+        """Get a namespace, optionally creating it"""
+        if namespace not in self.namespaces:
+            if not create:
+                raise ValueError(f"Namespace {namespace} does not exist in index {self.name}")
+            self.namespaces[namespace] = LocalNamespace(self.dimension, self.metric)
+        return self.namespaces[namespace]
+
+
+class LocalDB():
+    """
+    In-process exact vector database with the same interface as PineconeDB. Each namespace is a
+    contiguous float32 matrix searched with one BLAS matrix multiply per query batch, which makes
+    it an offline backend and an exact baseline for remote indexes.
+    """
+    def __init__(self) -> None:
+        """Create a new, empty LocalDB"""
+        self.indexes: dict[str, LocalIndex] = {}
+
+
+    def __str__(self) -> str:
+        index_info = []
+        for index_name, index in self.indexes.items():
+            index_info.append(f"{index_name} (namespaces: {len(index.namespaces)})")
+
+        index_str = ", ".join(index_info)
+        return f"LocalDB(indexes=[{index_str}])"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def get_index(self, index_name: str, embedder: Embedder) -> LocalIndex:
+        """Get or create an index object"""
+        if index_name not in self.indexes:
+            self.create_index(index_name, embedder)
+        return self.indexes[index_name]
+
+
+    def create_index(self, index_name: str, embedder: Embedder) -> None:
+        """Create a new index with the embedder's dimension and metric"""
+        if index_name not in self.indexes:
+            self.indexes[index_name] = LocalIndex(index_name, embedder.dim, embedder.metric)
+        else:
+            print(f"Index {index_name} already exists")
+
+
+    def delete_index(self, index_name: str) -> None:
+        """Delete an existing index"""
+        if index_name in self.indexes:
+            del self.indexes[index_name]
+        else:
+            print(f"Index {index_name} does not exist -- cannot delete")
+
+
+    def list_namespaces(self, index_name: str) -> dict[str, int]:
+        """Return the namespaces of an index with their vector counts"""
+        if index_name not in self.indexes:
+            raise ValueError(f"Index {index_name} does not exist")
+        return {name: len(namespace) for name, namespace in self.indexes[index_name].namespaces.items()}
+
+
+    def upsert_doc(self, index_name: str, namespace: str, embedder: Embedder, doc: Document) -> None:
+        """Store an embedding"""
+        self.upsert_batch(index_name, namespace, embedder, [doc])
+
+
+    def upsert_batch(
+            self,
+            index_name: str,
+            namespace: str,
+            embedder: Embedder,
+            docs: Union[list[Document], DocumentBatch],
+            embeddings: np.ndarray = None,
+            include_text: bool = True,
+        ) -> None:
+        """
+        Store a batch of embeddings. Embeddings are computed with the embedder unless given (or attached to the batch).
+        If include_text is `False` only the sources are kept, as in PineconeDB (query with a store to hydrate the text)
+        """
+        index = self.get_index(index_name, embedder)
+        batch = DocumentBatch.from_documents(docs)
+        if embeddings is None:
+            embeddings = batch.embeddings if batch.embeddings is not None else embedder.embed_batch(batch.texts())
+        sources = [batch.sources[i] for i in batch.source_index.tolist()]
+        if include_text:
+            metadata = [{"source": source, "text": text} for source, text in zip(sources, batch.texts())]
+        else:
+            metadata = [{"source": source} for source in sources]
+        index.namespace(namespace, create=True).upsert(batch.ids, embeddings, metadata)
+
+
+    def delete(self, index_name: str, namespace: str, ids: list[str]) -> None:
+        """Delete vectors by id from a namespace"""
+        if index_name not in self.indexes:
+            raise ValueError(f"Index {index_name} does not exist")
+        self.indexes[index_name].namespace(namespace).delete(ids)
+
+
+    def delete_namespace(self, index_name: str, namespace: str) -> None:
+        """Delete a whole namespace"""
+        if index_name in self.indexes:
+            self.indexes[index_name].namespaces.pop(namespace, None)
+
+
+    def build_ann(self, index_name: str, namespace: str, nlist: int = 1024, niter: int = 20, path: Optional[str] = None) -> IVFIndex:
+        """
+        Build an approximate IVF index over a namespace, optionally persisting it to `path`.
+        Queries use it when called with nprobe; any upsert or delete drops it.
+        """
+        if index_name not in self.indexes:
+            raise ValueError(f"Index {index_name} does not exist")
+        ns = self.indexes[index_name].namespace(namespace)
+        ann = IVFIndex(ns.dimension, ns.metric, nlist=nlist, niter=niter).build(ns.vectors[:ns.size])
+        if path is not None:
+            ann.save(path)
+            np.save(os.path.join(path, "ids.npy"), np.array(ns.ids))
+        ns.ann = ann
+        return ann
+
+
+    def load_ann(self, index_name: str, namespace: str, path: str, mmap: bool = True) -> IVFIndex:
+        """Attach a persisted IVF index to a namespace, checking that it was built from the same ids"""
+        if index_name not in self.indexes:
+            raise ValueError(f"Index {index_name} does not exist")
+        ns = self.indexes[index_name].namespace(namespace)
+        ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r" if mmap else None)
+        if len(ids) != ns.size or not all(a == b for a, b in zip(ids.tolist(), ns.ids)):
+            raise ValueError(f"ANN index at {path} was not built from the current contents of namespace {namespace}")
+        ns.ann = IVFIndex.load(path, mmap=mmap)
+        return ns.ann
+
+
+    def _validate(self, index_name: str, namespace: str, embedder: Embedder) -> LocalNamespace:
+        """Ensure that the embedder is compatible with the index and that the namespace exists"""
+        if index_name not in self.indexes:
+            raise ValueError(f"Index {index_name} does not exist")
+        index = self.indexes[index_name]
+        if embedder.dim != index.dimension:
+            raise ValueError(f"Embedder dimension {embedder.dim} does not match index dimension {index.dimension}")
+        if embedder.metric != index.metric:
+            raise ValueError(f"Embedder metric {embedder.metric} does not match index metric {index.metric}")
+        return index.namespace(namespace)
+
+
+    def search(self, index_name: str, namespace: str, vectors: np.ndarray, top_k: int = 5, nprobe: Optional[int] = None) -> tuple[list[list[str]], np.ndarray]:
+        """Search with precomputed query vectors. Returns the ids and scores of the top_k matches per query"""
+        if index_name not in self.indexes:
+            raise ValueError(f"Index {index_name} does not exist")
+        ns = self.indexes[index_name].namespace(namespace)
+        rows, scores = ns.search(vectors, top_k, nprobe=nprobe)
+        return [[ns.ids[row] for row in query_rows if row >= 0] for query_rows in rows.tolist()], scores
+
+
+    def query(self, index_name: str, namespace: str, query: str, embedder: Embedder, top_k: int = 5, nprobe: Optional[int] = None) -> DocumentBatch:
+        """Query for similar embeddings. Returns the top_k Documents in the database as a DocumentBatch."""
+        return self.query_batch(index_name, namespace, [query], embedder, top_k, nprobe=nprobe)[0]
+
+
+    def query_batch(
+            self,
+            index_name: str,
+            namespace: str,
+            queries: list[str],
+            embedder: Embedder,
+            top_k: int = 5,
+            max_workers: int = 8,
+            store: Optional["ChunkSet"] = None,
+            nprobe: Optional[int] = None,
+        ) -> list[DocumentBatch]:
+        """
+        Query for similar embeddings. Returns a DocumentBatch of the top_k Documents for each query (approximate if nprobe is given).
+        With a store (a ChunkSet, or a DataPreprocessor for document ids) the text is read from it instead of the
+        metadata, as needed for namespaces upserted with include_text=False. max_workers is unused (kept for PineconeDB compatibility)
+        """
+        if store is not None:
+            ids, _ = self.query_ids(index_name, namespace, queries, embedder, top_k, max_workers, nprobe)
+            return [store.batch(query_ids) for query_ids in ids]
+        ns = self._validate(index_name, namespace, embedder)
+        rows, _ = ns.search(embedder.embed_batch(queries), top_k, nprobe=nprobe)
+        results = []
+        for query_rows in rows.tolist():
+            query_rows = [row for row in query_rows if row >= 0]
+            if any("text" not in ns.metadata[row] for row in query_rows):
+                raise ValueError(f"Matches in namespace {namespace} have no text metadata (upserted with include_text=False): pass a store to hydrate them")
+            results.append(DocumentBatch.from_columns(
+                [ns.ids[row] for row in query_rows],
+                (ns.metadata[row]["source"] for row in query_rows),
+                (ns.metadata[row]["text"] for row in query_rows)
+            ))
+        return results
+
+
+    def query_ids(
+            self,
+            index_name: str,
+            namespace: str,
+            queries: list[str],
+            embedder: Embedder,
+            top_k: int = 5,
+            max_workers: int = 8,
+            nprobe: Optional[int] = None,
+        ) -> tuple[list[list[str]], list[np.ndarray]]:
+        """
+        Ids and scores of the top_k matches of each query, as PineconeDB.query_ids (max_workers is unused)
+
+        Returns:
+            The match ids of each query and a float32 array of their scores
+        """
+        self._validate(index_name, namespace, embedder)
+        ids, scores = self.search(index_name, namespace, embedder.embed_batch(queries), top_k, nprobe)
+        return ids, [row[:len(row_ids)] for row, row_ids in zip(scores, ids)]
+
+
+    def query_namespaces(
+            self,
+            targets: dict[str, str],
+            queries: list[str],
+            embedder: Embedder,
+            top_k: int = 5,
+            max_workers: int = 16,
+        ) -> dict[str, tuple[list[list[str]], list[np.ndarray]]]:
+        """
+        Search the same queries in many <strategy>-<size>-<dim> namespaces, as PineconeDB.query_namespaces:
+        the queries are embedded once at the model's full width and truncated to each namespace's dim.
+        The namespaces are searched one after another (max_workers is unused)
+
+        Args:
+            targets: Index name of each namespace to search
+            queries: Query texts
+            embedder: Embedder of the model (and metric) the namespaces were built with, at any dim
+            top_k: Number of matches per query and namespace
+            max_workers: Unused, kept for PineconeDB compatibility
+
+        Returns:
+            (ids, scores) of each namespace, as returned by query_ids
+        """
+        dims = {}
+        for namespace, index_name in targets.items():
+            try:
+                dims[namespace] = int(namespace.rsplit("-", 1)[1])
+            except (IndexError, ValueError):
+                raise ValueError(f"Invalid namespace: {namespace}. Expected <chunking_strategy>-<chunk_size>-<num_dims>")
+            self._validate(index_name, namespace, embedder.with_dim(dims[namespace]))
+        vectors = embedder.embed_dims(queries, sorted(set(dims.values()))) if targets else {}
+
+        results = {}
+        for namespace, index_name in targets.items():
+            ids, scores = self.search(index_name, namespace, vectors[dims[namespace]], top_k)
+            results[namespace] = (ids, [row[:len(row_ids)] for row, row_ids in zip(scores, ids)])
+        return results
@@ -0,0 +1,248 @@
+"""
+Instrumentation for the chunk -> embed -> upsert -> query hot paths: counters (tokens, requests,
+retries, cache hits, cost), histograms of timings and sizes, and spans that tag everything recorded
+inside them (e.g. dataset, strategy, chunk_size, dim).
+
+    metrics = Metrics()
+    embedder = Embedder(client, "text-embedding-3-small", 256, metrics=metrics)
+    with metrics.span("embed", dataset="cisi", strategy="recursive", chunk_size=400, dim=256):
+        embedder.embed_batch(texts)
+    metrics.export("metrics")           # results/metrics.json
+
+Chunker, Embedder and PineconeDB default to NULL_METRICS, a disabled instance whose methods return
+immediately, so instrumentation costs one attribute check per call when it is off. Recording is
+per batch or per request, never per text or vector. Span tags are per thread: work handed to a
+thread pool is tagged explicitly by the caller.
+"""
+import math
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from .io import save_json
+from typing import Any, ContextManager, Iterator, Optional
+
+
+_NULL_CONTEXT = nullcontext()
+
+
+class Histogram():
+    """Count, sum, min and max of a series plus power-of-two buckets for approximate quantiles"""
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.total: float = 0.0
+        self.min: float = math.inf
+        self.max: float = -math.inf
+        # exponent e -> number of values in [2^(e-1), 2^e)
+        self.buckets: dict[int, int] = {}
+
+
+    def __str__(self) -> str:
+        return f"Histogram(count={self.count}, mean={self.total / self.count if self.count else 0.0})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        exponent = math.frexp(value)[1] if value > 0 else -1074
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (within a factor of 2, clipped to [min, max])"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for exponent in sorted(self.buckets):
+            seen += self.buckets[exponent]
+            if seen >= rank:
+                return min(max(math.ldexp(1.0, exponent), self.min), self.max)
+        return self.max
+
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics():
+    """
+    Thread-safe registry of counters, histograms and spans. Series are keyed by name and tags, where
+    the tags are those of the enclosing spans (on the current thread) updated with the explicit ones
+    """
+    def __init__(self, enabled: bool = True, max_spans: int = 10_000) -> None:
+        """
+        Create a new Metrics registry
+
+        Args:
+            enabled: If `False`, every method is a no-op (see NULL_METRICS)
+            max_spans: Maximum number of finished spans kept for export (later ones are only counted)
+        """
+        self.enabled: bool = enabled
+        self.max_spans: int = max_spans
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, Histogram] = {}
+        self.spans: list[dict[str, Any]] = []
+        self.dropped_spans: int = 0
+        self.started: float = time.time()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+
+    def __str__(self) -> str:
+        return f"Metrics(enabled={self.enabled}, counters={len(self.counters)}, histograms={len(self.histograms)}, spans={len(self.spans)})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def context(self) -> dict[str, Any]:
+        """Tags of the spans open on the current thread"""
+        stack = getattr(self.local, "stack", None)
+        return stack[-1] if stack else {}
+
+
+    def _key(self, name: str, tags: dict[str, Any]) -> tuple:
+        context = self.context()
+        if tags:
+            context = {**context, **tags}
+        return (name, tuple(sorted(context.items())))
+
+
+    def count(self, name: str, value: float = 1, **tags: Any) -> None:
+        """Add value to a counter"""
+        if not self.enabled:
+            return
+        key = self._key(name, tags)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+    def observe(self, name: str, value: float, **tags: Any) -> None:
+        """Record one value in a histogram"""
+        if not self.enabled:
+            return
+        key = self._key(name, tags)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.add(value)
+
+
+    def timer(self, name: str, **tags: Any) -> ContextManager[None]:
+        """Context manager recording its wall time in seconds in the histogram `name`"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timer(name, tags)
+
+
+    @contextmanager
+    def _timer(self, name: str, tags: dict[str, Any]) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **tags)
+
+
+    def span(self, name: str, **tags: Any) -> ContextManager[None]:
+        """
+        Context manager for a unit of work: everything recorded inside it on this thread is tagged
+        with its tags, its wall time goes to the histogram `name` and the span itself is kept for export
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._span(name, tags)
+
+
+    @contextmanager
+    def _span(self, name: str, tags: dict[str, Any]) -> Iterator[None]:
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        context = {**self.context(), **tags}
+        stack.append(context)
+        start, wall = time.perf_counter(), time.time()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            seconds = time.perf_counter() - start
+            self.observe(name, seconds, **context)
+            with self.lock:
+                if len(self.spans) < self.max_spans:
+                    self.spans.append({"name": name, "tags": context, "start": wall, "seconds": seconds, "error": error})
+                else:
+                    self.dropped_spans += 1
+
+
+    def reset(self) -> None:
+        """Forget everything recorded so far"""
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.spans = []
+            self.dropped_spans = 0
+            self.started = time.time()
+
+
+    def snapshot(self) -> dict[str, Any]:
+        """Everything recorded so far as json-serializable data"""
+        with self.lock:
+            return {
+                "started": self.started,
+                "seconds": time.time() - self.started,
+                "counters": [
+                    {"name": name, "tags": dict(tags), "value": value}
+                    for (name, tags), value in self.counters.items()
+                ],
+                "histograms": [
+                    {"name": name, "tags": dict(tags), **histogram.to_dict()}
+                    for (name, tags), histogram in self.histograms.items()
+                ],
+                "spans": list(self.spans),
+                "dropped_spans": self.dropped_spans,
+            }
+
+
+    def total(self, name: str, **tags: Any) -> float:
+        """Sum of a counter over every series whose tags include the given ones"""
+        with self.lock:
+            return sum(
+                value for (series, series_tags), value in self.counters.items()
+                if series == name and all(item in series_tags for item in tags.items())
+            )
+
+
+    def export(self, filename: str = "metrics", out_dir: str = "results") -> Optional[str]:
+        """Write the snapshot to <out_dir>/<filename>.json. Returns the path (None when disabled)"""
+        if not self.enabled:
+            return None
+        save_json(self.snapshot(), filename, out_dir)
+        return f"{out_dir}/{filename}.json"
+
+
+# shared disabled instance, the default of every instrumented class
+NULL_METRICS: Metrics = Metrics(enabled=False)
@@ -0,0 +1,226 @@
+import os
+import time
+import queue
+import threading
+from .chunker import Chunker
+from .db import PineconeDB
+from .document import Document
+from .embedder import Embedder
+from typing import Any, Callable, Iterable, Optional
+
+
+_DONE = object()   # end-of-stream marker passed between stages
+
+
+class Checkpoint():
+    """Append-only file of document IDs whose chunks have all been upserted into a namespace"""
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.completed: set[str] = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.completed = {line.rstrip("\n") for line in file if line.strip()}
+
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.completed
+
+
+    def __len__(self) -> int:
+        return len(self.completed)
+
+
+    def add_many(self, doc_ids: list[str]) -> None:
+        """Record completed documents durably"""
+        if not doc_ids:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(f"{doc_id}\n" for doc_id in doc_ids))
+            file.flush()
+            os.fsync(file.fileno())
+        self.completed.update(doc_ids)
+
+
+class Pipeline():
+    """
+    Streaming chunk -> embed -> upsert pipeline. Each stage runs on its own thread behind a bounded
+    queue, so memory stays constant regardless of corpus size, and completed documents are written
+    to a per-namespace checkpoint so an interrupted run resumes where it stopped.
+    """
+    def __init__(
+            self,
+            chunker: Chunker,
+            embedder: Embedder,
+            db: PineconeDB,
+            index_name: str,
+            namespace: str,
+            checkpoint_dir: str = "data/checkpoints",
+            batch_size: int = 256,
+            queue_size: int = 8,
+            upsert_workers: int = 4,
+        ) -> None:
+        """
+        Create a new Pipeline
+
+        Args:
+            chunker: Chunker used to split each document
+            embedder: Embedder used to embed the chunks
+            db: Vector database to upsert into (PineconeDB or LocalDB)
+            index_name: Name of the index
+            namespace: Namespace to upsert into, e.g. <chunking_strategy>-<chunk_size>-<num_dims>
+            checkpoint_dir: Directory holding <index_name>/<namespace>.txt checkpoints
+            batch_size: Number of chunks embedded and upserted together
+            queue_size: Maximum number of items waiting between two stages
+            upsert_workers: Maximum number of upsert requests in flight (PineconeDB only)
+        """
+        if batch_size < 1 or queue_size < 1:
+            raise ValueError("batch_size and queue_size must be >= 1")
+        self.chunker: Chunker = chunker
+        self.embedder: Embedder = embedder
+        self.db: PineconeDB = db
+        self.index_name: str = index_name
+        self.namespace: str = namespace
+        self.batch_size: int = batch_size
+        self.queue_size: int = queue_size
+        self.upsert_workers: int = upsert_workers
+        self.checkpoint: Checkpoint = Checkpoint(os.path.join(checkpoint_dir, index_name, f"{namespace}.txt"))
+        self.stop = threading.Event()
+        self.errors: list[BaseException] = []
+
+
+    def __str__(self) -> str:
+        return f"Pipeline(index_name={self.index_name}, namespace={self.namespace}, completed={len(self.checkpoint)})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def _put(self, q: queue.Queue, item: Any) -> None:
+        """Blocking put that gives up once another stage has failed"""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+    def _get(self, q: queue.Queue) -> Any:
+        """Blocking get that gives up once another stage has failed"""
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+
+    def _stage(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Wrap a stage so that a failure stops every other stage"""
+        def run() -> None:
+            try:
+                fn()
+            except BaseException as e:
+                self.errors.append(e)
+                self.stop.set()
+        return run
+
+
+    def chunk_documents(self, doc: Document) -> list[Document]:
+        """Split one source document into chunk Documents with deterministic ids <doc_id>-<chunk_number>"""
+        return [
+            Document(source=doc.id, text=chunk.page_content, id=f"{doc.id}-{i}")
+            for i, chunk in enumerate(self.chunker.split(doc.text))
+        ]
+
+
+    def run(self, documents: Iterable[Document], on_progress: Optional[Callable[[dict[str, float]], None]] = None) -> dict[str, float]:
+        """
+        Stream documents through the pipeline, skipping those already in the checkpoint
+
+        Args:
+            documents: Iterable of source documents (only consumed as fast as the stages keep up)
+            on_progress: Optional callback receiving the running stats after every upserted batch
+
+        Returns:
+            Stats with the number of documents skipped and completed, chunks upserted and elapsed seconds
+        """
+        self.stop.clear()
+        self.errors = []
+        chunk_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        upsert_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stats = {"skipped": 0, "documents": 0, "chunks": 0, "seconds": 0.0}
+        start = time.perf_counter()
+
+        def chunk_stage() -> None:
+            for doc in documents:
+                if self.stop.is_set():
+                    return
+                if doc.id in self.checkpoint:
+                    stats["skipped"] += 1
+                    continue
+                self._put(chunk_queue, (doc.id, self.chunk_documents(doc)))
+            self._put(chunk_queue, _DONE)
+
+        def embed_stage() -> None:
+            # batches carry the docs whose last chunk they contain, so completion is known downstream
+            chunks: list[Document] = []
+            finished: list[str] = []
+            while True:
+                item = self._get(chunk_queue)
+                if item is _DONE:
+                    break
+                doc_id, doc_chunks = item
+                for chunk in doc_chunks:
+                    chunks.append(chunk)
+                    if len(chunks) == self.batch_size:
+                        self._put(upsert_queue, (chunks, self.embedder.embed_batch([c.text for c in chunks]), finished))
+                        chunks, finished = [], []
+                finished.append(doc_id)
+            if not self.stop.is_set():
+                if chunks or finished:
+                    embeddings = self.embedder.embed_batch([c.text for c in chunks]) if chunks else None
+                    self._put(upsert_queue, (chunks, embeddings, finished))
+                self._put(upsert_queue, _DONE)
+
+        def upsert_stage() -> None:
+            while True:
+                item = self._get(upsert_queue)
+                if item is _DONE:
+                    break
+                chunks, embeddings, finished = item
+                if chunks:
+                    if isinstance(self.db, PineconeDB):
+                        self.db.upsert_bulk(self.index_name, self.namespace, self.embedder, chunks, embeddings, max_workers=self.upsert_workers)
+                    else:
+                        self.db.upsert_batch(self.index_name, self.namespace, self.embedder, chunks, embeddings)
+                # batches arrive in order, so every doc finished here has all of its chunks upserted
+                self.checkpoint.add_many(finished)
+                stats["documents"] += len(finished)
+                stats["chunks"] += len(chunks)
+                if on_progress is not None:
+                    stats["seconds"] = time.perf_counter() - start
+                    on_progress(dict(stats))
+
+        threads = [
+            threading.Thread(target=self._stage(stage), name=f"pipeline-{stage.__name__}", daemon=True)
+            for stage in (chunk_stage, embed_stage, upsert_stage)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            raise
+
+        stats["seconds"] = time.perf_counter() - start
+        if self.errors:
+            print(f"Pipeline for namespace {self.namespace} stopped after {stats['documents']} documents: {str(self.errors[0])}")
+            raise self.errors[0]
+        return stats
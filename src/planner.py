@@ -0,0 +1,466 @@
+"""
+Incremental experiment planner for the strategy x size x dim grid in config.yaml (see notes.txt).
+
+Every <chunking_strategy>-<chunk_size>-<num_dims> namespace in the grid is compared with what already
+exists, from the cheapest layer to the most expensive:
+
+    upserted     namespace exists in the index               -> nothing to do
+    embedded     vectors exist in data/<dataset>/embeddings  -> upsert only
+    chunked      chunk set exists in data/<dataset>/chunks   -> embed + upsert
+    (none)                                                   -> chunk + embed + upsert
+
+and only the missing work is turned into jobs. Shared work is deduplicated: one chunk job per
+strategy segments the documents once and stores every missing size (SweepChunker, recursive
+strategy) or one per (strategy, size) for the LangChain strategies, each chunk set feeds every
+dim, and one embed job per (strategy, size) embeds the chunks once at
+the model's full width and writes every missing dim by truncation (or truncates an already stored,
+wider namespace without calling the API at all). Independent jobs run concurrently
+on a bounded worker pool.
+
+A Pinecone index has a single dimension, so every dim gets its own index (index_name in the config,
+"{dataset_name}-{dim}" by default) and the namespace keeps the full <strategy>-<size>-<dim> key.
+"""
+import time
+import yaml
+import numpy as np
+from openai import OpenAI
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .cache import EmbeddingCache
+from .chunk_store import ChunkStore, hash_texts
+from .chunker import Chunker, DistanceMemo, SweepChunker
+from .db import PineconeDB
+from .document import DocumentBatch
+from .embedder import Embedder, VALID_DIMENSIONS
+from .io import load_json
+from .local_db import LocalDB
+from .metrics import Metrics, NULL_METRICS
+from .vector_store import EmbeddingStore
+from typing import Callable, ContextManager, Optional, Union
+
+
+# strategies chunked by SweepChunker: every missing size is packed from one segmentation pass
+SWEEP_STRATEGIES: list[str] = ["recursive"]
+
+
+def load_config(path: str = "config.yaml") -> dict:
+    """Read the experiment config"""
+    with open(path, "r", encoding="utf-8") as file:
+        config = yaml.safe_load(file)
+    if not config:
+        raise ValueError(f"Config file {path} is empty")
+    return config
+
+
+def value_range(minimum: int, maximum: int, step: int) -> list[int]:
+    """minimum, minimum + step, ... up to and including maximum"""
+    if step < 1:
+        raise ValueError(f"Invalid step: {step}. Step must be >= 1")
+    return list(range(minimum, maximum + 1, step))
+
+
+def namespace_key(strategy: str, chunk_size: int, dim: int) -> str:
+    return f"{strategy}-{chunk_size}-{dim}"
+
+
+def parse_namespace(namespace: str) -> tuple[str, int, int]:
+    """Inverse of namespace_key: (strategy, chunk_size, dim)"""
+    strategy, chunk_size, dim = namespace.rsplit("-", 2)
+    return strategy, int(chunk_size), int(dim)
+
+
+def expand_grid(config: dict) -> list[str]:
+    """Every <chunking_strategy>-<chunk_size>-<num_dims> key described by the config"""
+    chunking, dimensions = config["chunking"], config["dimensions"]
+    sizes = value_range(chunking["min_chunk_size"], chunking["max_chunk_size"], chunking["chunk_size_step"])
+    dims = value_range(dimensions["min"], dimensions["max"], dimensions["step"])
+    return [namespace_key(strategy, size, dim) for strategy in chunking["strategies"] for size in sizes for dim in dims]
+
+
+def existing_namespaces(db: Union[PineconeDB, LocalDB], index_name: str) -> set[str]:
+    """Namespaces already present in an index (empty if the index does not exist yet)"""
+    if isinstance(db, PineconeDB):
+        if index_name not in db.list_indexes(refresh=True):
+            return set()
+        return set(db.describe(index_name, refresh=True)["namespaces"])
+    if index_name not in db.indexes:
+        return set()
+    return set(db.list_namespaces(index_name))
+
+
+class Job():
+    """A unit of work in the plan and the names of the jobs it depends on"""
+    def __init__(self, name: str, fn: Callable[[], None], deps: Optional[list[str]] = None) -> None:
+        self.name: str = name
+        self.fn: Callable[[], None] = fn
+        self.deps: list[str] = deps or []
+
+
+    def __str__(self) -> str:
+        return f"Job(name={self.name}, deps={self.deps})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def run_jobs(jobs: list[Job], max_workers: int = 4) -> list[str]:
+    """
+    Run a job graph on a bounded thread pool, starting each job as soon as its dependencies are done.
+    After a failure no new jobs are started; the running ones finish and the first error is raised.
+    Returns the job names in completion order.
+    """
+    pending = {job.name: job for job in jobs}
+    for job in jobs:
+        for dep in job.deps:
+            if dep not in pending:
+                raise ValueError(f"Job {job.name} depends on unknown job {dep}")
+    done: list[str] = []
+    running = {}
+    error: Optional[BaseException] = None
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while (pending and error is None) or running:
+            if error is None:
+                ready = [job for job in pending.values() if all(dep in done for dep in job.deps)]
+                if not ready and not running:
+                    raise ValueError(f"Jobs have circular dependencies: {', '.join(pending.keys())}")
+                for job in ready:
+                    running[pool.submit(job.fn)] = job.name
+                    del pending[job.name]
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    done.append(name)
+                except Exception as e:
+                    print(f"Job {name} failed: {str(e)}")
+                    error = error or e
+    if error is not None:
+        raise error
+    return done
+
+
+class Plan():
+    """The grid split by how much work each namespace still needs, plus the jobs doing that work"""
+    def __init__(self) -> None:
+        self.upserted: list[str] = []
+        self.embedded: list[str] = []
+        self.chunked: list[str] = []
+        self.missing: list[str] = []
+        self.jobs: list[Job] = []
+
+
+    def __str__(self) -> str:
+        return (
+            f"Plan(upserted={len(self.upserted)}, upsert_only={len(self.embedded)}, "
+            f"embed_and_upsert={len(self.chunked)}, chunk_embed_and_upsert={len(self.missing)}, jobs={len(self.jobs)})"
+        )
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class Planner():
+    """
+    Builds and runs the incremental chunk -> embed -> upsert work graph for an experiment config
+    """
+    def __init__(
+            self,
+            config: dict,
+            client: OpenAI,
+            db: Union[PineconeDB, LocalDB],
+            doc_ids: list[str],
+            texts: list[str],
+            data_dir: str = "data",
+            cache: Optional[EmbeddingCache] = None,
+            metrics: Optional[Metrics] = None,
+        ) -> None:
+        """
+        Create a new Planner
+
+        Args:
+            config: Experiment config (see config.yaml and load_config)
+            client: OpenAI client used by the embedders
+            db: Vector database to upsert into (PineconeDB or LocalDB)
+            doc_ids: Ids of the source documents
+            texts: Texts of the source documents, aligned with doc_ids
+            data_dir: Root of the data/<dataset>/{chunks,embeddings} directories
+            cache: Optional EmbeddingCache shared by the embedders
+            metrics: Metrics shared by the chunkers and embedders, with a span per job (by default
+                     enabled by the metrics key of the config)
+        """
+        if len(doc_ids) != len(texts):
+            raise ValueError(f"Got {len(doc_ids)} document ids and {len(texts)} texts")
+        self.config: dict = config
+        self.client: OpenAI = client
+        self.db: Union[PineconeDB, LocalDB] = db
+        self.doc_ids: list[str] = doc_ids
+        self.texts: list[str] = texts
+        self.cache: Optional[EmbeddingCache] = cache
+
+        self.dataset_name: str = config["dataset_name"]
+        self.index_name: str = config.get("index_name", "{dataset_name}-{dim}")
+        self.model_name: str = config["embedding"]["model_name"]
+        self.metric: str = config["embedding"].get("metric", "cosine")
+        self.dtype: str = config["embedding"].get("dtype", "float32")
+        self.batch_size: int = config["embedding"].get("batch_size", 256)
+        self.chunk_overlap: int = config["chunking"].get("chunk_overlap", 0)
+        self.length_function: str = config["chunking"].get("length_function", "char")
+        self.max_workers: int = config.get("max_workers", 4)
+        self.store_text: bool = config.get("store_text", True)
+        if metrics is None:
+            metrics = Metrics() if config.get("metrics", False) else NULL_METRICS
+        self.metrics: Metrics = metrics
+
+        self.chunk_store: ChunkStore = ChunkStore(f"{data_dir}/{self.dataset_name}/chunks")
+        self.embedding_store: EmbeddingStore = EmbeddingStore(f"{data_dir}/{self.dataset_name}/embeddings")
+        self.source_hash: str = hash_texts(doc_ids, texts)
+        self.embedders: dict[int, Embedder] = {}
+        # sentence distances of the semantic strategy, shared by its chunk sizes
+        self.semantic_memo: DistanceMemo = DistanceMemo()
+
+
+    def __str__(self) -> str:
+        return f"Planner(dataset_name={self.dataset_name}, model_name={self.model_name}, documents={len(self.doc_ids)})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def index_for(self, dim: int) -> str:
+        return self.index_name.format(dataset_name=self.dataset_name, dim=dim)
+
+
+    def embedder(self, dim: int) -> Embedder:
+        """Embedder for one dim (created once and shared by the jobs). Matryoshka so that all dims share one API pass"""
+        if dim not in self.embedders:
+            self.embedders[dim] = Embedder(self.client, self.model_name, dim, self.metric, cache=self.cache, matryoshka=True, metrics=self.metrics)
+        return self.embedders[dim]
+
+
+    def chunk_params(self, strategy: str) -> dict:
+        """Chunker parameters recorded in the chunk set manifest"""
+        params = {"strategy": strategy, "chunk_overlap": self.chunk_overlap, "length_function": self.length_function}
+        if strategy in SWEEP_STRATEGIES:
+            # packed differently from the LangChain splitter: sets written by it are rebuilt
+            params["engine"] = "sweep"
+        return params
+
+
+    def chunk_source(self, strategy: str) -> dict:
+        """Chunk set the stored embeddings of a strategy must have been made from (recorded in their meta.json)"""
+        return {"source_hash": self.source_hash, "params": self.chunk_params(strategy)}
+
+
+    def _is_current(self, namespace: str) -> bool:
+        """Whether a stored namespace was embedded from the current chunk set of its strategy and size"""
+        meta = load_json("meta", self.embedding_store.path(namespace))
+        return meta.get("source") == self.chunk_source(parse_namespace(namespace)[0])
+
+
+    def plan(self) -> Plan:
+        """Compare the grid with the index, embedding store and chunk store and build the jobs for what is missing"""
+        plan = Plan()
+        upserted: dict[int, set[str]] = {}
+        # stored embeddings of an older source or other chunker parameters count as not stored
+        embedded = {namespace for namespace in self.embedding_store.namespaces() if self._is_current(namespace)}
+        fresh: dict[tuple[str, int], bool] = {}
+        to_embed: dict[tuple[str, int], list[int]] = {}
+        to_upsert: dict[tuple[str, int], list[int]] = {}
+
+        for namespace in expand_grid(self.config):
+            strategy, chunk_size, dim = parse_namespace(namespace)
+            if dim not in upserted:
+                upserted[dim] = existing_namespaces(self.db, self.index_for(dim))
+            if namespace in upserted[dim]:
+                plan.upserted.append(namespace)
+                continue
+            to_upsert.setdefault((strategy, chunk_size), []).append(dim)
+            if (strategy, chunk_size) not in fresh:
+                fresh[(strategy, chunk_size)] = self.chunk_store.is_fresh(strategy, chunk_size, self.source_hash, self.chunk_params(strategy))
+            # stored embeddings are only reused while the chunk set they were made from is current
+            if namespace in embedded and fresh[(strategy, chunk_size)]:
+                plan.embedded.append(namespace)
+                continue
+            to_embed.setdefault((strategy, chunk_size), []).append(dim)
+            if fresh[(strategy, chunk_size)]:
+                plan.chunked.append(namespace)
+            else:
+                plan.missing.append(namespace)
+
+        missing_chunks = {parse_namespace(namespace)[:2] for namespace in plan.missing}
+        chunk_jobs: dict[tuple[str, int], str] = {}
+        for strategy in sorted({strategy for strategy, _ in missing_chunks}):
+            chunk_sizes = sorted(chunk_size for missing_strategy, chunk_size in missing_chunks if missing_strategy == strategy)
+            if strategy in SWEEP_STRATEGIES:
+                name = f"chunk:{strategy}-{','.join(str(chunk_size) for chunk_size in chunk_sizes)}"
+                plan.jobs.append(Job(name, self._sweep_job(strategy, chunk_sizes)))
+                chunk_jobs.update({(strategy, chunk_size): name for chunk_size in chunk_sizes})
+                continue
+            for chunk_size in chunk_sizes:
+                name = f"chunk:{strategy}-{chunk_size}"
+                plan.jobs.append(Job(name, self._chunk_job(strategy, chunk_size)))
+                chunk_jobs[(strategy, chunk_size)] = name
+        for (strategy, chunk_size), dims in to_embed.items():
+            deps = [chunk_jobs[(strategy, chunk_size)]] if (strategy, chunk_size) in chunk_jobs else []
+            source_dim = self._wider_namespace(strategy, chunk_size, max(dims), embedded) if fresh[(strategy, chunk_size)] else None
+            plan.jobs.append(Job(f"embed:{strategy}-{chunk_size}", self._embed_job(strategy, chunk_size, dims, source_dim), deps))
+        for (strategy, chunk_size), dims in to_upsert.items():
+            deps = [f"embed:{strategy}-{chunk_size}"] if (strategy, chunk_size) in to_embed else []
+            for dim in dims:
+                namespace = namespace_key(strategy, chunk_size, dim)
+                plan.jobs.append(Job(f"upsert:{namespace}", self._upsert_job(strategy, chunk_size, dim), deps))
+        return plan
+
+
+    def _wider_namespace(self, strategy: str, chunk_size: int, dim: int, embedded: set[str]) -> Optional[int]:
+        """
+        Smallest stored float32 dim >= dim embedded from the current chunk set. Its vectors are prefixes
+        of the full width embeddings, so truncating them gives the same result as a new API pass.
+        """
+        wider = []
+        for namespace in embedded:
+            stored_strategy, stored_size, stored_dim = parse_namespace(namespace)
+            if (stored_strategy, stored_size) == (strategy, chunk_size) and stored_dim >= dim:
+                meta = load_json("meta", self.embedding_store.path(namespace))
+                if meta["dtype"] == "float32" and meta.get("source") == self.chunk_source(strategy):
+                    wider.append(stored_dim)
+        return min(wider) if wider else None
+
+
+    def run(self, plan: Optional[Plan] = None, metrics_dir: str = "results/metrics") -> Plan:
+        """Run a plan (by default a fresh one) and return it. Metrics, if enabled, are written to metrics_dir even if a job fails"""
+        plan = self.plan() if plan is None else plan
+        print(plan)
+        try:
+            run_jobs(plan.jobs, self.max_workers)
+        finally:
+            path = self.metrics.export(f"{self.dataset_name}-{time.strftime('%Y%m%d-%H%M%S')}", metrics_dir)
+            if path is not None:
+                print(f"Saved metrics to {path}")
+        return plan
+
+
+    def query(self, queries: list[str], top_k: int = 10, namespaces: Optional[list[str]] = None, max_workers: int = 16) -> dict[str, tuple[list[list[str]], list[np.ndarray]]]:
+        """
+        Retrieve the queries from every namespace of the grid (or the given ones), embedding them once at
+        full width. Returns the (ids, scores) of each namespace, see PineconeDB.query_namespaces
+        """
+        namespaces = expand_grid(self.config) if namespaces is None else namespaces
+        embedder = self.embedder(VALID_DIMENSIONS[self.model_name])
+        targets = {namespace: self.index_for(parse_namespace(namespace)[2]) for namespace in namespaces}
+        return self.db.query_namespaces(targets, queries, embedder, top_k, max_workers)
+
+
+    def hydrate(self, namespace: str, ids: list[list[str]]) -> list[DocumentBatch]:
+        """Read the chunks of retrieved ids (e.g. from query) from the local chunk store of their namespace"""
+        strategy, chunk_size, _ = parse_namespace(namespace)
+        chunk_set = self.chunk_store.load(strategy, chunk_size)
+        try:
+            return [chunk_set.batch(query_ids) for query_ids in ids]
+        finally:
+            chunk_set.close()
+
+
+    def _span(self, job: str, strategy: str, chunk_size: Union[int, str], dims: Optional[str] = None, dim: Optional[int] = None) -> ContextManager[None]:
+        """Span of one job: everything it records is tagged with the dataset, strategy, chunk size (or sizes) and dim (or dims)"""
+        tags = {"dataset": self.dataset_name, "strategy": strategy, "chunk_size": chunk_size}
+        if dims is not None:
+            tags["dims"] = dims
+        if dim is not None:
+            tags["dim"] = dim
+        return self.metrics.span(f"planner.{job}_seconds", **tags)
+
+
+    def _sweep_job(self, strategy: str, chunk_sizes: list[int]) -> Callable[[], None]:
+        def run() -> None:
+            sizes = ",".join(str(chunk_size) for chunk_size in chunk_sizes)
+            with self._span("chunk", strategy, sizes):
+                print(f"Chunking {strategy}/{sizes}...")
+                sweep = SweepChunker([(chunk_size, self.chunk_overlap) for chunk_size in chunk_sizes], self.length_function)
+                span_sets = sweep.split(self.doc_ids, self.texts)
+                for chunk_size in chunk_sizes:
+                    spans = span_sets[(chunk_size, self.chunk_overlap)]
+                    self.metrics.count("chunker.chunks", len(spans), strategy=strategy, chunk_size=chunk_size, length_function=self.length_function)
+                    self.chunk_store.write_spans(strategy, chunk_size, spans, self.texts, self.source_hash, self.chunk_params(strategy))
+        return run
+
+
+    def _chunk_job(self, strategy: str, chunk_size: int) -> Callable[[], None]:
+        def run() -> None:
+            embedder = self.embedder(VALID_DIMENSIONS[self.model_name]) if strategy == "semantic" else None
+            chunker = Chunker(
+                chunk_size, self.chunk_overlap, strategy, self.length_function,
+                embedder=embedder, semantic_memo=self.semantic_memo, metrics=self.metrics
+            )
+
+            def chunks():
+                for start in range(0, len(self.texts), self.batch_size):
+                    doc_ids = self.doc_ids[start:start + self.batch_size]
+                    for doc_id, doc_chunks in zip(doc_ids, chunker.split_many(self.texts[start:start + self.batch_size])):
+                        for chunk in doc_chunks:
+                            yield doc_id, chunk.page_content
+
+            with self._span("chunk", strategy, chunk_size):
+                self.chunk_store.get_or_build(strategy, chunk_size, self.source_hash, self.chunk_params(strategy), chunks)
+        return run
+
+
+    def _embed_job(self, strategy: str, chunk_size: int, dims: list[int], source_dim: Optional[int] = None) -> Callable[[], None]:
+        def run() -> None:
+            with self._span("embed", strategy, chunk_size, ",".join(str(dim) for dim in sorted(dims))):
+                chunk_set = self.chunk_store.load(strategy, chunk_size)
+                chunk_source = {"source_hash": chunk_set.manifest["source_hash"], "params": chunk_set.manifest["params"]}
+                # writers abort on an error and leave no meta.json behind, so the namespace is planned again next run
+                try:
+                    with ExitStack() as stack:
+                        writers = {
+                            dim: stack.enter_context(self.embedding_store.writer(namespace_key(strategy, chunk_size, dim), dim, self.dtype, chunk_source))
+                            for dim in dims
+                        }
+                        # chunk ids <doc_id>-<chunk_number>, as written by Pipeline
+                        ids, counts = [], {}
+                        for i in range(len(chunk_set)):
+                            doc_id = chunk_set.doc_id(i)
+                            ids.append(f"{doc_id}-{counts.get(doc_id, 0)}")
+                            counts[doc_id] = counts.get(doc_id, 0) + 1
+
+                        embedder = self.embedder(max(dims))
+                        source = self.embedding_store.load(namespace_key(strategy, chunk_size, source_dim)) if source_dim is not None else None
+                        for start in range(0, len(chunk_set), self.batch_size):
+                            end = min(start + self.batch_size, len(chunk_set))
+                            if source is not None:
+                                wide = source.matrix(start, end)
+                                embeddings = {dim: embedder.truncate(wide, dim) for dim in dims}
+                            else:
+                                embeddings = embedder.embed_dims([chunk_set[i] for i in range(start, end)], dims)
+                            for dim, writer in writers.items():
+                                writer.append(ids[start:end], embeddings[dim])
+                finally:
+                    chunk_set.close()
+        return run
+
+
+    def _upsert_job(self, strategy: str, chunk_size: int, dim: int) -> Callable[[], None]:
+        def run() -> None:
+            with self._span("upsert", strategy, chunk_size, dim=dim):
+                namespace = namespace_key(strategy, chunk_size, dim)
+                index_name = self.index_for(dim)
+                embedder = self.embedder(dim)
+                stored = self.embedding_store.load(namespace)
+                if stored.source != self.chunk_source(strategy):
+                    raise ValueError(f"Stored embeddings of namespace {namespace} were not made from the current chunk set, plan again to re-embed them")
+                chunk_set = self.chunk_store.load(strategy, chunk_size)
+                try:
+                    row = 0
+                    for ids, embeddings in stored.iter_batches(self.batch_size):
+                        rows = range(row, row + len(ids))
+                        docs = DocumentBatch.from_columns(ids, (chunk_set.doc_id(i) for i in rows), (chunk_set[i] for i in rows))
+                        self.db.upsert_batch(index_name, namespace, embedder, docs, embeddings, include_text=self.store_text)
+                        row += len(ids)
+                finally:
+                    chunk_set.close()
+        return run
@@ -0,0 +1,21 @@
+import tiktoken
+from functools import lru_cache
+
+
+# https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+# cl100k_base is the encoding for gpt models and the text-embedding-3 models
+DEFAULT_ENCODING: str = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+    """Return a process-wide cached tiktoken encoding (tiktoken names are lowercase, e.g. cl100k_base)"""
+    return tiktoken.get_encoding(encoding_name.lower())
+
+
+def count_tokens(texts: list[str], encoding_name: str = DEFAULT_ENCODING) -> list[int]:
+    """Return the number of tokens in each text, tokenizing the whole list in one batch"""
+    if not texts:
+        return []
+    encoding = get_encoding(encoding_name)
+    return [len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=())]
@@ -0,0 +1,241 @@
+"""
+Local per-namespace embedding store, so embeddings can be re-upserted or evaluated without paying
+to embed again:
+
+    data/<dataset>/embeddings/<chunking_strategy>-<chunk_size>-<num_dims>/
+        meta.json     dtype, dimension, vector count and the chunk set the vectors were made from
+        vectors.bin   row-major vectors as float32, float16 or int8
+        scales.bin    float32 per-vector scale factors (int8 only)
+        ids.txt       one vector id per line, aligned with the rows
+
+float16 halves and int8 quarters the size of float32. int8 uses symmetric per-vector scalar
+quantization: x ~= scale * q with scale = max(|x|) / 127.
+"""
+import os
+import json
+import numpy as np
+from .embedder import VALID_METRICS, format_list
+from typing import Iterator, Optional
+
+
+VALID_DTYPES: list[str] = ["float32", "float16", "int8"]
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization. Returns (codes, scales)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    codes = np.rint(vectors / np.where(scales == 0, 1, scales)[:, None])
+    return np.clip(codes, -127, 127).astype(np.int8), scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Inverse of quantize_int8"""
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class NamespaceWriter():
+    """Appends batches of vectors to a namespace of an EmbeddingStore. Use as a context manager"""
+    def __init__(self, path: str, dimension: int, dtype: str = "float32", source: Optional[dict] = None) -> None:
+        if dtype not in VALID_DTYPES:
+            raise ValueError(f"Invalid dtype: {dtype}. Valid dtypes are: {format_list(VALID_DTYPES)}")
+        self.path: str = path
+        self.dimension: int = dimension
+        self.dtype: str = dtype
+        self.source: Optional[dict] = source
+        self.count: int = 0
+        os.makedirs(path, exist_ok=True)
+        self.vectors = open(os.path.join(path, "vectors.bin"), "wb")
+        self.scales = open(os.path.join(path, "scales.bin"), "wb") if dtype == "int8" else None
+        self.ids = open(os.path.join(path, "ids.txt"), "w", encoding="utf-8")
+
+
+    def __enter__(self) -> "NamespaceWriter":
+        return self
+
+
+    def __exit__(self, exc_type, *args) -> None:
+        # a failed write leaves the namespace incomplete instead of marking a partial one as complete
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+    def append(self, ids: list[str], embeddings: np.ndarray) -> None:
+        """Write a batch of vectors (any float matrix of shape (len(ids), dimension))"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape != (len(ids), self.dimension):
+            raise ValueError(f"Embeddings shape {embeddings.shape} does not match ({len(ids)}, {self.dimension})")
+        if self.dtype == "int8":
+            codes, scales = quantize_int8(embeddings)
+            self.vectors.write(codes.tobytes())
+            self.scales.write(scales.tobytes())
+        else:
+            self.vectors.write(embeddings.astype(self.dtype).tobytes())
+        self.ids.write("".join(f"{id}\n" for id in ids))
+        self.count += len(ids)
+
+
+    def abort(self) -> None:
+        """Close the files without writing meta.json, leaving the namespace incomplete"""
+        self.vectors.close()
+        self.ids.close()
+        if self.scales is not None:
+            self.scales.close()
+
+
+    def close(self) -> None:
+        """Flush the files and write meta.json, which marks the namespace as complete"""
+        if self.vectors.closed:
+            return
+        self.abort()
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump({"dtype": self.dtype, "dimension": self.dimension, "count": self.count, "source": self.source}, file, indent=4)
+
+
+class StoredEmbeddings():
+    """Memory mapped view of one namespace of an EmbeddingStore"""
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.path: str = path
+        self.dtype: str = meta["dtype"]
+        self.dimension: int = meta["dimension"]
+        self.count: int = meta["count"]
+        # e.g. the source hash and chunker parameters of the chunk set (None if not recorded)
+        self.source: Optional[dict] = meta.get("source")
+        with open(os.path.join(path, "ids.txt"), "r", encoding="utf-8") as file:
+            self.ids: list[str] = file.read().splitlines()
+
+        shape = (self.count, self.dimension)
+        self.vectors: np.ndarray = np.memmap(os.path.join(path, "vectors.bin"), dtype=self.dtype, mode="r", shape=shape) if self.count else np.empty(shape, dtype=self.dtype)
+        self.scales: Optional[np.ndarray] = None
+        if self.dtype == "int8":
+            self.scales = np.memmap(os.path.join(path, "scales.bin"), dtype=np.float32, mode="r", shape=(self.count,)) if self.count else np.empty(0, dtype=np.float32)
+
+
+    def __str__(self) -> str:
+        return f"StoredEmbeddings(path={self.path}, dtype={self.dtype}, dimension={self.dimension}, count={self.count})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def __len__(self) -> int:
+        return self.count
+
+
+    def matrix(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Rows start:end as a float32 matrix (dequantized if needed)"""
+        end = self.count if end is None else end
+        if self.dtype == "int8":
+            return dequantize_int8(self.vectors[start:end], self.scales[start:end])
+        return np.asarray(self.vectors[start:end], dtype=np.float32)
+
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[tuple[list[str], np.ndarray]]:
+        """Iterate over (ids, float32 embeddings) blocks, e.g. to re-upsert a namespace"""
+        for start in range(0, self.count, batch_size):
+            yield self.ids[start:start + batch_size], self.matrix(start, start + batch_size)
+
+
+    def search(self, queries: np.ndarray, top_k: int = 5, metric: str = "cosine", block_size: int = 65536) -> tuple[list[list[str]], np.ndarray]:
+        """
+        Exact search streamed over the stored rows block by block, so only one dequantized block is in
+        memory at a time. Returns the ids and scores of the top_k matches per query (scores as in LocalDB).
+        """
+        if metric not in VALID_METRICS:
+            raise ValueError(f"Invalid metric: {metric}. Valid metrics are: {format_list(VALID_METRICS)}")
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if metric == "cosine":
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1, norms)
+        k = min(top_k, self.count)
+        best_rows = np.empty((queries.shape[0], 0), dtype=np.int64)
+        best_ranking = np.empty((queries.shape[0], 0), dtype=np.float32)
+
+        for start in range(0, self.count, block_size):
+            block = self.matrix(start, start + block_size)
+            ranking = queries @ block.T
+            if metric == "cosine":
+                norms = np.linalg.norm(block, axis=1)
+                ranking /= np.where(norms == 0, 1, norms)
+            elif metric == "euclidean":
+                ranking = 2 * ranking - np.einsum("ij,ij->i", block, block)
+            # merge this block's candidates with the running top-k
+            ranking = np.concatenate([best_ranking, ranking], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + block.shape[0]), (queries.shape[0], block.shape[0]))], axis=1)
+            if ranking.shape[1] > k:
+                top = np.argpartition(-ranking, k - 1, axis=1)[:, :k]
+                ranking = np.take_along_axis(ranking, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_ranking, best_rows = ranking, rows
+
+        order = np.argsort(-best_ranking, axis=1, kind="stable")
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        scores = np.take_along_axis(best_ranking, order, axis=1)
+        if metric == "euclidean":
+            scores = np.sqrt(np.maximum(np.einsum("ij,ij->i", queries, queries)[:, None] - scores, 0))
+        return [[self.ids[row] for row in query_rows] for query_rows in best_rows.tolist()], scores
+
+
+class EmbeddingStore():
+    """Per-namespace embedding files under <root>/<namespace>"""
+    def __init__(self, root: str) -> None:
+        """
+        Create a new EmbeddingStore
+
+        Args:
+            root: Embedding directory of a dataset, e.g. data/cisi/embeddings
+        """
+        self.root: str = root
+
+
+    def __str__(self) -> str:
+        return f"EmbeddingStore(root={self.root}, namespaces={len(self.namespaces())})"
+
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+    def path(self, namespace: str) -> str:
+        return os.path.join(self.root, namespace)
+
+
+    def namespaces(self) -> list[str]:
+        """Every completed namespace in the store"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.exists(os.path.join(self.root, name, "meta.json")))
+
+
+    def exists(self, namespace: str) -> bool:
+        return os.path.exists(os.path.join(self.path(namespace), "meta.json"))
+
+
+    def writer(self, namespace: str, dimension: int, dtype: str = "float32", source: Optional[dict] = None) -> NamespaceWriter:
+        """Open a namespace for writing (replacing any previous contents). source is recorded in meta.json"""
+        meta = os.path.join(self.path(namespace), "meta.json")
+        if os.path.exists(meta):
+            os.remove(meta)
+        return NamespaceWriter(self.path(namespace), dimension, dtype, source)
+
+
+    def write(self, namespace: str, ids: list[str], embeddings: np.ndarray, dtype: str = "float32", source: Optional[dict] = None) -> StoredEmbeddings:
+        """Write a whole namespace at once"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self.writer(namespace, embeddings.shape[1], dtype, source) as writer:
+            writer.append(ids, embeddings)
+        return self.load(namespace)
+
+
+    def load(self, namespace: str) -> StoredEmbeddings:
+        """Open a namespace for reading"""
+        if not self.exists(namespace):
+            raise ValueError(f"Namespace {namespace} does not exist in {self.root}")
+        return StoredEmbeddings(self.path(namespace))
@@ -0,0 +1,80 @@
+import asyncio
+import numpy as np
+import openai
+import pytest
+from openai import AsyncOpenAI
+from bench.fakes import FakeEmbeddingServer
+from src.async_embedder import AsyncEmbedder, RateLimiter
+from src.cache import EmbeddingCache
+
+
+TEXTS: list[list[str]] = [["alpha", "beta"], ["gamma"], ["delta"]]
+
+
+@pytest.fixture
+def embedder():
+    # every text is cached, so no request is ever sent
+    cache = EmbeddingCache(None)
+    for i, text in enumerate(text for batch in TEXTS for text in batch):
+        cache.put("text-embedding-3-small", 4, text, [float(i)] * 4)
+    client = AsyncOpenAI(base_url="http://127.0.0.1:9/v1", api_key="fake")
+    return AsyncEmbedder(client, "text-embedding-3-small", 4, cache=cache, max_pending=1)
+
+
+async def collect(embedder, text_batches):
+    return [(texts, embeddings) async for texts, embeddings in embedder.embed_stream(text_batches)]
+
+
+def test_embed_stream_in_order(embedder):
+    results = asyncio.run(collect(embedder, iter(TEXTS)))
+    assert [texts for texts, _ in results] == TEXTS
+    assert np.array_equal(results[1][1], np.full((1, 4), 2.0, dtype=np.float32))
+
+
+def test_embed_stream_reraises_generator_error(embedder):
+    seen = []
+
+    def batches():
+        yield TEXTS[0]
+        yield TEXTS[1]
+        raise RuntimeError("source failed")
+
+    async def consume():
+        async for texts, _ in embedder.embed_stream(batches()):
+            seen.append(texts)
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        asyncio.run(asyncio.wait_for(consume(), timeout=5))
+    assert seen == TEXTS[:2]
+
+
+def test_embed_stream_reraises_async_generator_error(embedder):
+    async def batches():
+        raise RuntimeError("source failed")
+        yield TEXTS[0]
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        asyncio.run(asyncio.wait_for(collect(embedder, batches()), timeout=5))
+
+
+def test_rate_limited_requests_halve_the_rate():
+    with FakeEmbeddingServer(rate_limit_probability=1.0, retry_after=0.01) as server:
+        limiter = RateLimiter(base_backoff=0.01)
+        embedder = AsyncEmbedder(AsyncOpenAI(base_url=server.url, api_key="fake"), "text-embedding-3-small", 4, limiter=limiter, max_retries=2)
+        with pytest.raises(openai.RateLimitError):
+            asyncio.run(embedder._create(["alpha"], 4, tokens=2))
+    assert embedder.stats["rate_limited"] == 3 and embedder.stats["retries"] == 2
+    assert limiter.scale == 0.125
+    assert server.rate_limited == 3 and server.requests == 0
+
+
+def test_buckets_are_clamped_to_the_rate_limit_headers():
+    with FakeEmbeddingServer(requests_per_minute=10, tokens_per_minute=1000) as server:
+        limiter = RateLimiter(requests_per_minute=3000, tokens_per_minute=1_000_000)
+        limiter.scale = 0.5
+        embedder = AsyncEmbedder(AsyncOpenAI(base_url=server.url, api_key="fake"), "text-embedding-3-small", 4, limiter=limiter)
+        embeddings = asyncio.run(embedder._create(["alpha", "beta"], 4, tokens=4))
+    assert np.array(embeddings).shape == (2, 4)
+    assert limiter.request_level <= 9 and limiter.token_level <= 1000 - server.tokens
+    assert limiter.scale == 0.5 * 1.05
+    assert embedder.stats["requests"] == 1 and embedder.stats["tokens"] == server.tokens
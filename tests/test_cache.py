@@ -0,0 +1,120 @@
+import sqlite3
+import numpy as np
+import pytest
+from src.cache import EmbeddingCache, QueryCache, query_key
+
+
+RESULT: tuple[list[str], np.ndarray] = (["1-0", "2-3"], np.array([0.9, 0.5], dtype=np.float32))
+
+
+def key(version: int, query: str = "query") -> str:
+    return query_key("index", "ns", "model", 256, 10, version, query)
+
+
+def test_put_and_get():
+    cache = QueryCache(None, settle_seconds=0)
+    cache.put_many("index", "ns", 0, [key(0)], [RESULT])
+    [(ids, scores)] = cache.get_many([key(0)])
+    assert ids == RESULT[0]
+    assert np.array_equal(scores, RESULT[1])
+    assert cache.get_many([key(0, "other")]) == [None]
+
+
+def test_results_of_an_old_version_are_not_stored():
+    cache = QueryCache(None, settle_seconds=0)
+    version = cache.version("index", "ns")
+    cache.invalidate("index", "ns")
+    cache.put_many("index", "ns", version, [key(version)], [RESULT])
+    assert len(cache) == 0
+    assert cache.version("index", "ns") == version + 1
+
+
+def test_results_are_not_stored_until_the_write_settles():
+    cache = QueryCache(None, settle_seconds=30)
+    cache.invalidate("index", "ns")
+    version = cache.version("index", "ns")
+    cache.put_many("index", "ns", version, [key(version)], [RESULT])
+    assert len(cache) == 0
+    # other namespaces are not affected
+    cache.put_many("index", "other", 0, [key(0)], [RESULT])
+    assert len(cache) == 1
+
+    cache.conn.execute("UPDATE versions SET updated = updated - 60")
+    cache.put_many("index", "ns", version, [key(version)], [RESULT])
+    assert len(cache) == 2
+
+
+def test_invalidate_index_bumps_every_namespace():
+    cache = QueryCache(None, settle_seconds=0)
+    cache.put_many("index", "a", 0, [key(0, "a")], [RESULT])
+    cache.put_many("index", "b", 0, [key(0, "b")], [RESULT])
+    cache.invalidate("index")
+    assert len(cache) == 0
+    assert cache.version("index", "a") == cache.version("index", "b") == 1
+
+
+def test_old_schema_is_migrated(tmp_path):
+    path = str(tmp_path / "queries.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE versions (index_name TEXT, namespace TEXT, version INTEGER NOT NULL, PRIMARY KEY (index_name, namespace))")
+    conn.execute("INSERT INTO versions VALUES ('index', 'ns', 3)")
+    conn.commit()
+    conn.close()
+
+    cache = QueryCache(path, settle_seconds=30)
+    assert cache.version("index", "ns") == 3
+    # no recorded write time: nothing to wait for
+    cache.put_many("index", "ns", 3, [key(3)], [RESULT])
+    assert len(cache) == 1
+    cache.close()
+
+
+def test_invalid_settle_seconds():
+    with pytest.raises(ValueError):
+        QueryCache(None, settle_seconds=-1)
+
+
+def test_embedding_cache_hit_and_miss():
+    cache = EmbeddingCache(None)
+    cache.put("model", 4, "alpha", [1.0, 2.0, 3.0, 4.0])
+    assert np.array_equal(cache.get("model", 4, "alpha"), np.array([1, 2, 3, 4], dtype=np.float32))
+    assert cache.get_many("model", 4, ["alpha", "beta"])[1] is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_embedding_cache_keys_by_model_and_dim():
+    cache = EmbeddingCache(None)
+    cache.put("model", 4, "alpha", [1.0] * 4)
+    assert cache.get("other", 4, "alpha") is None
+    assert cache.get("model", 2, "alpha") is None
+
+
+def test_embedding_cache_evicts_least_recently_used():
+    cache = EmbeddingCache(None, max_memory_items=2)
+    cache.put_many("model", 2, ["a", "b"], [[1.0, 0.0], [0.0, 1.0]])
+    cache.get("model", 2, "a")
+    cache.put("model", 2, "c", [1.0, 1.0])
+    assert len(cache.memory) == 2
+    assert cache.get("model", 2, "b") is None
+    assert cache.get("model", 2, "a") is not None and cache.get("model", 2, "c") is not None
+
+
+def test_embedding_cache_copies_rows_of_a_batch():
+    cache = EmbeddingCache(None)
+    embeddings = np.ones((3, 4), dtype=np.float32)
+    cache.put_many("model", 4, ["a", "b", "c"], embeddings)
+    embeddings[:] = 0
+    vector = cache.get("model", 4, "b")
+    assert vector.base is None and np.array_equal(vector, np.ones(4, dtype=np.float32))
+
+
+def test_embedding_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many("model", 2, ["a", "b"], [[1.0, 0.0], [0.0, 1.0]])
+    cache.close()
+
+    cache = EmbeddingCache(path, max_memory_items=0)
+    assert len(cache) == 2
+    assert np.array_equal(cache.get("model", 2, "b"), np.array([0, 1], dtype=np.float32))
+    cache.close()
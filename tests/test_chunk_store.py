@@ -0,0 +1,96 @@
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+from src.chunk_store import ChunkStore, hash_texts
+
+
+DOC_IDS: list[str] = ["a", "b", "c-1"]
+TEXTS: list[str] = ["alpha one. alpha two.", "beta ü.", "gamma"]
+# chunks of different documents interleaved, as a parallel writer may produce them
+CHUNKS: list[tuple[str, str]] = [("a", "alpha one."), ("b", "beta ü."), ("a", "alpha two."), ("c-1", "gamma")]
+PARAMS: dict = {"chunk_overlap": 0, "length_function": "char"}
+
+
+def test_write_and_load(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    chunk_set = store.write("recursive", 100, iter(CHUNKS), hash_texts(DOC_IDS, TEXTS), PARAMS)
+    assert list(chunk_set) == [text for _, text in CHUNKS]
+    assert [chunk_set.doc_id(i) for i in range(len(chunk_set))] == [doc_id for doc_id, _ in CHUNKS]
+    assert store.chunk_sets() == [("recursive", 100)]
+    assert store.manifest("recursive", 100)["chunks"] == 4
+    chunk_set.close()
+
+    chunk_set = store.load("recursive", 100, use_mmap=False)
+    assert chunk_set[1] == "beta ü."
+    chunk_set.close()
+
+
+def test_rows_maps_chunk_ids(tmp_path):
+    chunk_set = ChunkStore(str(tmp_path)).write("recursive", 100, iter(CHUNKS), "hash", PARAMS)
+    rows = chunk_set.rows(["a-0", "a-1", "b-0", "c-1-0", "a-2", "d-0", "a", "b-x"])
+    assert rows.tolist() == [0, 2, 1, 3, -1, -1, -1, -1]
+    batch = chunk_set.batch(["a-1", "c-1-0"])
+    assert batch.texts() == ["alpha two.", "gamma"] and batch.source(1) == "c-1"
+    with pytest.raises(ValueError):
+        chunk_set.batch(["a-2"])
+    chunk_set.close()
+
+
+def test_is_fresh_follows_source_and_params(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    source_hash = hash_texts(DOC_IDS, TEXTS)
+    assert not store.is_fresh("recursive", 100, source_hash, PARAMS)
+    store.write("recursive", 100, iter(CHUNKS), source_hash, PARAMS).close()
+    assert store.is_fresh("recursive", 100, source_hash, PARAMS)
+    assert not store.is_fresh("recursive", 100, hash_texts(DOC_IDS, TEXTS[:2] + ["gamma changed"]), PARAMS)
+    assert not store.is_fresh("recursive", 100, source_hash, {**PARAMS, "chunk_overlap": 10})
+
+
+def test_get_or_build_only_builds_when_stale(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    builds = []
+
+    def build():
+        builds.append(1)
+        return iter(CHUNKS)
+
+    for source_hash in ["one", "one", "two"]:
+        store.get_or_build("recursive", 100, source_hash, PARAMS, build).close()
+    assert len(builds) == 2
+
+
+def test_failed_write_leaves_no_manifest(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.write("recursive", 100, iter(CHUNKS), "old", PARAMS).close()
+
+    def chunks():
+        yield CHUNKS[0]
+        raise RuntimeError("chunker failed")
+
+    with pytest.raises(RuntimeError):
+        store.write("recursive", 100, chunks(), "new", PARAMS)
+    # the incomplete set has no manifest and the previous one is untouched
+    assert not os.path.exists(os.path.join(store.path("recursive", 100) + ".tmp", "manifest.json"))
+    assert store.manifest("recursive", 100)["source_hash"] == "old"
+    chunk_set = store.load("recursive", 100)
+    assert len(chunk_set) == 4
+    chunk_set.close()
+
+
+def test_manifest_is_written_last(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.write("recursive", 100, iter(CHUNKS), "hash", PARAMS).close()
+    path = store.path("recursive", 100)
+    mtimes = {name: os.stat(os.path.join(path, name)).st_mtime_ns for name in os.listdir(path)}
+    assert set(mtimes) == {"manifest.json", "text.bin", "offsets.npy", "doc_index.npy", "doc_ids.json"}
+    assert mtimes["manifest.json"] == max(mtimes.values())
+
+
+def test_empty_chunk_set(tmp_path):
+    chunk_set = ChunkStore(str(tmp_path)).write("recursive", 100, iter([]), "hash", PARAMS)
+    assert len(chunk_set) == 0 and chunk_set.rows(["a-0"]).tolist() == [-1]
+    assert np.array_equal(chunk_set.offsets, [0])
+    chunk_set.close()
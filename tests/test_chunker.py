@@ -0,0 +1,182 @@
+import random
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+from src.chunker import WORD_PATTERN, DistanceMemo, SemanticSplitter, SweepChunker, TokenLength, num_tokens_from_string, pack_spans, segment
+from src.tokens import get_encoding
+from tests.test_local_db import WordEmbedder
+
+
+def has_encoding() -> bool:
+    try:
+        get_encoding()
+        return True
+    except Exception:
+        return False
+
+
+needs_encoding = pytest.mark.skipif(not has_encoding(), reason="tiktoken encoding not available")
+
+
+TEXT: str = (
+    "Information retrieval is the science of searching for information in a document. "
+    "Automated information retrieval systems are used to reduce information overload. "
+    "Many universities and public libraries use retrieval systems to provide access to books, journals and other documents."
+)
+
+
+@needs_encoding
+def test_token_length_matches_a_direct_count():
+    length = TokenLength(min_lookup_length=16).bind(TEXT)
+    # substrings on word boundaries tokenize the same inside and outside the document
+    boundaries = [0] + [i for i, char in enumerate(TEXT) if char == " "] + [len(TEXT)]
+    for start in boundaries[::3]:
+        for end in boundaries[::5]:
+            if end - start >= 16:
+                assert length(TEXT[start:end]) == num_tokens_from_string(TEXT[start:end])
+
+
+@needs_encoding
+def test_token_length_falls_back_to_encoding():
+    length = TokenLength().bind(TEXT)
+    for string in ["not a substring of the bound document at all", "short", ""]:
+        assert length(string) == num_tokens_from_string(string)
+    length.unbind()
+    assert length(TEXT) == num_tokens_from_string(TEXT)
+
+
+def document(seed: int, words: int = 400) -> str:
+    """Random words with line and paragraph breaks, and the odd word longer than a chunk"""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(words):
+        word = "x" * 120 if rng.random() < 0.01 else "".join(rng.choice("abcdefgh") for _ in range(rng.randint(1, 9)))
+        parts.append(word + rng.choice([" "] * 12 + ["  ", "\n", "\n\n"]))
+    return "".join(parts)
+
+
+def check_chunks(text: str, starts: np.ndarray, ends: np.ndarray, chunk_size: int, chunk_overlap: int) -> None:
+    words = [match.span() for match in WORD_PATTERN.finditer(text)]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        # only a single word longer than a chunk may exceed the size
+        assert end - start <= chunk_size or WORD_PATTERN.fullmatch(text[start:end])
+    # every word is in a chunk, and chunks never cut a word
+    covered = np.zeros(len(text), dtype=bool)
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        covered[start:end] = True
+    assert all(covered[start:end].all() for start, end in words)
+    assert set(starts.tolist()) <= {start for start, _ in words} and set(ends.tolist()) <= {end for _, end in words}
+    # consecutive chunks advance and overlap by at most chunk_overlap
+    assert (np.diff(starts) > 0).all()
+    overlaps = ends[:-1] - starts[1:]
+    assert (overlaps <= chunk_overlap).all()
+    if chunk_overlap == 0:
+        assert (overlaps <= 0).all()
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(100, 0), (100, 20), (400, 100), (50, 49)])
+def test_pack_spans(chunk_size, chunk_overlap):
+    for seed in range(5):
+        text = document(seed)
+        starts, ends = pack_spans(*segment(text), chunk_size, chunk_overlap)
+        check_chunks(text, starts, ends, chunk_size, chunk_overlap)
+        if chunk_overlap >= 20:
+            assert (ends[:-1] > starts[1:]).mean() > 0.5
+
+
+def test_pack_spans_prefers_paragraph_breaks():
+    text = "one two three\n\nfour five six seven eight nine ten"
+    starts, ends = pack_spans(*segment(text), 30, 0)
+    assert text[starts[0]:ends[0]] == "one two three"
+
+
+def test_pack_spans_of_an_empty_document():
+    starts, ends = pack_spans(*segment("  \n "), 100, 10)
+    assert len(starts) == len(ends) == 0
+
+
+def test_sweep_chunker_matches_pack_spans():
+    texts = [document(seed, words=200) for seed in range(7)] + [""]
+    doc_ids = [str(i) for i in range(len(texts))]
+    configs = [(100, 0), (200, 50)]
+    span_sets = SweepChunker(configs, docs_per_task=3).split(doc_ids, texts)
+    pooled = SweepChunker(configs, max_workers=2, docs_per_task=3).split(doc_ids, texts)
+    for config in configs:
+        for column in ("doc_index", "starts", "ends"):
+            assert np.array_equal(getattr(pooled[config], column), getattr(span_sets[config], column))
+    for config in configs:
+        span_set = span_sets[config]
+        chunks = list(span_set.texts(texts))
+        expected = []
+        for text in texts:
+            starts, ends = pack_spans(*segment(text), *config)
+            expected += [text[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+        assert chunks == expected
+        assert span_set.text(len(span_set) - 1, texts) == expected[-1]
+        for doc in range(len(texts)):
+            rows = span_set.doc_index == doc
+            check_chunks(texts[doc], span_set.starts[rows], span_set.ends[rows], *config)
+
+
+def test_sweep_chunker_rejects_invalid_configs():
+    with pytest.raises(ValueError):
+        SweepChunker([(100, 100)])
+    with pytest.raises(ValueError):
+        SweepChunker([(100, 0)], length_function="words")
+
+
+def test_distance_memo_evicts_least_recently_used():
+    memo = DistanceMemo(max_items=2)
+    memo.put("a", np.zeros(1))
+    memo.put("b", np.ones(1))
+    assert memo.get("a") is not None
+    memo.put("c", np.ones(2))
+    assert len(memo) == 2 and memo.get("b") is None
+    assert memo.get("a") is not None and memo.get("c") is not None
+    with pytest.raises(ValueError):
+        DistanceMemo(max_items=0)
+
+
+def test_distance_memo_keys_by_embedder_and_buffer_size():
+    memo = DistanceMemo()
+    keys = {memo.key(WordEmbedder(4), 1, "text"), memo.key(WordEmbedder(2), 1, "text"), memo.key(WordEmbedder(4), 2, "text"), memo.key(WordEmbedder(4), 1, "other")}
+    assert len(keys) == 4
+
+
+class CountingEmbedder(WordEmbedder):
+    def __init__(self) -> None:
+        super().__init__()
+        self.texts = 0
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        self.texts += len(texts)
+        return super().embed_batch(texts)
+
+
+SENTENCES: str = "Apple pie. Apple tart. Apple cake. Banana bread. Banana split. Cherry jam. Cherry pie. Date cake. Date loaf. Apple juice."
+
+
+def test_semantic_splitters_share_distances_through_the_memo():
+    embedder, memo = CountingEmbedder(), DistanceMemo()
+    small = SemanticSplitter(embedder, chunk_size=30, memo=memo, breakpoint_percentile=50)
+    large = SemanticSplitter(embedder, chunk_size=60, memo=memo, breakpoint_percentile=50)
+    small.split_texts([SENTENCES, SENTENCES])
+    assert embedder.texts == 10 and len(memo) == 1
+    large.split_text(SENTENCES)
+    assert embedder.texts == 10
+
+
+def test_semantic_splitter_applies_overlap():
+    splitter = SemanticSplitter(WordEmbedder(), chunk_size=30, chunk_overlap=12, breakpoint_percentile=100)
+    chunks = [splitter.sentences(chunk) for chunk in splitter.split_text(SENTENCES)]
+    assert all(len(" ".join(chunk)) <= 30 for chunk in chunks)
+    # dropping the sentences repeated from the previous chunk gives back the text
+    sentences, carried = list(chunks[0]), 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        repeated = max(n for n in range(len(chunk)) if n == 0 or previous[-n:] == chunk[:n])
+        assert len(" ".join(chunk[:repeated])) <= 12
+        carried += repeated
+        sentences += chunk[repeated:]
+    assert " ".join(sentences) == SENTENCES and carried > 0
@@ -0,0 +1,41 @@
+import pytest
+from src.embedder import MAX_BATCH_INPUTS, MAX_INPUT_TOKENS, MAX_REQUEST_TOKENS, plan_batches
+
+
+def check(batches: list[list[int]], token_counts: list[int]) -> None:
+    assert sorted(i for batch in batches for i in batch) == list(range(len(token_counts)))
+    for batch in batches:
+        assert len(batch) <= MAX_BATCH_INPUTS
+        assert sum(token_counts[i] for i in batch) <= MAX_REQUEST_TOKENS
+
+
+def test_plan_batches_splits_by_input_count():
+    token_counts = [1] * (2 * MAX_BATCH_INPUTS + 1)
+    batches = plan_batches(token_counts)
+    check(batches, token_counts)
+    assert [len(batch) for batch in batches] == [MAX_BATCH_INPUTS, MAX_BATCH_INPUTS, 1]
+
+
+def test_plan_batches_splits_by_request_tokens():
+    token_counts = [MAX_INPUT_TOKENS] * 100
+    batches = plan_batches(token_counts)
+    check(batches, token_counts)
+    per_request = MAX_REQUEST_TOKENS // MAX_INPUT_TOKENS
+    assert [len(batch) for batch in batches] == [per_request, per_request, 100 - 2 * per_request]
+
+
+def test_plan_batches_takes_longest_first():
+    token_counts = [5, 500, 50, 8000, 1]
+    batches = plan_batches(token_counts, max_inputs=2)
+    check(batches, token_counts)
+    assert batches == [[3, 1], [2, 0], [4]]
+
+
+def test_plan_batches_rejects_inputs_over_the_token_limit():
+    plan_batches([MAX_INPUT_TOKENS])
+    with pytest.raises(ValueError, match="index 1"):
+        plan_batches([1, MAX_INPUT_TOKENS + 1])
+
+
+def test_plan_batches_of_nothing():
+    assert plan_batches([]) == []
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from src.evaluation import Qrels, evaluate
+
+
+def write(tmp_path, name, lines):
+    path = tmp_path / name
+    path.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def test_trec_qrels_mixed_relevance(tmp_path):
+    path = write(tmp_path, "qrels.tsv", [
+        "1 0 doc5 0",
+        "1 0 doc7 1",
+        "1 0 doc9 2",
+        "2 0 doc5 0",
+        "2 0 doc3 1.0",
+        "3 0 doc1 0.0",
+    ])
+    qrels = Qrels.from_file(path)
+    # relevance 0 judgements add nothing, in particular no document "0"
+    assert "0" not in qrels.doc_index
+    assert set(qrels.doc_index) == {"doc7", "doc9", "doc3"}
+    assert qrels.num_relevant[qrels.query_index["1"]] == 2
+    assert qrels.num_relevant[qrels.query_index["2"]] == 1
+    assert "3" not in qrels.query_index
+
+    results = evaluate(qrels, ["1", "2"], [["doc7", "doc5"], ["doc5", "doc3"]], ks=(2,))
+    assert results["recall@2"] == pytest.approx(0.75)
+
+
+def test_cisi_qrels(tmp_path):
+    path = write(tmp_path, "CISI.REL", [
+        "     1    28\t0\t0.000000",
+        "     1    35\t0\t0.000000",
+        "     2    29\t0\t0.000000",
+    ])
+    qrels = Qrels.from_file(path)
+    assert set(qrels.doc_index) == {"28", "35", "29"}
+    assert qrels.num_relevant.tolist() == [2, 1]
+
+
+def test_unjudged_documents_take_a_rank():
+    qrels = Qrels.from_mapping({"q": ["a"]})
+    results = evaluate(qrels, ["q"], [["x", "a"]], ks=(1, 2))
+    assert results["recall@1"] == 0.0
+    assert results["recall@2"] == 1.0
+    assert np.isclose(results["mrr"], 0.5)
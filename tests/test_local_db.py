@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from src.document import DocumentBatch
+from src.local_db import LocalDB
+
+
+class WordEmbedder():
+    """Deterministic embedder: one component per vocabulary word, matryoshka-style prefixes for smaller dims"""
+    VOCABULARY: list[str] = ["apple", "banana", "cherry", "date"]
+
+    def __init__(self, dim: int = 4) -> None:
+        self.model_name = "words"
+        self.dim = dim
+        self.metric = "cosine"
+
+    def with_dim(self, dim: int) -> "WordEmbedder":
+        return WordEmbedder(dim)
+
+    def _full(self, texts: list[str]) -> np.ndarray:
+        vectors = np.array([[text.count(word) + 0.1 * i for i, word in enumerate(self.VOCABULARY)] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        return self.embed_dims(texts, [self.dim])[self.dim]
+
+    def embed_dims(self, texts: list[str], dims: list[int]) -> dict[int, np.ndarray]:
+        full = self._full(texts)
+        return {dim: full[:, :dim] / np.linalg.norm(full[:, :dim], axis=1, keepdims=True) for dim in dims}
+
+
+class Store():
+    """Minimal local text store: batch(ids) like ChunkSet"""
+    def __init__(self, texts: dict[str, str]) -> None:
+        self.texts = texts
+
+    def batch(self, ids: list[str]) -> DocumentBatch:
+        return DocumentBatch.from_columns(ids, (id.split("-")[0] for id in ids), (self.texts[id] for id in ids))
+
+
+TEXTS: dict[str, str] = {"1-0": "apple apple", "1-1": "banana", "2-0": "cherry cherry", "3-0": "date"}
+
+
+def batch() -> DocumentBatch:
+    return DocumentBatch.from_columns(list(TEXTS), (id.split("-")[0] for id in TEXTS), TEXTS.values())
+
+
+def test_include_text_false_needs_a_store():
+    db, embedder = LocalDB(), WordEmbedder()
+    db.upsert_batch("index", "ns", embedder, batch(), include_text=False)
+    assert db.indexes["index"].namespace("ns").metadata[0] == {"source": "1"}
+    with pytest.raises(ValueError):
+        db.query_batch("index", "ns", ["apple"], embedder, top_k=1)
+    results = db.query_batch("index", "ns", ["apple", "cherry"], embedder, top_k=1, store=Store(TEXTS))
+    assert [result.ids for result in results] == [["1-0"], ["2-0"]]
+    assert results[1].texts() == ["cherry cherry"]
+
+
+def test_query_ids_matches_query_batch():
+    db, embedder = LocalDB(), WordEmbedder()
+    db.upsert_batch("index", "ns", embedder, batch())
+    ids, scores = db.query_ids("index", "ns", ["banana", "date"], embedder, top_k=10)
+    assert ids == [result.ids for result in db.query_batch("index", "ns", ["banana", "date"], embedder, top_k=10)]
+    assert ids[0][0] == "1-1" and ids[1][0] == "3-0"
+    assert [len(row) for row in scores] == [4, 4]
+    assert np.all(np.diff(scores[0]) <= 0)
+
+
+def test_query_namespaces_truncates_per_dim():
+    db, embedder = LocalDB(), WordEmbedder()
+    for dim in (2, 4):
+        db.upsert_batch(f"index-{dim}", f"recursive-100-{dim}", embedder.with_dim(dim), batch())
+    targets = {"recursive-100-2": "index-2", "recursive-100-4": "index-4"}
+    results = db.query_namespaces(targets, ["cherry", "apple"], embedder, top_k=2)
+    for namespace, index_name in targets.items():
+        dim = int(namespace.rsplit("-", 1)[1])
+        assert results[namespace][0] == db.query_ids(index_name, namespace, ["cherry", "apple"], embedder.with_dim(dim), top_k=2)[0]
+    assert results["recursive-100-4"][0][0][0] == "2-0"
+    with pytest.raises(ValueError):
+        db.query_namespaces({"recursive-100": "index-4"}, ["apple"], embedder)
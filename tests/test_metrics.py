@@ -0,0 +1,81 @@
+import threading
+import pytest
+from src.metrics import NULL_METRICS, Histogram, Metrics
+
+
+def test_counters_are_keyed_by_tags():
+    metrics = Metrics()
+    metrics.count("requests", model="a")
+    metrics.count("requests", 2, model="a")
+    metrics.count("requests", model="b")
+    assert metrics.total("requests") == 4
+    assert metrics.total("requests", model="a") == 3
+    assert metrics.total("requests", model="c") == 0
+    assert len(metrics.counters) == 2
+
+
+def test_spans_tag_what_is_recorded_inside_them():
+    metrics = Metrics()
+    with metrics.span("embed", dataset="cisi"):
+        with metrics.span("batch", dim=256):
+            metrics.count("tokens", 10)
+        metrics.count("tokens", 5)
+    metrics.count("tokens", 1)
+    assert metrics.total("tokens", dataset="cisi", dim=256) == 10
+    assert metrics.total("tokens", dataset="cisi") == 15
+    assert metrics.total("tokens") == 16
+    assert [span["name"] for span in metrics.spans] == ["batch", "embed"]
+    assert metrics.spans[0]["tags"] == {"dataset": "cisi", "dim": 256}
+    assert metrics.context() == {}
+
+
+def test_span_records_errors():
+    metrics = Metrics()
+    with pytest.raises(KeyError):
+        with metrics.span("upsert"):
+            raise KeyError("id")
+    assert metrics.spans[0]["error"] == "KeyError"
+    assert metrics.snapshot()["histograms"][0]["count"] == 1
+
+
+def test_span_tags_are_per_thread():
+    metrics = Metrics()
+
+    def work():
+        metrics.count("vectors", 1)
+
+    with metrics.span("upsert", index="a"):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    assert metrics.total("vectors") == 1
+    assert metrics.total("vectors", index="a") == 0
+
+
+def test_spans_over_the_limit_are_dropped():
+    metrics = Metrics(max_spans=2)
+    for _ in range(3):
+        with metrics.span("query"):
+            pass
+    assert len(metrics.spans) == 2 and metrics.dropped_spans == 1
+
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.add(value)
+    summary = histogram.to_dict()
+    assert (summary["count"], summary["min"], summary["max"], summary["mean"]) == (100, 1, 100, 50.5)
+    # within a factor of 2 of the exact quantile
+    assert 50 <= summary["p50"] <= 100
+    assert summary["p99"] == 100
+
+
+def test_null_metrics_records_nothing():
+    NULL_METRICS.count("requests")
+    NULL_METRICS.observe("seconds", 1.0)
+    with NULL_METRICS.timer("seconds"), NULL_METRICS.span("embed", dataset="cisi"):
+        NULL_METRICS.count("tokens", 10)
+    assert not NULL_METRICS.counters and not NULL_METRICS.histograms and not NULL_METRICS.spans
+    assert NULL_METRICS.context() == {}
+    assert NULL_METRICS.export() is None
@@ -0,0 +1,107 @@
+import os
+import shutil
+import pytest
+from preprocessors.ms_marco import MSMarcoPreprocessor, parse_line, write_shards
+from src.io import load_json
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "ms_marco", "raw")
+PASSAGES = {
+    "0": "The presence of communication amid scientific minds was equally important.",
+    "1": "The Manhattan Project and its atomic bomb helped bring an end to World War II.",
+    "2": "Essay on the Manhattan Project - the success of the project.",
+    "3": "The pilot program started in 1942, with uranium enrichment at Oak Ridge.",
+    "4": "Versions of each of the bombs were tested before use.",
+    "5": "General Leslie Groves led the project from the War Department.",
+    "6": "Café culture and résumé text with accents.",
+}
+QUERIES = {
+    "100": "what was the manhattan project",
+    "101": "who led the manhattan project",
+    "102": "where was uranium enriched",
+}
+# the judgement of 4 for 102 has relevance 0
+QRELS = [("100", "1"), ("100", "2"), ("101", "5"), ("102", "3")]
+
+
+@pytest.fixture(params=[None, 2], ids=["serial", "process_pool"])
+def preprocessor(request, tmp_path):
+    raw_dir = tmp_path / "raw"
+    shutil.copytree(FIXTURE_DIR, raw_dir)
+    preprocessor = MSMarcoPreprocessor({
+        "raw_dir": str(raw_dir),
+        "processed_dir": str(tmp_path / "processed"),
+        "shard_size": 3,
+        "max_workers": request.param,
+    })
+    preprocessor.process()
+    return preprocessor
+
+
+def test_shards(preprocessor):
+    # 7 passages in shards of at most 3
+    assert preprocessor.shards("documents") == ["documents-00000", "documents-00001", "documents-00002"]
+    sizes = [sum(1 for _ in open(os.path.join(preprocessor.processed_dir, f"{shard}.jsonl"), encoding="utf-8")) for shard in preprocessor.shards("documents")]
+    assert sizes == [3, 3, 1]
+    assert preprocessor.shards("queries") == ["queries-00000"]
+    assert preprocessor.shards("qrels") == ["qrels-00000", "qrels-00001"]
+
+
+def test_manifest(preprocessor):
+    assert preprocessor.is_processed()
+    assert load_json("manifest", preprocessor.processed_dir) == {
+        "split": "dev.small", "shard_size": 3, "documents": 7, "queries": 3, "qrels": 4
+    }
+
+
+def test_documents_round_trip(preprocessor):
+    documents = list(preprocessor.iter_documents())
+    assert {document["id"]: document["metadata"]["text"] for document in documents} == PASSAGES
+    assert all(document["metadata"]["source"] == "collection.tsv" for document in documents)
+    assert [document["id"] for document in documents] == list(PASSAGES.keys())
+
+
+def test_queries_round_trip(preprocessor):
+    assert {query["id"]: query["query"] for query in preprocessor.iter_queries()} == QUERIES
+
+
+def test_relevance(preprocessor):
+    assert list(preprocessor.iter_relevance()) == QRELS
+    assert preprocessor.relevance == {"100": ["1", "2"], "101": ["5"], "102": ["3"]}
+
+
+def test_get_documents(preprocessor):
+    ids = ["6", "0", "missing", "3"]
+    documents = preprocessor.get_documents(ids)
+    assert documents[2] is None
+    assert [document["metadata"]["text"] for document in documents if document is not None] == [PASSAGES["6"], PASSAGES["0"], PASSAGES["3"]]
+    assert preprocessor.get_document("5")["metadata"]["text"] == PASSAGES["5"]
+    batch = preprocessor.batch(["2", "4"])
+    assert batch.texts() == [PASSAGES["2"], PASSAGES["4"]]
+
+
+def test_reprocess_removes_stale_shards(preprocessor):
+    preprocessor.shard_size = 10
+    preprocessor.process()
+    assert preprocessor.shards("documents") == ["documents-00000"]
+    assert len(preprocessor.read_documents()) == 7
+
+
+def test_missing_raw_file(tmp_path):
+    preprocessor = MSMarcoPreprocessor({"raw_dir": str(tmp_path), "processed_dir": str(tmp_path / "processed")})
+    with pytest.raises(ValueError):
+        preprocessor.process()
+
+
+def test_parse_line():
+    assert parse_line("qrels", "1\t0\t7\t1", "qrels.tsv") == {"query_id": "1", "doc_id": "7"}
+    assert parse_line("qrels", "1\t0\t7\t0", "qrels.tsv") is None
+    assert parse_line("qrels", "1 7", "qrels.tsv") == {"query_id": "1", "doc_id": "7"}
+    assert parse_line("documents", "no tab here", "collection.tsv") is None
+    assert parse_line("queries", "5\ttext\twith tab", "queries.tsv") == {"id": "5", "query": "text\twith tab"}
+
+
+def test_write_shards_limits(tmp_path):
+    count = write_shards("documents", os.path.join(FIXTURE_DIR, "collection.tsv"), str(tmp_path), shard_size=1)
+    assert count == 7
+    assert len(os.listdir(tmp_path)) == 7
@@ -0,0 +1,132 @@
+import json
+import numpy as np
+import pytest
+
+pytest.importorskip("pinecone")
+
+from bench.fakes import FakePinecone
+from src.cache import QueryCache
+from src.db import MAX_UPSERT_BYTES, MAX_UPSERT_VECTORS, PineconeDB
+from src.document import DocumentBatch
+from tests.test_local_db import TEXTS, Store, WordEmbedder, batch
+
+
+def recording_client(embedder: WordEmbedder) -> tuple[FakePinecone, list[list[dict]]]:
+    """FakePinecone with an existing index whose upsert requests are recorded"""
+    client = FakePinecone()
+    client.create_index("index", embedder.dim, embedder.metric)
+    index = client.Index("index")
+    requests = []
+    upsert = index.upsert
+
+    def record(vectors, namespace=""):
+        requests.append(vectors)
+        return upsert(vectors, namespace)
+
+    index.upsert = record
+    return client, requests
+
+
+def payload_bytes(vectors: list[dict]) -> int:
+    return len(json.dumps({"vectors": vectors, "namespace": "ns"}))
+
+
+def test_upsert_bulk_splits_by_vector_count():
+    embedder = WordEmbedder()
+    client, requests = recording_client(embedder)
+    n = 2 * MAX_UPSERT_VECTORS + 500
+    batch = DocumentBatch.from_columns([str(i) for i in range(n)], ["source"] * n, ["apple"] * n)
+    stats = PineconeDB(client).upsert_bulk("index", "ns", embedder, batch, np.random.rand(n, embedder.dim))
+    assert stats["vectors"] == n and stats["batches"] == len(requests) == 3
+    assert max(len(request) for request in requests) <= MAX_UPSERT_VECTORS
+    assert sorted(record["id"] for request in requests for record in request) == sorted(batch.ids)
+    assert len(client.Index("index").namespaces["ns"]) == n
+
+
+def test_upsert_bulk_splits_by_payload_size():
+    embedder = WordEmbedder()
+    client, requests = recording_client(embedder)
+    n = 600
+    texts = [f"{i} " + "banana " * 1500 for i in range(n)]
+    batch = DocumentBatch.from_columns([str(i) for i in range(n)], ["source"] * n, texts)
+    stats = PineconeDB(client).upsert_bulk("index", "ns", embedder, batch, np.random.rand(n, embedder.dim), max_workers=4)
+    assert n * len(texts[0]) > 2 * MAX_UPSERT_BYTES
+    assert stats["batches"] == len(requests) >= 3
+    assert all(len(request) <= MAX_UPSERT_VECTORS and payload_bytes(request) <= MAX_UPSERT_BYTES for request in requests)
+    assert sum(len(request) for request in requests) == n
+
+
+def test_namespace_written_before_stats_catch_up_is_valid():
+    embedder = WordEmbedder()
+    client = FakePinecone()
+    client.create_index("index", embedder.dim, embedder.metric)
+    index = client.Index("index")
+    # the stats never see the writes
+    index.describe_index_stats = lambda **kwargs: {"dimension": embedder.dim, "namespaces": {}, "total_vector_count": 0}
+    db = PineconeDB(client)
+    db.upsert_batch("index", "ns", embedder, batch())
+    assert db.validate("index", "ns", embedder) is index
+    ids, _ = db.query_ids("index", "ns", ["cherry"], embedder, top_k=1)
+    assert ids == [["2-0"]]
+    db.delete_namespace("index", "ns")
+    with pytest.raises(ValueError):
+        db.validate("index", "ns", embedder)
+
+
+def test_query_ids_matches_query_batch_and_is_cached_until_a_write():
+    embedder = WordEmbedder()
+    client = FakePinecone()
+    db = PineconeDB(client, query_cache=QueryCache(None, settle_seconds=0))
+    db.upsert_batch("index", "ns", embedder, batch())
+    queries = ["apple", "cherry", "apple"]
+    ids, scores = db.query_ids("index", "ns", queries, embedder, top_k=2)
+    assert ids == [result.ids for result in db.query_batch("index", "ns", queries, embedder, top_k=2)]
+    assert ids[0][0] == "1-0" and ids[1][0] == "2-0" and ids[0] == ids[2]
+    assert scores[0].dtype == np.float32 and scores[0][0] >= scores[0][1]
+
+    requests = client.requests
+    assert db.query_ids("index", "ns", queries, embedder, top_k=2)[0] == ids
+    assert client.requests == requests
+
+    # an upsert through the db invalidates the cached results of its namespace
+    db.upsert_batch("index", "ns", embedder, DocumentBatch.from_columns(["4-0"], ["4"], ["apple"]))
+    assert db.query_ids("index", "ns", queries, embedder, top_k=2)[0][0] == ["4-0", "1-0"]
+
+
+def test_query_namespaces_matches_query_ids_with_one_embedding_pass():
+    client = FakePinecone()
+    db = PineconeDB(client)
+    targets = {"recursive-100-2": "index-2", "recursive-100-4": "index-4"}
+    for namespace, index_name in targets.items():
+        db.upsert_batch(index_name, namespace, WordEmbedder(int(namespace.rsplit("-", 1)[1])), batch())
+
+    embedder = WordEmbedder()
+    calls = []
+    embed_dims = embedder.embed_dims
+    embedder.embed_dims = lambda texts, dims: calls.append(dims) or embed_dims(texts, dims)
+    queries = ["apple", "date"]
+    results = db.query_namespaces(targets, queries, embedder, top_k=2)
+    assert calls == [[2, 4]]
+    for namespace, index_name in targets.items():
+        ids, scores = db.query_ids(index_name, namespace, queries, embedder.with_dim(int(namespace.rsplit("-", 1)[1])), top_k=2)
+        assert results[namespace][0] == ids
+        assert all(np.allclose(a, b) for a, b in zip(results[namespace][1], scores))
+
+
+def test_query_namespaces_rejects_namespaces_without_a_dim():
+    db = PineconeDB(FakePinecone())
+    with pytest.raises(ValueError):
+        db.query_namespaces({"recursive": "index"}, ["apple"], WordEmbedder())
+
+
+def test_ids_only_upsert_is_hydrated_from_a_store():
+    embedder = WordEmbedder()
+    client, requests = recording_client(embedder)
+    db = PineconeDB(client)
+    db.upsert_batch("index", "ns", embedder, batch(), include_text=False)
+    assert all(record["metadata"] == {"source": record["id"].split("-")[0]} for request in requests for record in request)
+    with pytest.raises(ValueError):
+        db.query_batch("index", "ns", ["apple"], embedder, top_k=1)
+    results = db.query_batch("index", "ns", ["apple", "cherry"], embedder, top_k=1, store=Store(TEXTS))
+    assert [result.ids for result in results] == [["1-0"], ["2-0"]]
+    assert results[1].texts() == ["cherry cherry"] and results[1].source(0) == "2"
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+from src.document import Document
+from src.local_db import LocalDB
+from src.pipeline import Checkpoint, Pipeline
+from tests.test_local_db import WordEmbedder
+
+
+class Chunk():
+    def __init__(self, page_content: str) -> None:
+        self.page_content = page_content
+
+
+class WordChunker():
+    """One chunk per word"""
+    def split(self, text: str) -> list[Chunk]:
+        return [Chunk(word) for word in text.split()]
+
+
+class FailingDB(LocalDB):
+    """Fails on the upsert after `batches` successful ones"""
+    def __init__(self, batches: int) -> None:
+        super().__init__()
+        self.batches = batches
+
+    def upsert_batch(self, *args, **kwargs) -> None:
+        if self.batches == 0:
+            raise RuntimeError("upsert failed")
+        self.batches -= 1
+        super().upsert_batch(*args, **kwargs)
+
+
+DOCS: list[Document] = [Document(source=f"s{i}", text=" ".join(["apple", "banana", "cherry"][:i % 3 + 1]), id=str(i)) for i in range(20)]
+
+
+def test_pipeline_resumes_from_its_checkpoint(tmp_path):
+    db, embedder = FailingDB(3), WordEmbedder()
+    pipeline = Pipeline(WordChunker(), embedder, db, "index", "ns", checkpoint_dir=str(tmp_path), batch_size=4, queue_size=2)
+    with pytest.raises(RuntimeError):
+        pipeline.run(iter(DOCS))
+    completed = Checkpoint(str(tmp_path / "index" / "ns.txt")).completed
+    assert 0 < len(completed) < len(DOCS)
+    # every checkpointed document has all of its chunks upserted
+    stored = set(db.indexes["index"].namespace("ns").ids)
+    for doc in DOCS:
+        if doc.id in completed:
+            assert {f"{doc.id}-{i}" for i in range(len(doc.text.split()))} <= stored
+
+    db.batches = 100
+    pipeline = Pipeline(WordChunker(), embedder, db, "index", "ns", checkpoint_dir=str(tmp_path), batch_size=4, queue_size=2)
+    stats = pipeline.run(iter(DOCS))
+    assert stats["skipped"] == len(completed) and stats["documents"] == len(DOCS) - len(completed)
+    assert len(pipeline.checkpoint) == len(DOCS)
+    assert len(db.indexes["index"].namespace("ns")) == sum(len(doc.text.split()) for doc in DOCS)
+
+    # nothing left to do
+    stats = Pipeline(WordChunker(), embedder, db, "index", "ns", checkpoint_dir=str(tmp_path)).run(iter(DOCS))
+    assert stats["skipped"] == len(DOCS) and stats["chunks"] == 0
@@ -0,0 +1,78 @@
+import copy
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+from openai import OpenAI
+from bench.fakes import FakeEmbeddingServer
+from src.local_db import LocalDB
+from src.planner import Planner
+from tests.test_chunker import needs_encoding
+
+
+CONFIG: dict = {
+    "dataset_name": "test",
+    "embedding": {"model_name": "text-embedding-3-small", "batch_size": 16},
+    "chunking": {
+        "strategies": ["recursive"],
+        "length_function": "char",
+        "min_chunk_size": 100,
+        "max_chunk_size": 200,
+        "chunk_size_step": 100,
+        "chunk_overlap": 20,
+    },
+    "dimensions": {"min": 64, "max": 128, "step": 64},
+    "max_workers": 2,
+}
+DOC_IDS: list[str] = [str(i) for i in range(12)]
+TEXTS: list[str] = [f"document {i} sentence {i % 3}. " * 8 for i in range(12)]
+
+
+def planner(config: dict, db: LocalDB, data_dir: str, client: OpenAI = None) -> Planner:
+    client = client if client is not None else OpenAI(base_url="http://127.0.0.1:9/v1", api_key="fake")
+    return Planner(config, client, db, DOC_IDS, TEXTS, data_dir=data_dir)
+
+
+def test_plan_of_an_empty_workspace(tmp_path):
+    plan = planner(CONFIG, LocalDB(), str(tmp_path)).plan()
+    assert len(plan.missing) == 4 and not (plan.upserted or plan.embedded or plan.chunked)
+    # one segmentation pass for both sizes, one embed job per size for both dims
+    assert [job.name for job in plan.jobs] == [
+        "chunk:recursive-100,200",
+        "embed:recursive-100", "embed:recursive-200",
+        "upsert:recursive-100-64", "upsert:recursive-100-128", "upsert:recursive-200-64", "upsert:recursive-200-128",
+    ]
+
+
+@needs_encoding
+def test_rerun_only_does_the_new_work(tmp_path):
+    db = LocalDB()
+    config = copy.deepcopy(CONFIG)
+    with FakeEmbeddingServer() as server:
+        client = OpenAI(base_url=server.url, api_key="fake")
+        planner(config, db, str(tmp_path), client).run()
+        assert sorted(db.list_namespaces("test-64")) == ["recursive-100-64", "recursive-200-64"]
+        requests = server.requests
+        assert requests > 0
+
+        # nothing left to do
+        plan = planner(config, db, str(tmp_path), client).plan()
+        assert len(plan.upserted) == 4 and not plan.jobs
+
+        # a narrower dim is truncated from the stored 128 dim vectors without calling the API
+        config["dimensions"]["step"] = 32
+        plan = planner(config, db, str(tmp_path), client).run()
+        assert sorted(plan.chunked) == ["recursive-100-96", "recursive-200-96"]
+        assert not any(job.name.startswith("chunk:") for job in plan.jobs)
+        assert server.requests == requests
+
+        # a namespace missing from the index is only upserted again
+        db.delete_namespace("test-64", "recursive-100-64")
+        plan = planner(config, db, str(tmp_path), client).plan()
+        assert plan.embedded == ["recursive-100-64"] and [job.name for job in plan.jobs] == ["upsert:recursive-100-64"]
+
+        # a changed document rebuilds the chunk sets of namespaces that are not upserted
+        db.delete_namespace("test-128", "recursive-200-128")
+        texts = TEXTS[:-1] + ["changed"]
+        plan = Planner(config, client, db, DOC_IDS, texts, data_dir=str(tmp_path)).plan()
+        assert sorted(plan.missing) == ["recursive-100-64", "recursive-200-128"]
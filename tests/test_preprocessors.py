@@ -0,0 +1,53 @@
+import json
+import os
+import random
+import numpy as np
+import pytest
+from preprocessors.base import DataPreprocessor
+
+
+class ShardedPreprocessor(DataPreprocessor):
+    """Writes documents with the given ids into shards of shard_size lines"""
+    def __init__(self, processed_dir: str, ids: list[str], shard_size: int) -> None:
+        super().__init__({"dataset_name": "sharded", "processed_dir": processed_dir})
+        self.ids = ids
+        self.shard_size = shard_size
+
+    def process(self) -> dict[str, int]:
+        os.makedirs(self.processed_dir, exist_ok=True)
+        for number, start in enumerate(range(0, len(self.ids), self.shard_size)):
+            with open(os.path.join(self.processed_dir, f"documents-{number:05d}.jsonl"), "w", encoding="utf-8") as file:
+                for id in self.ids[start:start + self.shard_size]:
+                    file.write(json.dumps({"id": id, "values": None, "metadata": {"source": "s", "text": f"text of {id}"}}) + "\n")
+        for name in ("queries", "qrels"):
+            open(os.path.join(self.processed_dir, f"{name}.jsonl"), "w").close()
+        return {"documents": len(self.ids)}
+
+
+def test_build_index_merges_sorted_shards(tmp_path):
+    rng = random.Random(0)
+    ids = [str(rng.randint(0, 10 ** rng.randint(1, 8))) for _ in range(500)] + ["é-ü", "10"]
+    preprocessor = ShardedPreprocessor(str(tmp_path), ids, shard_size=37)
+    preprocessor.process()
+    preprocessor.build_index(block_size=16)
+
+    index_dir = tmp_path / "index"
+    sorted_ids = np.load(index_dir / "documents_ids.npy")
+    order = np.argsort(np.array(ids, dtype=str), kind="stable")
+    assert sorted_ids.tolist() == [ids[i] for i in order.tolist()]
+    assert np.load(index_dir / "documents_shards.npy").tolist() == (order // 37).tolist()
+    assert not (index_dir / "documents.tmp").exists()
+
+    documents = preprocessor.get_documents(ids[:50] + ["missing"])
+    assert [document["id"] for document in documents[:50]] == ids[:50] and documents[50] is None
+
+
+def test_build_index_of_no_documents(tmp_path):
+    preprocessor = ShardedPreprocessor(str(tmp_path), [], shard_size=10)
+    preprocessor.process()
+    assert preprocessor.get_documents(["1"]) == [None]
+
+
+def test_process_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        DataPreprocessor({"dataset_name": "abstract", "processed_dir": str(tmp_path)})
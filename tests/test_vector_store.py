@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from src.vector_store import EmbeddingStore
+
+
+def test_write_round_trip(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    embeddings = np.arange(12, dtype=np.float32).reshape(3, 4)
+    stored = store.write("ns", ["a", "b", "c"], embeddings)
+    assert stored.ids == ["a", "b", "c"]
+    assert np.array_equal(stored.matrix(), embeddings)
+    assert store.namespaces() == ["ns"]
+
+
+def test_writer_aborts_on_error(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with store.writer("ns", 4) as writer:
+            writer.append(["a"], np.ones((1, 4)))
+            raise RuntimeError("embedding failed")
+    assert writer.vectors.closed
+    assert not store.exists("ns")
+    assert store.namespaces() == []
+
+
+def test_write_failure_replaces_previous_namespace(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.write("ns", ["a"], np.ones((1, 4)))
+    with pytest.raises(ValueError):
+        # wrong shape: the old contents are gone, the partial ones are not marked complete
+        store.write("ns", ["a", "b"], np.ones((1, 4)))
+    assert not store.exists("ns")
+
+
+def test_source_recorded_in_meta(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    source = {"source_hash": "abc", "params": {"strategy": "recursive", "chunk_overlap": 50}}
+    assert store.write("ns", ["a"], np.ones((1, 4)), source=source).source == source
+    # namespaces written without one record None
+    assert store.write("other", ["a"], np.ones((1, 4))).source is None